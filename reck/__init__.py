@@ -1,5 +1,19 @@
+from .reck import recktype, get_rectype, DefaultFactory
+from .aggregate import RecordCollection
+from .batch import ColumnBatch
+from .buffer import AppendBuffer
+from .dedup import dedup
+from .diff import diff
+from .extsort import sort
+from .instrumentation import instrument, stats
+from .parallel import parse_parallel
+from .pipeline import pipeline
+from .recordlog import RecordLog
+from .store import RecordStore
+from .table import RecordTable
+from .window import window
 
-
-from .reck import recktype, DefaultFactory
-
-__all__ = ['recktype', 'DefaultFactory']
+__all__ = ['recktype', 'get_rectype', 'DefaultFactory', 'sort', 'RecordLog',
+           'instrument', 'stats', 'pipeline', 'ColumnBatch', 'parse_parallel',
+           'RecordStore', 'RecordCollection', 'window', 'diff', 'dedup',
+           'RecordTable', 'AppendBuffer']
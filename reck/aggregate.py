@@ -0,0 +1,547 @@
+"""
+This module implements RecordCollection, a collection of mutable records
+with live aggregates (counts, sums, means, minimums, maximums and group
+totals) that are kept up to date as records are added, removed or changed.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import functools
+import heapq
+import threading
+import weakref
+
+from .extsort import _ReversedKey
+
+_lock = threading.Lock()
+# For each observed record type, a dict mapping the id() of every record in
+# a RecordCollection to a WeakSet of the collections holding it. Records are
+# not hashable and cannot be weakly referenced, so they are keyed by id();
+# the collections hold a reference to each record, so ids cannot be reused
+# while a collection holding the record is alive.
+_observed = weakref.WeakKeyDictionary()
+# Weak references to live collections, whose callbacks queue the record ids
+# of collected collections in _stale. The ids are removed from _observed by
+# the next add() or remove(), since a callback run by the garbage collector
+# must not take _lock.
+_collection_refs = set()
+_stale = []
+
+
+class RecordCollection(object):
+    """
+    A collection of records of one record type, with live aggregates over
+    their field values.
+
+    Aggregates are created with the ``count()``, ``sum()``, ``mean()``,
+    ``min()``, ``max()``, ``group_sum()`` and ``group_count()`` methods.
+    Each aggregate is updated incrementally when a record is added to or
+    removed from the collection, or when a field of a record in the
+    collection is changed by attribute assignment, index assignment or
+    ``_update()``. Updates take O(1) time, or amortised O(log n) time for
+    ``min()`` and ``max()``, so reading an aggregate never needs a pass over
+    the records.
+
+    Example::
+
+        >>> from reck import RecordCollection
+        >>> Order = recktype('Order', 'id region amount')
+        >>> orders = RecordCollection(Order)
+        >>> total = orders.sum('amount')
+        >>> by_region = orders.group_sum('region', 'amount')
+        >>> orders.extend([Order(1, 'eu', 10), Order(2, 'us', 5)])
+        >>> order = Order(3, 'eu', 7)
+        >>> orders.add(order)
+        >>> order.amount = 20
+        >>> total.value, by_region.value
+        (35, {'eu': 30, 'us': 5})
+
+    Changes are observed by replacing the field attributes of the record type
+    with properties the first time a collection of the type is created. From
+    then on, assigning a field of any record of the type costs one extra dict
+    lookup, and reading a field goes through a property rather than a slot.
+    Values restored by ``__setstate__()`` or ``_make(values, convert=False)``
+    are not observed, since they are only used to fill new records. A
+    collection only holds weak references to itself in these observers, so
+    a collection that is no longer referenced is garbage collected and stops
+    observing its records.
+
+    Sums and means ignore ``None`` values, and ``min()`` and ``max()``
+    ignore ``None`` values and require the other values to be hashable.
+    Floating-point sums are updated by adding and subtracting values, so
+    they can accumulate rounding errors over many updates.
+
+    :param rectype: The record type of the records in the collection.
+    :param records: An optional iterable of records to add.
+    """
+    def __init__(self, rectype, records=()):
+        self.rectype = rectype
+        self._records = {}
+        self._aggregates = []
+        self._field_aggregates = {}
+        self._observers = _observe(rectype)
+        _collection_refs.add(weakref.ref(
+            self, functools.partial(_collection_collected, self._observers,
+                                    self._records)))
+        self.extend(records)
+
+    # --------------------------------------------------------------------------
+    # Records
+
+    def add(self, rec):
+        """
+        Add the record *rec* to the collection.
+
+        :raises TypeError: if *rec* is not a record of the collection's type.
+        :raises ValueError: if *rec* is already in the collection.
+        """
+        if not isinstance(rec, self.rectype):
+            raise TypeError('expected a {0} record, not {1!r}'
+                            .format(self.rectype.__name__, rec))
+        key = id(rec)
+        if key in self._records:
+            raise ValueError('record is already in the collection')
+        # Read every field first, so that a lazy record decodes its fields
+        # before changes to them are observed.
+        rec._values_getter(rec)
+        self._records[key] = rec
+        with _lock:
+            _purge_stale()
+            collections = self._observers.get(key)
+            if collections is None:
+                collections = self._observers[key] = weakref.WeakSet()
+            collections.add(self)
+        for aggregate in self._aggregates:
+            aggregate._add(rec)
+
+    def extend(self, records):
+        """
+        Add every record in the iterable *records* to the collection.
+        """
+        for rec in records:
+            self.add(rec)
+
+    def remove(self, rec):
+        """
+        Remove the record *rec* from the collection.
+
+        :raises ValueError: if *rec* is not in the collection.
+        """
+        key = id(rec)
+        if self._records.get(key) is not rec:
+            raise ValueError('record is not in the collection')
+        for aggregate in self._aggregates:
+            aggregate._remove(rec)
+        del self._records[key]
+        with _lock:
+            _purge_stale()
+            collections = self._observers[key]
+            collections.discard(self)
+            if not collections:
+                del self._observers[key]
+
+    def discard(self, rec):
+        """
+        Remove the record *rec* from the collection if it is present.
+        """
+        if self._records.get(id(rec)) is rec:
+            self.remove(rec)
+
+    def clear(self):
+        """
+        Remove every record from the collection.
+        """
+        for rec in list(self._records.values()):
+            self.remove(rec)
+
+    def __contains__(self, rec):
+        return self._records.get(id(rec)) is rec
+
+    def __iter__(self):
+        return iter(list(self._records.values()))
+
+    def __len__(self):
+        return len(self._records)
+
+    def __repr__(self):
+        return '<RecordCollection of {0} {1} records>'.format(
+            len(self._records), self.rectype.__name__)
+
+    # --------------------------------------------------------------------------
+    # Aggregates
+
+    def count(self):
+        """
+        Return a live ``Count`` of the records in the collection.
+        """
+        return self._register(Count())
+
+    def sum(self, fieldname):
+        """
+        Return a live ``Sum`` of the values of the field *fieldname*.
+        """
+        return self._register(Sum(self._check_field(fieldname)))
+
+    def mean(self, fieldname):
+        """
+        Return a live ``Mean`` of the values of the field *fieldname*.
+        """
+        return self._register(Mean(self._check_field(fieldname)))
+
+    def min(self, fieldname):
+        """
+        Return a live ``Min`` of the values of the field *fieldname*.
+        """
+        return self._register(Min(self._check_field(fieldname)))
+
+    def max(self, fieldname):
+        """
+        Return a live ``Max`` of the values of the field *fieldname*.
+        """
+        return self._register(Max(self._check_field(fieldname)))
+
+    def group_sum(self, key_fieldname, fieldname):
+        """
+        Return live ``GroupTotals`` of the sum of the values of the field
+        *fieldname* for each value of the field *key_fieldname*.
+        """
+        return self._register(GroupTotals(
+            self._check_field(key_fieldname), self._check_field(fieldname)))
+
+    def group_count(self, key_fieldname):
+        """
+        Return live ``GroupTotals`` of the number of records with each value
+        of the field *key_fieldname*.
+        """
+        return self._register(
+            GroupTotals(self._check_field(key_fieldname)))
+
+    def _register(self, aggregate):
+        for rec in self._records.values():
+            aggregate._add(rec)
+        self._aggregates.append(aggregate)
+        for fieldname in aggregate.fieldnames:
+            self._field_aggregates.setdefault(fieldname, []).append(
+                aggregate)
+        return aggregate
+
+    def _check_field(self, fieldname):
+        if fieldname not in self.rectype._fieldnames_set:
+            raise ValueError('{0!r} does not match a field'.format(fieldname))
+        return fieldname
+
+    def _field_changed(self, rec, fieldname, old, new):
+        for aggregate in self._field_aggregates.get(fieldname, ()):
+            aggregate._change(rec, fieldname, old, new)
+
+
+class Count(object):
+    """
+    A live count of the records in a ``RecordCollection``. The count is
+    given by ``value``.
+    """
+    fieldnames = ()
+
+    def __init__(self):
+        self.value = 0
+
+    def _add(self, rec):
+        self.value += 1
+
+    def _remove(self, rec):
+        self.value -= 1
+
+    def __repr__(self):
+        return '<Count {0!r}>'.format(self.value)
+
+
+class _FieldAggregate(object):
+    """
+    Base class of aggregates of the values of a single field, which update
+    themselves by removing the old value of a changed field and adding the
+    new one.
+    """
+    def __init__(self, fieldname):
+        self.fieldname = fieldname
+        self.fieldnames = (fieldname,)
+
+    def _add(self, rec):
+        self._add_value(getattr(rec, self.fieldname))
+
+    def _remove(self, rec):
+        self._remove_value(getattr(rec, self.fieldname))
+
+    def _change(self, rec, fieldname, old, new):
+        self._remove_value(old)
+        self._add_value(new)
+
+    def __repr__(self):
+        return '<{0} of {1} {2!r}>'.format(
+            type(self).__name__, self.fieldname, self.value)
+
+
+class Sum(_FieldAggregate):
+    """
+    A live sum of the values of a field of the records in a
+    ``RecordCollection``. The sum is given by ``value`` and the number of
+    values summed by ``n``.
+    """
+    def __init__(self, fieldname):
+        super(Sum, self).__init__(fieldname)
+        self.total = 0
+        self.n = 0
+
+    @property
+    def value(self):
+        return self.total
+
+    def _add_value(self, value):
+        if value is not None:
+            self.total += value
+            self.n += 1
+
+    def _remove_value(self, value):
+        if value is not None:
+            self.total -= value
+            self.n -= 1
+
+
+class Mean(Sum):
+    """
+    A live mean of the values of a field of the records in a
+    ``RecordCollection``. The mean is given by ``value``, which is ``None``
+    if there are no values.
+    """
+    @property
+    def value(self):
+        return self.total / self.n if self.n else None
+
+
+class _Extremum(_FieldAggregate):
+    """
+    Base class of ``Min`` and ``Max``.
+
+    Distinct values are counted in a dict and kept in a heap. Values that
+    are no longer present are only removed from the heap when they reach its
+    top (or the heap is rebuilt because too many stale values have built
+    up), so every update takes amortised O(log n) time.
+    """
+    _wrap = None
+
+    def __init__(self, fieldname):
+        super(_Extremum, self).__init__(fieldname)
+        self._counts = {}
+        self._heap = []
+
+    @property
+    def value(self):
+        heap = self._heap
+        counts = self._counts
+        while heap:
+            top = heap[0] if self._wrap is None else heap[0].key
+            if top in counts:
+                return top
+            heapq.heappop(heap)
+        return None
+
+    def _add_value(self, value):
+        if value is None:
+            return
+        counts = self._counts
+        if value in counts:
+            counts[value] += 1
+            return
+        counts[value] = 1
+        heapq.heappush(
+            self._heap, value if self._wrap is None else self._wrap(value))
+        if len(self._heap) > 2 * len(counts) + 64:
+            self._rebuild()
+
+    def _remove_value(self, value):
+        if value is None:
+            return
+        counts = self._counts
+        if counts[value] == 1:
+            del counts[value]
+        else:
+            counts[value] -= 1
+
+    def _rebuild(self):
+        if self._wrap is None:
+            self._heap = list(self._counts)
+        else:
+            self._heap = list(map(self._wrap, self._counts))
+        heapq.heapify(self._heap)
+
+
+class Min(_Extremum):
+    """
+    A live minimum of the values of a field of the records in a
+    ``RecordCollection``. The minimum is given by ``value``, which is
+    ``None`` if there are no values.
+    """
+
+
+class Max(_Extremum):
+    """
+    A live maximum of the values of a field of the records in a
+    ``RecordCollection``. The maximum is given by ``value``, which is
+    ``None`` if there are no values.
+    """
+    _wrap = _ReversedKey
+
+
+class GroupTotals(object):
+    """
+    Live per-group totals of the records in a ``RecordCollection``, grouped
+    by the value of a key field.
+
+    ``value`` is a dict mapping each key to the sum of the values of the
+    summed field for the records with that key (or to the number of records
+    with that key if no field is summed). ``counts`` maps each key to the
+    number of records with that key. Keys with no records are removed.
+    Totals can also be looked up with ``totals[key]``, which returns 0 for
+    a missing key.
+    """
+    def __init__(self, key_fieldname, fieldname=None):
+        self.key_fieldname = key_fieldname
+        self.fieldname = fieldname
+        if fieldname is None:
+            self.fieldnames = (key_fieldname,)
+        else:
+            self.fieldnames = (key_fieldname, fieldname)
+        self.counts = {}
+        self._sums = {}
+
+    @property
+    def value(self):
+        if self.fieldname is None:
+            return dict(self.counts)
+        return dict(self._sums)
+
+    def __getitem__(self, key):
+        if self.fieldname is None:
+            return self.counts.get(key, 0)
+        return self._sums.get(key, 0)
+
+    def _add(self, rec):
+        self._add_to(getattr(rec, self.key_fieldname), rec)
+
+    def _remove(self, rec):
+        self._remove_from(getattr(rec, self.key_fieldname), rec)
+
+    def _change(self, rec, fieldname, old, new):
+        if fieldname == self.key_fieldname:
+            self._remove_from(old, rec)
+            self._add_to(new, rec)
+        if fieldname == self.fieldname:
+            key = getattr(rec, self.key_fieldname)
+            sums = self._sums
+            if old is not None:
+                sums[key] -= old
+            if new is not None:
+                sums[key] = sums.get(key, 0) + new
+
+    def _add_to(self, key, rec):
+        counts = self.counts
+        counts[key] = counts.get(key, 0) + 1
+        if self.fieldname is not None:
+            value = getattr(rec, self.fieldname)
+            if value is not None:
+                self._sums[key] = self._sums.get(key, 0) + value
+            else:
+                self._sums.setdefault(key, 0)
+
+    def _remove_from(self, key, rec):
+        counts = self.counts
+        if counts[key] == 1:
+            del counts[key]
+            self._sums.pop(key, None)
+            return
+        counts[key] -= 1
+        if self.fieldname is not None:
+            value = getattr(rec, self.fieldname)
+            if value is not None:
+                self._sums[key] -= value
+
+    def __repr__(self):
+        return '<GroupTotals by {0} {1!r}>'.format(
+            self.key_fieldname, self.value)
+
+
+def _observe(rectype):
+    """
+    Return the dict of observed records of *rectype*, replacing its field
+    attributes with observing properties if it is not yet observed.
+
+    The properties are set on the base record type, whose field attributes
+    are inherited by its lazy types, so records of a type and of its lazy
+    types share one dict.
+    """
+    rectype = rectype._base_rectype
+    with _lock:
+        observers = _observed.get(rectype)
+        if observers is None:
+            observers = _observed[rectype] = {}
+            for fieldname, slot in zip(rectype._fieldnames,
+                                       rectype._slot_descriptors):
+                setattr(rectype, fieldname, _make_observing_property(
+                    fieldname, slot, rectype.__dict__[fieldname],
+                    observers))
+            # Index assignment must report changes too
+            rectype._index_setters = tuple(
+                [rectype.__dict__[fieldname].__set__
+                 for fieldname in rectype._fieldnames])
+        return observers
+
+
+def _collection_collected(observers, records, ref):
+    """
+    Queue the ids of the records of a collected collection for removal from
+    *observers*.
+    """
+    _collection_refs.discard(ref)
+    _stale.append((observers, list(records)))
+    records.clear()
+
+
+def _purge_stale():
+    """
+    Remove the ids of records no longer held by any collection from the
+    observers dicts. Must be called with _lock held.
+    """
+    while _stale:
+        observers, keys = _stale.pop()
+        for key in keys:
+            collections = observers.get(key)
+            if collections is not None and not collections:
+                del observers[key]
+
+
+def _make_observing_property(fieldname, slot, attr, observers):
+    """
+    Return a property for the field *fieldname* that stores values through
+    *attr* (the field's slot descriptor or property) and reports changes to
+    the collections holding the record.
+    """
+    get_slot = slot.__get__
+    set_attr = attr.__set__
+    get_collections = observers.get
+
+    def set_field(rec, value):
+        collections = get_collections(id(rec))
+        if not collections:
+            set_attr(rec, value)
+            return
+        try:
+            old = get_slot(rec)
+        except AttributeError:
+            # The field is being filled for the first time
+            set_attr(rec, value)
+            return
+        set_attr(rec, value)
+        new = get_slot(rec)
+        for collection in collections:
+            collection._field_changed(rec, fieldname, old, new)
+    return property(get_slot, set_field, attr.__delete__)
@@ -0,0 +1,370 @@
+"""
+This module implements reading and writing streams of records over
+``asyncio`` streams, parsing records incrementally in the event loop rather
+than in a thread pool.
+
+This module uses ``async`` generators and so requires Python 3.6 or later.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import csv
+import io
+import json
+import struct
+
+# Formats supported by read_records() and RecordWriter
+FORMATS = ('jsonl', 'struct', 'csv')
+
+# Default number of bytes read from a stream at a time
+_CHUNK_SIZE = 1 << 16
+
+
+async def read_records(reader, rectype, format='jsonl', struct_format=None,
+                       chunk_size=_CHUNK_SIZE, encoding='utf-8', **fmtparams):
+    """
+    Asynchronously iterate over the records read from the
+    ``asyncio.StreamReader`` *reader*.
+
+    Example::
+
+        >>> from reck.aio import read_records
+        >>> Reading = recktype('Reading', 'sensor ts value')
+        >>> async def ingest(reader):
+        ...     async for rec in read_records(reader, Reading):
+        ...         handle(rec)
+
+    The stream is read *chunk_size* bytes at a time. The complete records in
+    each chunk are parsed and built in one batch, and any partial record at
+    the end of the chunk is kept until the rest of it arrives. So parsing
+    never waits on the stream, and each step of the event loop spends a
+    bounded time parsing, which makes a thread pool unnecessary. See
+    ``read_batches()`` to receive each batch as a list.
+
+    Supported formats:
+
+    * ``'jsonl'``: one JSON value per line, either an object mapping
+      fieldnames to values (passed to *rectype* as keyword arguments, so
+      defaults apply) or an array of field values in field order. Blank lines
+      are skipped.
+    * ``'struct'``: fixed-size binary records packed with *struct_format*
+      (a ``struct`` format string or ``struct.Struct``), one item per field.
+    * ``'csv'``: CSV rows of field values in field order. Quoted values may
+      contain newlines. Blank lines are skipped.
+
+    Field values read from arrays, CSV rows or structs are assigned with
+    ``_make()``, so field converters are applied.
+
+    :param reader: An ``asyncio.StreamReader`` or any object with a
+        coroutine ``read(n)`` method that returns ``b''`` at the end of the
+        stream.
+    :param rectype: The record type to build.
+    :param format: One of ``'jsonl'``, ``'struct'`` or ``'csv'``.
+    :param struct_format: The record layout, required for the ``'struct'``
+        format.
+    :param chunk_size: The maximum number of bytes read at a time.
+    :param encoding: The text encoding of the ``'jsonl'`` and ``'csv'``
+        formats.
+    :param **fmtparams: Formatting parameters passed to ``csv.reader()``.
+    :raises ValueError: if *format* is not supported, or a line or row
+        does not match *rectype*.
+    :raises EOFError: if a ``'struct'`` stream ends part way through a
+        record.
+    """
+    async for batch in read_batches(reader, rectype, format, struct_format,
+                                    chunk_size, encoding, **fmtparams):
+        for rec in batch:
+            yield rec
+
+
+async def read_batches(reader, rectype, format='jsonl', struct_format=None,
+                       chunk_size=_CHUNK_SIZE, encoding='utf-8', **fmtparams):
+    """
+    Asynchronously iterate over lists of the records read from the
+    ``asyncio.StreamReader`` *reader*, one list per chunk of the stream
+    that contained at least one complete record.
+
+    The parameters are the same as for ``read_records()``.
+    """
+    parser = _make_parser(rectype, format, struct_format, encoding,
+                          fmtparams)
+    while True:
+        data = await reader.read(chunk_size)
+        if not data:
+            break
+        batch = parser.feed(data)
+        if batch:
+            yield batch
+    batch = parser.close()
+    if batch:
+        yield batch
+
+
+class RecordWriter(object):
+    """
+    Write records to an ``asyncio.StreamWriter`` in batches.
+
+    Records are buffered and encoded *batch_size* at a time. Each encoded
+    batch is written to the stream followed by ``await writer.drain()``,
+    so a slow reader at the other end pauses the coroutine writing records
+    (backpressure) rather than letting the stream's buffer grow without
+    limit.
+
+    Example::
+
+        >>> from reck.aio import RecordWriter
+        >>> async def publish(writer, readings):
+        ...     async with RecordWriter(writer, Reading) as out:
+        ...         for rec in readings:
+        ...             await out.write(rec)
+
+    The formats are those of ``read_records()``. ``'jsonl'`` records are
+    written as JSON objects.
+
+    :param writer: An ``asyncio.StreamWriter``, or any object with
+        ``write(data)`` and coroutine ``drain()`` methods.
+    :param rectype: The record type to be written.
+    :param format: One of ``'jsonl'``, ``'struct'`` or ``'csv'``.
+    :param batch_size: The number of records buffered before they are
+        written.
+    :param struct_format: The record layout, required for the ``'struct'``
+        format.
+    :param encoding: The text encoding of the ``'jsonl'`` and ``'csv'``
+        formats.
+    :param **fmtparams: Formatting parameters passed to ``csv.writer()``.
+    :raises ValueError: if *format* is not supported or *batch_size* is
+        less than 1.
+    """
+    def __init__(self, writer, rectype, format='jsonl', batch_size=1024,
+                 struct_format=None, encoding='utf-8', **fmtparams):
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer: {0!r}'
+                             .format(batch_size))
+        self.writer = writer
+        self.rectype = rectype
+        self.format = format
+        self.batch_size = batch_size
+        self._encode = _make_encoder(rectype, format, struct_format,
+                                     encoding, fmtparams)
+        self._pending = []
+
+    async def write(self, rec):
+        """
+        Buffer the record *rec*, writing the buffered records if there are
+        *batch_size* of them.
+        """
+        self._pending.append(rec)
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+
+    async def write_many(self, records):
+        """
+        Buffer every record in the iterable *records*, writing each full
+        batch of buffered records.
+        """
+        pending = self._pending
+        size = self.batch_size
+        for rec in records:
+            pending.append(rec)
+            if len(pending) >= size:
+                await self.flush()
+                pending = self._pending
+
+    async def flush(self):
+        """
+        Write the buffered records and wait until the stream can accept more
+        data.
+        """
+        if self._pending:
+            batch, self._pending = self._pending, []
+            self.writer.write(self._encode(batch))
+        await self.writer.drain()
+
+    async def close(self):
+        """
+        Write the buffered records and close the stream.
+        """
+        await self.flush()
+        self.writer.close()
+        wait_closed = getattr(self.writer, 'wait_closed', None)
+        if wait_closed is not None:
+            await wait_closed()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def __repr__(self):
+        return 'RecordWriter({0}, format={1!r})'.format(
+            self.rectype.__name__, self.format)
+
+
+def _make_parser(rectype, format, struct_format, encoding, fmtparams):
+    if format == 'jsonl':
+        return _JsonlParser(rectype, encoding)
+    if format == 'struct':
+        return _StructParser(rectype, _get_struct(struct_format))
+    if format == 'csv':
+        return _CsvParser(rectype, encoding, fmtparams)
+    raise ValueError('unsupported format {0!r}, expected one of {1!r}'
+                     .format(format, FORMATS))
+
+
+def _make_encoder(rectype, format, struct_format, encoding, fmtparams):
+    """
+    Return a function that encodes a list of records of type *rectype* as
+    bytes.
+    """
+    values_getter = rectype._values_getter
+    if format == 'jsonl':
+        fieldnames = rectype._fieldnames
+        dumps = json.dumps
+
+        def encode(batch):
+            lines = [dumps(dict(zip(fieldnames, values_getter(rec))))
+                     for rec in batch]
+            lines.append('')
+            return '\n'.join(lines).encode(encoding)
+    elif format == 'struct':
+        pack = _get_struct(struct_format).pack
+
+        def encode(batch):
+            return b''.join([pack(*values_getter(rec)) for rec in batch])
+    elif format == 'csv':
+        def encode(batch):
+            buf = io.StringIO()
+            csv.writer(buf, **fmtparams).writerows(map(values_getter, batch))
+            return buf.getvalue().encode(encoding)
+    else:
+        raise ValueError('unsupported format {0!r}, expected one of {1!r}'
+                         .format(format, FORMATS))
+    return encode
+
+
+def _get_struct(struct_format):
+    if struct_format is None:
+        raise ValueError("struct_format is required for the 'struct' format")
+    if isinstance(struct_format, struct.Struct):
+        return struct_format
+    return struct.Struct(struct_format)
+
+
+class _JsonlParser(object):
+    """
+    Incremental parser of JSON lines into records.
+    """
+    def __init__(self, rectype, encoding):
+        self._rectype = rectype
+        self._make = rectype._make
+        self._encoding = encoding
+        self._buf = b''
+
+    def feed(self, data):
+        """
+        Add *data* to the buffered input and return a list of the records in
+        its complete lines.
+        """
+        buf = self._buf + data
+        end = buf.rfind(b'\n') + 1
+        self._buf = buf[end:]
+        return self._parse(buf[:end]) if end else []
+
+    def close(self):
+        """
+        Return a list of the records in the remaining input.
+        """
+        buf, self._buf = self._buf, b''
+        return self._parse(buf)
+
+    def _parse(self, data):
+        rectype = self._rectype
+        make = self._make
+        loads = json.loads
+        records = []
+        for line in data.decode(self._encoding).split('\n'):
+            if not line.strip():
+                continue
+            value = loads(line)
+            if isinstance(value, dict):
+                records.append(rectype(**value))
+            else:
+                records.append(make(value))
+        return records
+
+
+class _StructParser(object):
+    """
+    Incremental parser of fixed-size struct records into records.
+    """
+    def __init__(self, rectype, record_struct):
+        if len(record_struct.unpack(bytes(record_struct.size))) != (
+                rectype._nfields):
+            raise ValueError(
+                'struct format {0!r} does not have one item per field of '
+                '{1}'.format(record_struct.format, rectype.__name__))
+        self._make = rectype._make
+        self._struct = record_struct
+        self._buf = b''
+
+    def feed(self, data):
+        buf = self._buf + data
+        end = len(buf) - len(buf) % self._struct.size
+        self._buf = buf[end:]
+        if not end:
+            return []
+        return list(map(self._make, self._struct.iter_unpack(buf[:end])))
+
+    def close(self):
+        if self._buf:
+            raise EOFError('truncated struct record')
+        return []
+
+
+class _CsvParser(object):
+    """
+    Incremental parser of CSV rows into records.
+    """
+    def __init__(self, rectype, encoding, fmtparams):
+        self._make = rectype._make
+        self._encoding = encoding
+        self._fmtparams = fmtparams
+        self._quotechar = fmtparams.get('quotechar', '"').encode(encoding)
+        self._buf = b''
+
+    def feed(self, data):
+        buf = self._buf + data
+        end = self._find_row_end(buf) + 1
+        self._buf = buf[end:]
+        return self._parse(buf[:end]) if end else []
+
+    def close(self):
+        buf, self._buf = self._buf, b''
+        return self._parse(buf)
+
+    def _find_row_end(self, buf):
+        """
+        Return the index of the last newline in *buf* that ends a row, i.e.
+        is not inside a quoted value, or -1 if there is none.
+        """
+        end = buf.rfind(b'\n')
+        quotechar = self._quotechar
+        if end < 0 or quotechar not in buf:
+            return end
+        # A newline is outside quotes if an even number of quote characters
+        # precede it (escaped quotes are doubled, so they count twice).
+        quotes = buf.count(quotechar, 0, end)
+        while end >= 0 and quotes % 2:
+            prev = buf.rfind(b'\n', 0, end)
+            quotes -= buf.count(quotechar, prev + 1, end)
+            end = prev
+        return end
+
+    def _parse(self, data):
+        if not data:
+            return []
+        text = io.StringIO(data.decode(self._encoding), newline='')
+        return [self._make(row) for row in csv.reader(text, **self._fmtparams)
+                if row]
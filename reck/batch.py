@@ -0,0 +1,190 @@
+"""
+This module implements ColumnBatch, a batch of records of one record type
+stored column-wise.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import array
+import pickle
+
+from .reck import _rectype_ref, _resolve_rectype_ref
+
+# Out-of-band pickle buffers are only available from Python 3.8
+_PickleBuffer = getattr(pickle, 'PickleBuffer', None)
+
+
+class ColumnBatch(object):
+    """
+    A batch of records of one record type stored as one column of values per
+    field.
+
+    Storing a batch column-wise is more compact than storing it as records,
+    particularly when numeric columns are held in ``array.array`` objects
+    (see ``compact()``), and it is cheap to pickle, e.g. to pass results
+    between processes. Records are only built when asked for.
+
+    When pickled with protocol 5 or higher, the memory of each
+    ``array.array`` column is passed to the pickler as a
+    ``pickle.PickleBuffer``. Given a *buffer_callback*, the pickler then
+    hands the column data over out-of-band, without copying it into the
+    pickle stream::
+
+        >>> buffers = []
+        >>> data = pickle.dumps(batch, protocol=5,
+        ...                     buffer_callback=buffers.append)
+        >>> batch = pickle.loads(data, buffers=buffers)
+
+    Without a *buffer_callback*, the column data is copied into the stream
+    as a single block rather than pickled value by value. Column data is
+    passed in native byte order, so a batch pickled this way should only be
+    unpickled on a machine of the same architecture.
+
+    Example::
+
+        >>> from reck import ColumnBatch
+        >>> Point = recktype('Point', 'x y')
+        >>> batch = ColumnBatch(Point, [[1, 2], [3, 4]])
+        >>> batch.column('y')
+        [3, 4]
+        >>> batch.records()
+        [Point(x=1, y=3), Point(x=2, y=4)]
+
+    :param rectype: The record type of the records in the batch.
+    :param columns: A sequence of columns, one per field in field order. Each
+        column is a sequence of field values, one per record.
+    :raises ValueError: if there is not one column per field or the columns
+        are not all the same length.
+    """
+    def __init__(self, rectype, columns):
+        columns = tuple(columns)
+        if len(columns) != rectype._nfields:
+            raise ValueError(
+                'expected {0} columns but {1} were given'
+                .format(rectype._nfields, len(columns)))
+        lengths = set(map(len, columns))
+        if len(lengths) > 1:
+            raise ValueError('columns are not all the same length')
+        self.rectype = rectype
+        self.columns = columns
+        self._len = lengths.pop() if lengths else 0
+
+    @classmethod
+    def from_records(cls, rectype, records):
+        """
+        Return a new batch holding the field values of the records in the
+        iterable *records*, which must all be of type *rectype*.
+        """
+        columns = [list(column)
+                   for column in zip(*map(rectype._values_getter, records))]
+        if not columns:
+            columns = [[] for _ in range(rectype._nfields)]
+        return cls(rectype, columns)
+
+    def column(self, fieldname):
+        """
+        Return the column of values of the field *fieldname*.
+
+        :raises ValueError: if *fieldname* is not a fieldname.
+        """
+        try:
+            return self.columns[self.rectype._fieldnames.index(fieldname)]
+        except ValueError:
+            raise ValueError(
+                '{0!r} does not match a field'.format(fieldname))
+
+    def records(self):
+        """
+        Return a list of the records in the batch.
+
+        Records are built without argument checking or field converters
+        (but interned fields are still interned), since the columns are
+        expected to hold valid field values.
+        """
+        make = self.rectype._make
+        return [make(values, False) for values in zip(*self.columns)]
+
+    def compact(self):
+        """
+        Replace each column whose values are all ``int`` (in the range of a
+        signed 64-bit integer) or all ``float`` with an ``array.array``, and
+        return the batch.
+        """
+        self.columns = tuple(map(_compact_column, self.columns))
+        return self
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return iter(self.records())
+
+    def __reduce__(self):
+        # The record type is pickled like the type of a record, so batches of
+        # types created inside functions can be sent between processes.
+        return (_restore_column_batch,
+                (_rectype_ref(self.rectype), self.columns))
+
+    def __reduce_ex__(self, protocol):
+        if protocol < 5 or _PickleBuffer is None:
+            return self.__reduce__()
+        columns = []
+        typecodes = []
+        for column in self.columns:
+            if isinstance(column, array.array):
+                columns.append(_PickleBuffer(column))
+                typecodes.append(column.typecode)
+            else:
+                columns.append(column)
+                typecodes.append(None)
+        return (_restore_buffered_column_batch,
+                (_rectype_ref(self.rectype), tuple(columns),
+                 tuple(typecodes)))
+
+    def __repr__(self):
+        return '<ColumnBatch of {0} {1} records>'.format(
+            self._len, self.rectype.__name__)
+
+
+def _restore_column_batch(ref, columns):
+    """
+    Return a new batch from a pickled record type reference and columns.
+    """
+    return ColumnBatch(_resolve_rectype_ref(ref), columns)
+
+
+def _restore_buffered_column_batch(ref, columns, typecodes):
+    """
+    Return a new batch from a pickled record type reference and columns,
+    where the columns with a typecode are buffers of ``array.array`` data.
+    """
+    restored = []
+    for column, typecode in zip(columns, typecodes):
+        if typecode is not None:
+            data = memoryview(column).cast('B')
+            column = array.array(typecode)
+            column.frombytes(data)
+        restored.append(column)
+    return ColumnBatch(_resolve_rectype_ref(ref), restored)
+
+
+def _compact_column(column):
+    """
+    Return *column* as an ``array.array`` if all its values are ints or all
+    floats, else return it unchanged.
+    """
+    if isinstance(column, array.array) or not column:
+        return column
+    kind = type(column[0])
+    if kind is bool or kind not in (int, float):
+        return column
+    for value in column:
+        if type(value) is not kind:
+            return column
+    if kind is float:
+        return array.array('d', column)
+    try:
+        return array.array('q', column)
+    except OverflowError:
+        return column
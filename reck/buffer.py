@@ -0,0 +1,209 @@
+"""
+This module implements AppendBuffer, a buffer of records that many producer
+threads can append to with little lock contention.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import collections
+import threading
+
+
+class AppendBuffer(object):
+    """
+    A thread-safe buffer of records of one record type, filled by producer
+    threads and emptied in batches by consumer threads.
+
+    Each producer thread appends to a chunk of its own, without taking a
+    lock, and records are built from raw tuples in the producer thread too.
+    When a chunk holds *chunk_rows* records it is sealed: it is added to an
+    ordered list of sealed chunks under a lock held only for that append.
+    Consumers remove sealed chunks, as lists of records, with ``drain()``
+    or ``batches()``. Records from one producer keep their order, but the
+    records of different producers are interleaved chunk by chunk.
+
+    Example::
+
+        >>> from reck import AppendBuffer
+        >>> Message = recktype('Message', 'source body')
+        >>> buffer = AppendBuffer(Message, chunk_rows=2)
+        >>> buffer.extend([('a', 1), ('a', 2), ('a', 3)])
+        >>> buffer.drain()
+        [[Message(source='a', body=1), Message(source='a', body=2)]]
+        >>> buffer.close()
+        >>> buffer.drain()
+        [[Message(source='a', body=3)]]
+
+    A chunk that is not full is only sealed when its producer calls
+    ``flush()`` or when the buffer is closed. Call ``close()`` once all
+    producers have finished appending.
+
+    :param rectype: The record type of the records in the buffer.
+    :param chunk_rows: The number of records in each sealed chunk.
+    :raises ValueError: if *chunk_rows* is less than 1.
+    """
+    def __init__(self, rectype, chunk_rows=1024):
+        if chunk_rows < 1:
+            raise ValueError('chunk_rows must be a positive integer: {0!r}'
+                             .format(chunk_rows))
+        self.rectype = rectype
+        self.chunk_rows = chunk_rows
+        self.closed = False
+        self._local = threading.local()
+        # The chunk of every producer thread, so that close() can seal them
+        self._producers = []
+        self._sealed = collections.deque()
+        self._ready = threading.Condition(threading.Lock())
+
+    # --------------------------------------------------------------------------
+    # Producers
+
+    def append(self, item):
+        """
+        Append *item*, a record of the buffer's record type or a sequence of
+        one value per field, which is converted to a record with
+        ``_make()``.
+
+        :raises ValueError: if the buffer is closed.
+        :raises TypeError: if *item* is a sequence of the wrong length.
+        """
+        if not isinstance(item, self.rectype):
+            item = self.rectype._make(item)
+        chunk = self._chunk()
+        chunk.append(item)
+        if len(chunk) >= self.chunk_rows:
+            self._seal()
+
+    def extend(self, items):
+        """
+        Append each record or sequence of field values in the iterable
+        *items*.
+
+        :raises ValueError: if the buffer is closed.
+        """
+        rectype = self.rectype
+        make = rectype._make
+        chunk_rows = self.chunk_rows
+        chunk = self._chunk()
+        for item in items:
+            if not isinstance(item, rectype):
+                item = make(item)
+            chunk.append(item)
+            if len(chunk) >= chunk_rows:
+                chunk = self._seal()
+
+    def flush(self):
+        """
+        Seal the calling thread's chunk, if it holds any records, so that
+        consumers can drain it.
+        """
+        producer = getattr(self._local, 'producer', None)
+        if producer is not None and producer.chunk:
+            self._seal()
+
+    def close(self):
+        """
+        Seal the chunks of all producers and close the buffer to further
+        appends. Sealed chunks can still be drained. Closing a closed
+        buffer has no effect.
+        """
+        with self._ready:
+            if self.closed:
+                return
+            self.closed = True
+            for producer in self._producers:
+                if producer.chunk:
+                    self._sealed.append(producer.chunk)
+                    producer.chunk = []
+            self._ready.notify_all()
+
+    # --------------------------------------------------------------------------
+    # Consumers
+
+    def drain(self, max_batches=None, timeout=0):
+        """
+        Remove sealed chunks from the buffer and return them as a list of
+        lists of records, oldest first.
+
+        :param max_batches: The maximum number of chunks to return, or
+            ``None`` to return every sealed chunk.
+        :param timeout: The number of seconds to wait for a chunk to be
+            sealed if there are none, or ``None`` to wait until a chunk is
+            sealed or the buffer is closed. By default, does not wait.
+        """
+        sealed = self._sealed
+        with self._ready:
+            if not sealed and not self.closed and timeout != 0:
+                self._ready.wait_for(lambda: sealed or self.closed, timeout)
+            if max_batches is None or max_batches >= len(sealed):
+                batches = list(sealed)
+                sealed.clear()
+            else:
+                batches = [sealed.popleft() for _ in range(max_batches)]
+        return batches
+
+    def batches(self):
+        """
+        Return an iterator that yields sealed chunks as they become
+        available, until the buffer is closed and empty.
+        """
+        while True:
+            batches = self.drain(timeout=None)
+            if not batches:
+                return
+            for batch in batches:
+                yield batch
+
+    def __len__(self):
+        """
+        Return the number of sealed chunks waiting to be drained.
+        """
+        return len(self._sealed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return '<AppendBuffer of {0} records, {1} chunks sealed>'.format(
+            self.rectype.__name__, len(self._sealed))
+
+    def _chunk(self):
+        """
+        Return the calling thread's chunk, registering the thread as a
+        producer on its first append.
+        """
+        if self.closed:
+            raise ValueError('append to a closed buffer')
+        try:
+            return self._local.producer.chunk
+        except AttributeError:
+            producer = self._local.producer = _Producer()
+            with self._ready:
+                self._producers.append(producer)
+            return producer.chunk
+
+    def _seal(self):
+        """
+        Seal the calling thread's chunk and return its new, empty chunk.
+        """
+        producer = self._local.producer
+        chunk = producer.chunk
+        producer.chunk = []
+        with self._ready:
+            self._sealed.append(chunk)
+            self._ready.notify()
+        return producer.chunk
+
+
+class _Producer(object):
+    """
+    The unsealed chunk of a producer thread.
+    """
+    __slots__ = ('chunk',)
+
+    def __init__(self):
+        self.chunk = []
@@ -0,0 +1,99 @@
+"""
+This module implements RecordCodec, a compact per-type binary serialisation
+of records used by the file-backed utilities in reck.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import pickle
+import struct
+
+# Each encoded record written to a file is prefixed with its length
+_FRAME_HEADER = struct.Struct('<I')
+
+
+class RecordCodec(object):
+    """
+    Serialise records of a single record type to and from bytes.
+
+    Only the field values of each record are encoded. The record type and
+    its fieldnames are known to the codec, so unlike pickling a record they
+    are not repeated in every encoded record.
+
+    Example::
+
+        >>> from reck.codec import RecordCodec
+        >>> Point = recktype('Point', 'x y')
+        >>> codec = RecordCodec(Point)
+        >>> codec.decode(codec.encode(Point(1, 2)))
+        Point(x=1, y=2)
+
+    :param rectype: The record type to be encoded/decoded.
+    :param protocol: The pickle protocol used to encode field values.
+    """
+    def __init__(self, rectype, protocol=pickle.HIGHEST_PROTOCOL):
+        self.rectype = rectype
+        self.protocol = protocol
+        self._values_getter = rectype._values_getter
+        self._make = rectype._make
+
+    def encode(self, rec):
+        """
+        Return the field values of *rec* encoded as bytes.
+        """
+        return pickle.dumps(self._values_getter(rec), self.protocol)
+
+    def decode(self, data):
+        """
+        Return a new record decoded from the bytes-like object *data*.
+
+        Field converters are not applied, since the encoded values were read
+        from records of the same type.
+        """
+        return self._make(pickle.loads(data), False)
+
+    def write(self, fileobj, rec):
+        """
+        Write *rec* to the binary file object *fileobj* as a length-prefixed
+        frame and return the number of bytes written.
+        """
+        data = self.encode(rec)
+        fileobj.write(_FRAME_HEADER.pack(len(data)))
+        fileobj.write(data)
+        return _FRAME_HEADER.size + len(data)
+
+    def read(self, fileobj):
+        """
+        Read the next length-prefixed frame from the binary file object
+        *fileobj* and return it as a record, or ``None`` at the end of the
+        file.
+
+        :raises EOFError: if the file ends part way through a frame.
+        """
+        header = fileobj.read(_FRAME_HEADER.size)
+        if not header:
+            return None
+        if len(header) != _FRAME_HEADER.size:
+            raise EOFError('truncated record frame header')
+        size, = _FRAME_HEADER.unpack(header)
+        data = fileobj.read(size)
+        if len(data) != size:
+            raise EOFError('truncated record frame')
+        return self.decode(data)
+
+    def iter_read(self, fileobj):
+        """
+        Return an iterator over the records in the length-prefixed frames of
+        the binary file object *fileobj*.
+        """
+        read = self.read
+        while True:
+            rec = read(fileobj)
+            if rec is None:
+                return
+            yield rec
+
+    def __repr__(self):
+        return 'RecordCodec({0}, protocol={1!r})'.format(
+            self.rectype.__name__, self.protocol)
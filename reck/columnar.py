@@ -0,0 +1,428 @@
+"""
+This module implements a compressed columnar file format for archives of
+records, with ``write()`` and ``read()`` functions.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import array
+import bz2
+import collections
+import concurrent.futures
+import itertools
+import json
+import lzma
+import mmap
+import multiprocessing
+import pickle
+import struct
+import sys
+import zlib
+
+from .batch import ColumnBatch, _compact_column
+from .reck import recktype
+
+_MAGIC = b'RECKCOL\x01'
+# The footer is followed by its length and the magic bytes again
+_TRAILER = struct.Struct('<Q8s')
+
+
+def _zlib_compress(data, level):
+    return zlib.compress(data, 6 if level is None else level)
+
+
+def _lzma_compress(data, level):
+    return lzma.compress(data, preset=level)
+
+
+def _bz2_compress(data, level):
+    return bz2.compress(data, 9 if level is None else level)
+
+
+# codec name -> (compress(data, level), decompress(data))
+_CODECS = {
+    'zlib': (_zlib_compress, zlib.decompress),
+    'lzma': (_lzma_compress, lzma.decompress),
+    'bz2': (_bz2_compress, bz2.decompress),
+}
+# Codecs supported by write()
+CODECS = ('zlib', 'lzma', 'bz2')
+
+# Column chunks of these value types have min/max statistics
+_STAT_TYPES = {int: 'number', float: 'number', str: 'str'}
+
+
+def write(path, records, rectype, chunk_rows=65536, codec='zlib', level=None,
+          workers=None):
+    """
+    Write the records of type *rectype* in the iterable *records* to a new
+    columnar file at *path*, and return the number of records written.
+
+    Records are split into chunks of *chunk_rows* records. Within a chunk,
+    the values of each field are stored as a separately compressed column
+    chunk, so ``read()`` only decompresses the fields it is asked for.
+    Columns whose values are all ``int`` or all ``float`` are stored as
+    packed 64-bit arrays, and other columns as pickled lists. Column chunks
+    of numbers or strings also record the minimum and maximum of their
+    non-``None`` values, which ``read()`` uses to skip chunks that cannot
+    match its *where* ranges.
+
+    Column chunks are compressed in a pool of threads, since the standard
+    library codecs release the GIL while they work.
+
+    Example::
+
+        >>> from reck import columnar
+        >>> Trade = recktype('Trade', 'ts sym qty price')
+        >>> columnar.write('trades.col', trades, Trade, codec='lzma')
+        1000000
+        >>> for trade in columnar.read('trades.col', ['sym', 'price'],
+        ...                            where={'ts': (1450000000, None)}):
+        ...     handle(trade)
+
+    The file starts with a magic number, followed by the compressed column
+    chunks and a JSON footer holding the schema of *rectype*, the codec and
+    the location and statistics of every column chunk.
+
+    :param path: Path of the file to write. An existing file is replaced.
+    :param records: An iterable of records of type *rectype*.
+    :param rectype: The record type of the records.
+    :param chunk_rows: The number of records in each chunk.
+    :param codec: The compression codec: ``'zlib'``, ``'lzma'`` or
+        ``'bz2'``.
+    :param level: The compression level (or ``lzma`` preset), or ``None``
+        for the codec's default.
+    :param workers: The number of compression threads. Defaults to the
+        number of CPUs. If 1, columns are compressed in the calling thread.
+    :raises ValueError: if *codec* is not supported or *chunk_rows* or
+        *workers* is less than 1.
+    """
+    if codec not in _CODECS:
+        raise ValueError('unsupported codec {0!r}, expected one of {1!r}'
+                         .format(codec, CODECS))
+    if chunk_rows < 1:
+        raise ValueError('chunk_rows must be a positive integer: {0!r}'
+                         .format(chunk_rows))
+    workers = _check_workers(workers)
+    compress = _CODECS[codec][0]
+    records = iter(records)
+    chunks = []
+    nrecords = 0
+    with open(path, 'wb') as fileobj, _executor(workers) as executor:
+        fileobj.write(_MAGIC)
+        offset = len(_MAGIC)
+        pending = collections.deque()
+        while True:
+            batch = ColumnBatch.from_records(
+                rectype, itertools.islice(records, chunk_rows))
+            if not len(batch):
+                break
+            nrecords += len(batch)
+            pending.append((len(batch), [
+                _submit(executor, _encode_column, column, compress, level)
+                for column in batch.columns]))
+            del batch
+            if len(pending) >= 2 * workers:
+                offset = _write_chunk(fileobj, offset, chunks,
+                                      *pending.popleft())
+        while pending:
+            offset = _write_chunk(fileobj, offset, chunks,
+                                  *pending.popleft())
+
+        footer = json.dumps({
+            'typename': rectype.__name__,
+            'fieldnames': list(rectype._fieldnames),
+            'codec': codec,
+            'chunks': chunks,
+        }).encode('utf-8')
+        fileobj.write(footer)
+        fileobj.write(_TRAILER.pack(len(footer), _MAGIC))
+    return nrecords
+
+
+def _write_chunk(fileobj, offset, chunks, nrows, futures):
+    """
+    Write the compressed column chunks of a chunk of *nrows* records at
+    *offset*, append the chunk's footer entry to *chunks* and return the
+    offset of the end of the chunk.
+    """
+    columns = []
+    for future in futures:
+        data, encoding, stats = future.result()
+        fileobj.write(data)
+        columns.append([offset, len(data), encoding, stats])
+        offset += len(data)
+    chunks.append({'rows': nrows, 'columns': columns})
+    return offset
+
+
+def read(path, fieldnames=None, where=None, rectype=None, columns=False,
+         workers=None):
+    """
+    Return an iterator over the records in the columnar file at *path*.
+
+    Only the column chunks of the fields in *fieldnames* (and in *where*)
+    are read and decompressed, in a pool of threads. If *fieldnames* holds
+    a subset of the fields, or the fields in a different order, records of
+    the derived type returned by ``rectype._project(*fieldnames)`` are
+    returned.
+
+    *where* maps fieldnames to inclusive ``(low, high)`` ranges of values,
+    either of which may be ``None`` for no bound. Only records whose values
+    lie in every range are returned. Chunks whose minimum and maximum show
+    that none of their records can match are skipped without being
+    decompressed.
+
+    Column chunks that are not packed arrays are unpickled, so only read
+    files from trusted sources.
+
+    :param path: Path of a file written by ``write()``.
+    :param fieldnames: The fields to read, or ``None`` to read all fields.
+    :param where: A mapping of fieldnames to ``(low, high)`` ranges.
+    :param rectype: The record type of the records in the file. If omitted,
+        a record type is created from the schema in the file footer.
+    :param columns: If ``True``, return an iterator of ``ColumnBatch``
+        objects, one per chunk, instead of an iterator of records.
+    :param workers: The number of decompression threads. Defaults to the
+        number of CPUs. If 1, columns are decompressed in the calling
+        thread.
+    :raises ValueError: if the file is not a columnar file, *rectype* does
+        not match its schema, or a fieldname does not match a field.
+    """
+    workers = _check_workers(workers)
+    with open(path, 'rb') as fileobj:
+        footer = _read_footer(fileobj, path)
+    stored_fieldnames = tuple(footer['fieldnames'])
+    if rectype is None:
+        rectype = recktype(footer['typename'], stored_fieldnames)
+    elif rectype._fieldnames != stored_fieldnames:
+        raise ValueError(
+            'record type fieldnames {0!r} do not match the file fieldnames '
+            '{1!r}'.format(rectype._fieldnames, stored_fieldnames))
+    if fieldnames is None:
+        fieldnames = stored_fieldnames
+    elif isinstance(fieldnames, str):
+        fieldnames = fieldnames.replace(',', ' ').split()
+    fieldnames = tuple(fieldnames)
+    where = dict(where or {})
+    for fieldname in fieldnames + tuple(where):
+        if fieldname not in rectype._fieldnames_set:
+            raise ValueError('{0!r} does not match a field'.format(fieldname))
+    if fieldnames == stored_fieldnames:
+        outtype = rectype
+    else:
+        outtype = rectype._project(*fieldnames)[0]
+    batches = _iter_batches(
+        path, footer, outtype,
+        [stored_fieldnames.index(fieldname) for fieldname in fieldnames],
+        [(stored_fieldnames.index(fieldname), low, high)
+         for fieldname, (low, high) in where.items()],
+        workers)
+    if columns:
+        return batches
+    return itertools.chain.from_iterable(
+        batch.records() for batch in batches)
+
+
+def _iter_batches(path, footer, outtype, indexes, ranges, workers):
+    """
+    Yield a ``ColumnBatch`` of the columns at *indexes* for each chunk in
+    the file that has records in every range of *ranges*.
+    """
+    decompress = _CODECS[footer['codec']][1]
+    needed = sorted(set(indexes).union(index for index, _, _ in ranges))
+    with open(path, 'rb') as fileobj, _executor(workers) as executor:
+        buf = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pending = collections.deque()
+            chunks = (chunk for chunk in footer['chunks']
+                      if _may_match(chunk, ranges))
+            for chunk in chunks:
+                futures = {}
+                for index in needed:
+                    start, size, encoding, _ = chunk['columns'][index]
+                    futures[index] = _submit(
+                        executor, _decode_column, buf[start:start + size],
+                        encoding, decompress)
+                pending.append(futures)
+                if len(pending) >= 2 * workers:
+                    batch = _make_batch(outtype, pending.popleft(), indexes,
+                                        ranges)
+                    if batch is not None:
+                        yield batch
+            while pending:
+                batch = _make_batch(outtype, pending.popleft(), indexes,
+                                    ranges)
+                if batch is not None:
+                    yield batch
+        finally:
+            buf.close()
+
+
+def _make_batch(outtype, futures, indexes, ranges):
+    """
+    Return a ``ColumnBatch`` of the rows of the decoded columns that lie in
+    every range of *ranges*, or ``None`` if there are no such rows.
+    """
+    decoded = dict((index, future.result())
+                   for index, future in futures.items())
+    columns = [decoded[index] for index in indexes]
+    if ranges:
+        checks = [(decoded[index], low, high) for index, low, high in ranges]
+        mask = [all(_in_range(values[i], low, high)
+                    for values, low, high in checks)
+                for i in range(len(checks[0][0]))]
+        if not any(mask):
+            return None
+        if not all(mask):
+            columns = [_select(column, mask) for column in columns]
+    return ColumnBatch(outtype, columns)
+
+
+def _may_match(chunk, ranges):
+    """
+    Return ``False`` if the statistics of *chunk* show that none of its rows
+    lie in every range of *ranges*.
+    """
+    for index, low, high in ranges:
+        stats = chunk['columns'][index][3]
+        if stats is None:
+            continue
+        if stats == 'empty':
+            return False
+        minimum, maximum = stats
+        if low is not None and maximum < low:
+            return False
+        if high is not None and high < minimum:
+            return False
+    return True
+
+
+def _in_range(value, low, high):
+    return (value is not None and (low is None or low <= value) and
+            (high is None or value <= high))
+
+
+def _select(column, mask):
+    """
+    Return the values of *column* where *mask* is true, as a column of the
+    same kind.
+    """
+    values = itertools.compress(column, mask)
+    if isinstance(column, array.array):
+        return array.array(column.typecode, values)
+    return list(values)
+
+
+def _encode_column(column, compress, level):
+    """
+    Return ``(data, encoding, stats)`` for *column*, where *data* is the
+    compressed column.
+    """
+    column = _compact_column(column)
+    if isinstance(column, array.array):
+        encoding = 'array:' + column.typecode
+        if sys.byteorder == 'big':
+            column = array.array(column.typecode, column)
+            column.byteswap()
+        data = column.tobytes()
+    else:
+        encoding = 'pickle'
+        data = pickle.dumps(list(column), protocol=3)
+    return compress(data, level), encoding, _column_stats(column)
+
+
+def _decode_column(data, encoding, decompress):
+    """
+    Return the column decoded from the compressed *data*.
+    """
+    data = decompress(data)
+    if encoding == 'pickle':
+        return pickle.loads(data)
+    column = array.array(encoding.partition(':')[2])
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+def _column_stats(column):
+    """
+    Return the ``[minimum, maximum]`` of the non-``None`` values of
+    *column*, ``'empty'`` if all its values are ``None``, or ``None`` if its
+    values are not all numbers or all strings.
+    """
+    if isinstance(column, array.array):
+        values = column
+    else:
+        values = [value for value in column if value is not None]
+        if not values:
+            return 'empty'
+        kinds = set(_STAT_TYPES.get(type(value)) for value in values)
+        if len(kinds) != 1 or None in kinds:
+            return None
+    # A NaN makes min() and max() depend on the order of the values
+    if float in map(type, values) and any(
+            value != value for value in values):
+        return None
+    return [min(values), max(values)]
+
+
+def _read_footer(fileobj, path):
+    """
+    Return the decoded footer of the columnar file *fileobj*.
+    """
+    error = ValueError('{0!r} is not a columnar record file'.format(path))
+    if fileobj.read(len(_MAGIC)) != _MAGIC:
+        raise error
+    fileobj.seek(0, 2)
+    if fileobj.tell() < len(_MAGIC) + _TRAILER.size:
+        raise error
+    fileobj.seek(-_TRAILER.size, 2)
+    size, magic = _TRAILER.unpack(fileobj.read(_TRAILER.size))
+    if magic != _MAGIC:
+        raise error
+    fileobj.seek(-_TRAILER.size - size, 2)
+    return json.loads(fileobj.read(size).decode('utf-8'))
+
+
+def _check_workers(workers):
+    if workers is None:
+        return multiprocessing.cpu_count()
+    if workers < 1:
+        raise ValueError('workers must be a positive integer: {0!r}'
+                         .format(workers))
+    return workers
+
+
+class _SerialExecutor(object):
+    """
+    Stands in for a thread pool when there is a single worker.
+    """
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def _executor(workers):
+    if workers == 1:
+        return _SerialExecutor()
+    return concurrent.futures.ThreadPoolExecutor(workers)
+
+
+def _submit(executor, fn, *args):
+    """
+    Return a future of ``fn(*args)``, run in *executor* or, if there is no
+    executor, immediately.
+    """
+    if executor is not None:
+        return executor.submit(fn, *args)
+    future = concurrent.futures.Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as exc:
+        future.set_exception(exc)
+    return future
@@ -0,0 +1,222 @@
+"""
+This module implements dedup(), which drops duplicate records from a stream
+using compact fingerprints of their field values, within a memory budget.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import heapq
+import math
+import mmap
+import operator
+import tempfile
+
+from .diff import _fingerprint_values, _FINGERPRINT_SIZE
+from .extsort import _parse_memory_limit
+
+# Approximate memory used by each fingerprint held in a set: the bytes
+# object plus its share of the set's hash table.
+_SET_ENTRY_SIZE = 96
+# Spilled runs are merged into one once there are more than this many
+_MAX_RUNS = 8
+# Run files are written in large blocks
+_BUFFER_SIZE = 1 << 20
+
+
+def dedup(records, key=None, max_memory='64MB', error_rate=None,
+          tempdir=None):
+    """
+    Yield the records in the iterable *records*, dropping every record that
+    duplicates an earlier one.
+
+    Records are not hashable, so rather than keeping the records (or tuples
+    of their values) in a set, ``dedup()`` keeps a 16-byte fingerprint of
+    each record's field values (see ``reck.diff.fingerprint()``), or of the
+    values of the *key* fields.
+
+    Example::
+
+        >>> from reck import dedup
+        >>> Event = recktype('Event', 'id kind')
+        >>> events = [Event(1, 'a'), Event(2, 'b'), Event(1, 'a')]
+        >>> list(dedup(events))
+        [Event(id=1, kind='a'), Event(id=2, kind='b')]
+        >>> list(dedup(events, key='kind'))
+        [Event(id=1, kind='a'), Event(id=2, kind='b')]
+
+    By default deduplication is exact. Fingerprints are kept in a set until
+    it would use more than *max_memory*. The set is then sorted and spilled
+    to a temporary file, which is searched by binary search over a memory
+    map, and a new set is started. Spilled runs are merged into one file
+    whenever there are more than a few of them.
+
+    If *error_rate* is given, fingerprints are instead added to a Bloom
+    filter of *max_memory* bytes, which never spills to disk. A record that
+    is not a duplicate is then wrongly dropped with a probability of at most
+    *error_rate*, as long as the number of distinct records does not exceed
+    the filter's capacity of about ``max_memory * 8 * ln(2) / k`` where
+    ``k = ceil(log2(1 / error_rate))``. Beyond that the error rate grows.
+
+    Records are compared by the pickled form of their values, so values
+    that are equal but pickle differently (such as ``1`` and ``1.0``) are
+    not duplicates.
+
+    :param records: An iterable of records.
+    :param key: ``None`` to compare all field values, or a fieldname or
+        sequence of fieldnames to compare.
+    :param max_memory: The memory budget for fingerprints, as a number of
+        bytes or a string such as ``'64MB'``.
+    :param error_rate: If given, the false positive rate of a probabilistic
+        Bloom filter, between 0 and 1.
+    :param tempdir: The directory in which spilled fingerprints are stored.
+        Defaults to the system temporary directory.
+    :raises ValueError: if *max_memory* or *error_rate* is invalid.
+    """
+    max_memory = _parse_memory_limit(max_memory)
+    if error_rate is None:
+        seen = _FingerprintSet(max_memory, tempdir)
+    elif 0 < error_rate < 1:
+        seen = _BloomFilter(max_memory, error_rate)
+    else:
+        raise ValueError('error_rate must be between 0 and 1: {0!r}'
+                         .format(error_rate))
+    if key is None:
+        get_values = None
+    else:
+        if isinstance(key, str):
+            key = (key,)
+        get_values = operator.attrgetter(*key)
+    return _dedup(records, get_values, seen)
+
+
+def _dedup(records, get_values, seen):
+    add = seen.add
+    try:
+        for rec in records:
+            if get_values is None:
+                values = rec._values_getter(rec)
+            else:
+                values = get_values(rec)
+            if add(_fingerprint_values(values)):
+                yield rec
+    finally:
+        seen.close()
+
+
+class _FingerprintSet(object):
+    """
+    An exact set of fingerprints that spills sorted runs to disk when it
+    outgrows its memory budget.
+    """
+    def __init__(self, max_memory, tempdir):
+        self._capacity = max(1, max_memory // _SET_ENTRY_SIZE)
+        self._tempdir = tempdir
+        self._fingerprints = set()
+        self._runs = []
+
+    def add(self, fingerprint):
+        """
+        Add *fingerprint* and return ``True`` if it was not already present.
+        """
+        fingerprints = self._fingerprints
+        if fingerprint in fingerprints:
+            return False
+        for run in self._runs:
+            if fingerprint in run:
+                return False
+        fingerprints.add(fingerprint)
+        if len(fingerprints) >= self._capacity:
+            self._spill()
+        return True
+
+    def close(self):
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._fingerprints = set()
+
+    def _spill(self):
+        self._runs.append(_SortedRun(sorted(self._fingerprints),
+                                     self._tempdir))
+        self._fingerprints = set()
+        if len(self._runs) > _MAX_RUNS:
+            runs = self._runs
+            self._runs = [_SortedRun(heapq.merge(*runs), self._tempdir)]
+            for run in runs:
+                run.close()
+
+
+class _SortedRun(object):
+    """
+    A temporary file of sorted fixed-size fingerprints, searched by binary
+    search over a memory map.
+    """
+    def __init__(self, fingerprints, tempdir):
+        self._file = tempfile.TemporaryFile(dir=tempdir,
+                                            buffering=_BUFFER_SIZE)
+        for fingerprint in fingerprints:
+            self._file.write(fingerprint)
+        self._file.flush()
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._len = len(self._map) // _FINGERPRINT_SIZE
+
+    def __contains__(self, fingerprint):
+        buf = self._map
+        size = _FINGERPRINT_SIZE
+        lo = 0
+        hi = self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = mid * size
+            value = buf[start:start + size]
+            if value < fingerprint:
+                lo = mid + 1
+            elif fingerprint < value:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def __iter__(self):
+        buf = self._map
+        size = _FINGERPRINT_SIZE
+        for start in range(0, self._len * size, size):
+            yield buf[start:start + size]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class _BloomFilter(object):
+    """
+    A Bloom filter of fingerprints. The bit positions of a fingerprint are
+    derived from its two 64-bit halves by double hashing.
+    """
+    def __init__(self, max_memory, error_rate):
+        self._nbits = max_memory * 8
+        self._bits = bytearray(max_memory)
+        self._nhashes = max(1, int(math.ceil(-math.log(error_rate, 2))))
+
+    def add(self, fingerprint):
+        """
+        Add *fingerprint* and return ``True`` if it was (probably) not
+        already present.
+        """
+        h1 = int.from_bytes(fingerprint[:8], 'little')
+        h2 = int.from_bytes(fingerprint[8:], 'little') | 1
+        nbits = self._nbits
+        bits = self._bits
+        added = False
+        for i in range(self._nhashes):
+            position = (h1 + i * h2) % nbits
+            index = position >> 3
+            mask = 1 << (position & 7)
+            if not bits[index] & mask:
+                bits[index] |= mask
+                added = True
+        return added
+
+    def close(self):
+        pass
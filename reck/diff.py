@@ -0,0 +1,235 @@
+"""
+This module implements diff(), which compares two collections of records
+keyed by one or more fields and yields the records inserted, deleted and
+changed.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import hashlib
+import operator
+import pickle
+
+from .reck import recktype
+
+# Fingerprints pickle field values with a fixed protocol so that they are
+# stable across Python versions that support it.
+_FINGERPRINT_PROTOCOL = 3
+_FINGERPRINT_SIZE = 16
+
+# Marks the end of a stream
+_END = object()
+
+Change = recktype('Change', ['kind', 'key', 'old', 'new', ('fields', None)])
+Change.__doc__ = """
+A difference between two collections of records, yielded by ``diff()``.
+
+* ``kind``: ``'insert'``, ``'delete'`` or ``'change'``.
+* ``key``: the key of the record.
+* ``old``: the old record, or ``None`` for an insert.
+* ``new``: the new record, or ``None`` for a delete.
+* ``fields``: for a change, a tuple of the names of the changed fields, or
+  ``None`` when comparing fingerprints.
+"""
+
+INSERT = 'insert'
+DELETE = 'delete'
+CHANGE = 'change'
+
+
+def diff(old, new, key=('id',), presorted=False, fingerprint=False):
+    """
+    Compare the records in the iterables *old* and *new*, matched by *key*,
+    and yield a ``Change`` record for each record inserted, deleted or
+    changed.
+
+    Records are compared field by field using a tuple of their values, and
+    the names of the changed fields are found by walking the record type's
+    fieldnames, so no dict or ``OrderedDict`` is built per record. Records
+    of the same key must be of the same record type, or one of a record
+    type and the other of its ``_lazytype()``.
+
+    Example::
+
+        >>> from reck import diff
+        >>> Row = recktype('Row', 'id name qty')
+        >>> old = [Row(1, 'a', 5), Row(2, 'b', 1)]
+        >>> new = [Row(1, 'a', 6), Row(3, 'c', 2)]
+        >>> for change in diff(old, new):
+        ...     print(change.kind, change.key, change.fields)
+        change 1 ('qty',)
+        insert 3 None
+        delete 2 None
+
+    By default, the old records are held in a dict keyed by *key* while the
+    new records are streamed. With *presorted* set to ``True``, both
+    iterables must be sorted by key, and they are merged in a single pass in
+    constant memory. This mode suits snapshots that do not fit in memory,
+    such as the output of ``reck.sort()`` or ``RecordLog`` files.
+
+    With *fingerprint* set to ``True``, records are compared by a
+    fingerprint of their packed field values (see ``fingerprint()``) rather
+    than field by field. Either iterable may then hold ``(key,
+    fingerprint)`` pairs, as yielded by ``fingerprints()``, in place of
+    records. So the fingerprints of yesterday's snapshot, rather than the
+    snapshot itself, can be kept and diffed against today's snapshot.
+    Changes then have ``fields`` set to ``None``. Unless *presorted* is
+    set, only the fingerprints of the old records are held in memory, and
+    the ``old`` item of each change or delete is a ``(key, fingerprint)``
+    pair.
+
+    Keys must be unique within each iterable.
+
+    :param old: An iterable of the old records.
+    :param new: An iterable of the new records.
+    :param key: A fieldname, or a sequence of fieldnames, whose values
+        identify a record. The ``key`` of each change is the value of a
+        single key field, or a tuple of the values of several.
+    :param presorted: If ``True``, *old* and *new* are sorted by key.
+    :param fingerprint: If ``True``, compare fingerprints of the records.
+    :raises ValueError: (while iterating) if a key occurs more than once in
+        *old* or, with *presorted*, if either iterable is not sorted by key.
+    """
+    get_key = _make_key_getter(key)
+    if presorted:
+        return _diff_sorted(old, new, get_key, fingerprint)
+    return _diff_unsorted(old, new, get_key, fingerprint)
+
+
+def fingerprint(rec):
+    """
+    Return a 16-byte fingerprint of the field values of the record *rec*.
+
+    The fingerprint is a hash of the pickled tuple of field values, so equal
+    records have equal fingerprints. Values whose pickled form depends on
+    iteration order, such as sets of strings, can give different
+    fingerprints for equal records in different processes.
+    """
+    return _fingerprint_values(rec._values_getter(rec))
+
+
+def fingerprints(records, key=('id',)):
+    """
+    Yield a ``(key, fingerprint)`` pair for each record in the iterable
+    *records*, e.g. to be stored and later passed to ``diff()`` in place of
+    the records.
+    """
+    get_key = _make_key_getter(key)
+    for rec in records:
+        yield get_key(rec), fingerprint(rec)
+
+
+def _fingerprint_values(values):
+    """
+    Return a fingerprint of the picklable object *values*.
+    """
+    data = pickle.dumps(values, _FINGERPRINT_PROTOCOL)
+    return hashlib.sha1(data).digest()[:_FINGERPRINT_SIZE]
+
+
+def _make_key_getter(key):
+    if isinstance(key, str):
+        key = (key,)
+    getter = operator.attrgetter(*key)
+
+    def get_key(item):
+        if isinstance(item, tuple):
+            # A (key, fingerprint) pair
+            return item[0]
+        return getter(item)
+    return get_key
+
+
+def _fingerprint_of(item):
+    return item[1] if isinstance(item, tuple) else fingerprint(item)
+
+
+def _changed_fields(old, new):
+    """
+    Return a tuple of the names of the fields whose values differ between
+    the records *old* and *new*, or ``None`` if their values are equal.
+    The records may be of different types, such as a record type and its
+    ``_lazytype()``.
+    """
+    old_values = old._values_getter(old)
+    new_values = new._values_getter(new)
+    if old_values == new_values:
+        return None
+    fields = tuple(
+        [fieldname for fieldname, old_value, new_value
+         in zip(new._fieldnames, old_values, new_values)
+         if old_value != new_value])
+    return fields or None
+
+
+def _compare(rec_key, old, new, fingerprint):
+    """
+    Return a ``Change`` if *old* and *new* differ, else ``None``.
+    """
+    if fingerprint:
+        if _fingerprint_of(old) != _fingerprint_of(new):
+            return Change(CHANGE, rec_key, old, new)
+        return None
+    fields = _changed_fields(old, new)
+    if fields is not None:
+        return Change(CHANGE, rec_key, old, new, fields)
+    return None
+
+
+def _diff_unsorted(old, new, get_key, fingerprint):
+    index = {}
+    for item in old:
+        rec_key = get_key(item)
+        if rec_key in index:
+            raise ValueError('duplicate key in old records: {0!r}'
+                             .format(rec_key))
+        if fingerprint:
+            item = (rec_key, _fingerprint_of(item))
+        index[rec_key] = item
+    for item in new:
+        rec_key = get_key(item)
+        old_item = index.pop(rec_key, _END)
+        if old_item is _END:
+            yield Change(INSERT, rec_key, None, item)
+            continue
+        change = _compare(rec_key, old_item, item, fingerprint)
+        if change is not None:
+            yield change
+    for rec_key, old_item in index.items():
+        yield Change(DELETE, rec_key, old_item, None)
+
+
+def _diff_sorted(old, new, get_key, fingerprint):
+    old = iter(old)
+    new = iter(new)
+    old_item, old_key = _next_keyed(old, get_key, _END, 'old')
+    new_item, new_key = _next_keyed(new, get_key, _END, 'new')
+    while old_item is not _END or new_item is not _END:
+        if new_item is _END or (old_item is not _END and old_key < new_key):
+            yield Change(DELETE, old_key, old_item, None)
+            old_item, old_key = _next_keyed(old, get_key, old_key, 'old')
+        elif old_item is _END or new_key < old_key:
+            yield Change(INSERT, new_key, None, new_item)
+            new_item, new_key = _next_keyed(new, get_key, new_key, 'new')
+        else:
+            change = _compare(new_key, old_item, new_item, fingerprint)
+            if change is not None:
+                yield change
+            old_item, old_key = _next_keyed(old, get_key, old_key, 'old')
+            new_item, new_key = _next_keyed(new, get_key, new_key, 'new')
+
+
+def _next_keyed(items, get_key, previous_key, name):
+    """
+    Return the next item of the iterator *items* and its key, checking that
+    the key follows *previous_key*, or ``(_END, None)`` at the end.
+    """
+    item = next(items, _END)
+    if item is _END:
+        return _END, None
+    rec_key = get_key(item)
+    if previous_key is not _END and not previous_key < rec_key:
+        raise ValueError('{0} records are not sorted by unique key: {1!r} '
+                         'follows {2!r}'.format(name, rec_key, previous_key))
+    return item, rec_key
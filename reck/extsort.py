@@ -0,0 +1,312 @@
+"""
+This module implements the sort() function for sorting streams of records
+that are too large to fit in memory.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import heapq
+import io
+import itertools
+import operator
+import re
+import sys
+import tempfile
+
+from .codec import RecordCodec
+
+# Run files are written in large blocks, and read in blocks of a share of
+# the memory limit between these sizes
+_BUFFER_SIZE = 1 << 20
+_MIN_BUFFER_SIZE = 1 << 16
+
+# At most this many runs are merged at once, so that a merge holds a bounded
+# number of files and read buffers. More runs are merged in several passes.
+_MAX_MERGE_RUNS = 64
+
+_MEMORY_UNITS = {
+    '': 1, 'B': 1,
+    'K': 1024, 'KB': 1024,
+    'M': 1024 ** 2, 'MB': 1024 ** 2,
+    'G': 1024 ** 3, 'GB': 1024 ** 3,
+}
+
+
+def sort(records, key=None, reverse=False, memory_limit='256MB',
+         tempdir=None):
+    """
+    Sort an iterable of records using a bounded amount of memory.
+
+    Records are read from *records* into sorted runs. Whenever a run reaches
+    *memory_limit*, it is spilled to a temporary file using a compact
+    per-type encoding (see ``reck.codec.RecordCodec``). The runs are then
+    merged back together, so the result is returned as a generator of
+    records rather than a list. If every record fits in a single run nothing
+    is written to disk. Like ``sorted()``, the sort is stable.
+
+    At most 64 runs are merged at once, with read buffers sharing
+    *memory_limit* between them. Whenever 64 runs have been spilled they are
+    merged into a single larger run, so the number of open run files grows
+    only logarithmically with the size of the input.
+
+    All records must be of the same record type.
+
+    Example::
+
+        >>> from reck import sort
+        >>> Event = recktype('Event', 'ts id payload')
+        >>> events = (Event(ts, i, None) for i, ts in enumerate([3, 1, 2]))
+        >>> [e.ts for e in sort(events, key='ts', memory_limit='64MB')]
+        [1, 2, 3]
+
+    :param records: An iterable of records.
+    :param key: The field(s) to sort by. Either a fieldname, a sequence of
+        fieldnames such as ``('ts', 'id')``, or a one-argument function as
+        used by ``sorted()``. If ``None``, records are sorted by all of their
+        fields in field order.
+    :param reverse: If ``True``, sort in descending order.
+    :param memory_limit: Approximate number of bytes of records to hold in
+        memory per sorted run. Either an integer or a string with a unit
+        suffix such as ``'512MB'``. Record sizes are estimated with
+        ``sys.getsizeof()`` so the limit is a guide, not a guarantee.
+    :param tempdir: Directory in which to create the temporary run files.
+        Defaults to the platform temporary directory.
+    :returns: An iterator yielding the records in sorted order.
+    :raises ValueError: if *memory_limit* is not a valid size or *key*
+        names a field that the records do not have.
+    """
+    # Arguments are checked when sort() is called, not on first iteration,
+    # so the first record is read here to find the record type.
+    limit = _parse_memory_limit(memory_limit)
+    records = iter(records)
+    try:
+        first = next(records)
+    except StopIteration:
+        return iter(())
+    rectype = type(first)
+    keyfunc = _make_keyfunc(rectype, key)
+    records = itertools.chain([first], records)
+    return _sort(records, rectype, keyfunc, reverse, limit, tempdir)
+
+
+def _sort(records, rectype, keyfunc, reverse, limit, tempdir):
+    codec = RecordCodec(rectype)
+
+    def merge(runfiles):
+        # Merge runs into a new run, closing them
+        try:
+            return _spill_run(
+                _merge_runs(runfiles, codec, keyfunc, reverse, limit),
+                codec, tempdir)
+        finally:
+            for runfile in runfiles:
+                runfile.close()
+
+    # Spilled runs by level: a run at level n+1 was merged from
+    # _MAX_MERGE_RUNS runs at level n. Each level's runs are in input order
+    # and are newer than the runs at higher levels, which keeps the merge
+    # stable.
+    levels = []
+    runs = []
+    try:
+        while True:
+            run, exhausted = _read_run(records, limit)
+            if not run:
+                break
+            run.sort(key=keyfunc, reverse=reverse)
+            if exhausted and not levels:
+                # The whole input fitted in memory so no merge is needed
+                for rec in run:
+                    yield rec
+                return
+            runfile = _spill_run(run, codec, tempdir)
+            del run
+            _add_run(levels, runfile, merge)
+            if exhausted:
+                break
+
+        runs = [runfile for level in reversed(levels) for runfile in level]
+        del levels[:]
+        while len(runs) > _MAX_MERGE_RUNS:
+            runs = _merge_pass(runs, merge)
+        for rec in _merge_runs(runs, codec, keyfunc, reverse, limit):
+            yield rec
+    finally:
+        for runfile in runs:
+            runfile.close()
+        for level in levels:
+            for runfile in level:
+                runfile.close()
+
+
+def _add_run(levels, runfile, merge):
+    """
+    Add the new run *runfile* to the lowest level of *levels*, merging each
+    level that fills up into a run at the level above with *merge*.
+    """
+    for level in itertools.count():
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(runfile)
+        if len(levels[level]) < _MAX_MERGE_RUNS:
+            return
+        runfile = merge(levels[level])
+        levels[level] = []
+
+
+def _merge_pass(runs, merge):
+    """
+    Merge each group of up to _MAX_MERGE_RUNS consecutive runs in *runs*
+    with *merge*, and return the list of the resulting runs.
+    """
+    merged = []
+    try:
+        for start in range(0, len(runs), _MAX_MERGE_RUNS):
+            group = runs[start:start + _MAX_MERGE_RUNS]
+            merged.append(merge(group) if len(group) > 1 else group[0])
+    except Exception:
+        for runfile in merged:
+            runfile.close()
+        raise
+    return merged
+
+
+def _read_run(records, limit):
+    """
+    Return a ``(run, exhausted)`` tuple, where *run* is a list of up to a
+    run's worth of records read from the iterator *records* and *exhausted*
+    is ``True`` if *records* ran out before the run was full.
+    """
+    try:
+        first = next(records)
+    except StopIteration:
+        return [], True
+    capacity = _run_capacity(first, limit)
+    run = [first]
+    run.extend(itertools.islice(records, capacity - 1))
+    return run, len(run) < capacity
+
+
+def _run_capacity(rec, limit):
+    """
+    Return the number of records like *rec* that fit within *limit* bytes.
+    """
+    size = sys.getsizeof(rec) + sum(sys.getsizeof(value) for value in rec)
+    return max(1, limit // size)
+
+
+def _spill_run(run, codec, tempdir):
+    """
+    Write the records of a sorted run, from the iterable *run*, to a new
+    unbuffered temporary file and return the file, positioned at its start.
+    The run is written through a buffer that is freed once it is written.
+    """
+    write = codec.write
+    runfile = tempfile.TemporaryFile(dir=tempdir, buffering=0)
+    try:
+        with io.open(runfile.fileno(), 'wb', buffering=_BUFFER_SIZE,
+                     closefd=False) as fileobj:
+            for rec in run:
+                write(fileobj, rec)
+        runfile.seek(0)
+    except Exception:
+        runfile.close()
+        raise
+    return runfile
+
+
+def _merge_runs(runfiles, codec, keyfunc, reverse, limit):
+    """
+    k-way merge the sorted runs in *runfiles*, yielding records in order.
+
+    Each run is read through a buffer of about *limit* bytes divided by the
+    number of runs.
+
+    Heap entries are ``(key, run_index, record)`` tuples. The run index
+    breaks ties between equal keys, which keeps the merge stable and means
+    records themselves are never compared.
+    """
+    wrap = _ReversedKey if reverse else _identity
+    buffer_size = max(_MIN_BUFFER_SIZE,
+                      min(_BUFFER_SIZE, limit // max(1, len(runfiles))))
+    fileobjs = [io.open(runfile.fileno(), 'rb', buffering=buffer_size,
+                        closefd=False) for runfile in runfiles]
+    readers = [codec.iter_read(fileobj) for fileobj in fileobjs]
+    try:
+        heap = []
+        for run_index, reader in enumerate(readers):
+            for rec in reader:
+                heap.append((wrap(keyfunc(rec)), run_index, rec))
+                break
+        heapq.heapify(heap)
+
+        while heap:
+            _, run_index, rec = heap[0]
+            yield rec
+            for nextrec in readers[run_index]:
+                heapq.heapreplace(
+                    heap, (wrap(keyfunc(nextrec)), run_index, nextrec))
+                break
+            else:
+                heapq.heappop(heap)
+    finally:
+        for fileobj in fileobjs:
+            fileobj.close()
+
+
+def _make_keyfunc(rectype, key):
+    """
+    Return a one-argument key function for *key*, which may be ``None``, a
+    fieldname, a sequence of fieldnames or a callable.
+    """
+    if key is None:
+        return rectype._values_getter
+    if callable(key):
+        return key
+    if isinstance(key, str):
+        key = (key,)
+    for fieldname in key:
+        if fieldname not in rectype._fieldnames_set:
+            raise ValueError(
+                'sort key {0!r} does not match a field'.format(fieldname))
+    return operator.attrgetter(*key)
+
+
+def _parse_memory_limit(limit):
+    """
+    Return *limit* in bytes. *limit* may be an integer number of bytes or a
+    string such as ``'512MB'`` or ``'1.5G'``.
+    """
+    if isinstance(limit, int):
+        nbytes = limit
+    else:
+        match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*$',
+                         str(limit), re.IGNORECASE)
+        if match is None:
+            raise ValueError('invalid memory limit: {0!r}'.format(limit))
+        number, unit = match.groups()
+        nbytes = int(float(number) * _MEMORY_UNITS[unit.upper()])
+    if nbytes <= 0:
+        raise ValueError('memory limit must be positive: {0!r}'.format(limit))
+    return nbytes
+
+
+def _identity(value):
+    return value
+
+
+class _ReversedKey(object):
+    """
+    Wrap a sort key so that it compares in reverse order.
+    """
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return other.key < self.key
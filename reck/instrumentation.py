@@ -0,0 +1,215 @@
+"""
+This module implements opt-in runtime instrumentation of record types, which
+counts and times calls to the main record methods and samples the memory
+used by record instances.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import functools
+import sys
+import threading
+import time
+import weakref
+
+from . import reck as _reck
+
+# The record methods that are wrapped when instrumentation is enabled
+INSTRUMENTED_METHODS = (
+    '__init__', '_update', '__getitem__', '__setitem__', '_asdict',
+    '__getstate__', '__setstate__')
+
+_lock = threading.RLock()
+_enabled = False
+_sample_every = 100
+# Original methods of each instrumented record type, restored on disable
+_originals = weakref.WeakKeyDictionary()
+# Statistics keyed by '<module>.<typename>'
+_stats = {}
+
+
+def instrument(enable=True, sample_every=100):
+    """
+    Enable or disable instrumentation of all record types.
+
+    While enabled, calls to the ``__init__``, ``_update``, ``__getitem__``,
+    ``__setitem__``, ``_asdict``, ``__getstate__`` and ``__setstate__``
+    methods of every record type (including types created later) are
+    counted and timed. The memory used by every *sample_every*-th record
+    created is also sampled. The results are returned by ``stats()``.
+
+    Instrumentation works by replacing the methods of each record type with
+    wrappers. Disabling it restores the original methods, so there is no
+    overhead when instrumentation is off.
+
+    Example::
+
+        >>> import reck
+        >>> reck.instrument()
+        >>> Point = recktype('Point', 'x y')
+        >>> p = Point(1, 2)
+        >>> reck.stats()['__main__.Point']['calls']['__init__']
+        1
+        >>> reck.instrument(False)
+
+    :param enable: ``True`` to enable instrumentation, ``False`` to disable
+        it.
+    :param sample_every: Sample the size of one in every *sample_every*
+        records created.
+    :raises ValueError: if *sample_every* is less than 1.
+    """
+    global _enabled, _sample_every
+    if sample_every < 1:
+        raise ValueError(
+            'sample_every must be a positive integer: {0!r}'
+            .format(sample_every))
+    with _lock:
+        _sample_every = sample_every
+        if enable and not _enabled:
+            for rectype in list(_reck._rectypes):
+                _instrument_rectype(rectype)
+            _reck._rectype_hooks.append(_instrument_rectype)
+        elif not enable and _enabled:
+            _reck._rectype_hooks.remove(_instrument_rectype)
+            for rectype, originals in list(_originals.items()):
+                for name, method in originals.items():
+                    setattr(rectype, name, method)
+            _originals.clear()
+        _enabled = enable
+
+
+def stats(reset=False):
+    """
+    Return the statistics gathered while instrumentation was enabled.
+
+    The statistics are returned as a dict keyed by the record type's
+    ``'<module>.<typename>'``. Record types with the same module and name
+    share one entry. Each entry is a dict with the following items:
+
+    * ``'calls'``: dict mapping each instrumented method name to the number
+      of times it was called.
+    * ``'seconds'``: dict mapping each instrumented method name to the
+      total time spent in it, in seconds.
+    * ``'size_samples'``: the number of records whose size was sampled.
+    * ``'mean_size'``: the mean size in bytes of the sampled records,
+      computed as ``sys.getsizeof()`` of the record plus that of each of its
+      field values, or ``None`` if no records were sampled.
+
+    The returned dict is a copy, so it is safe to pass on to a metrics
+    exporter.
+
+    :param reset: If ``True``, clear the statistics after returning them.
+    """
+    with _lock:
+        report = dict(
+            (key, typestats.report()) for key, typestats in _stats.items())
+        if reset:
+            _stats.clear()
+    return report
+
+
+def _instrument_rectype(rectype):
+    """
+    Replace the instrumented methods of *rectype* with timing wrappers.
+    """
+    with _lock:
+        if rectype in _originals:
+            return
+        key = '{0}.{1}'.format(rectype.__module__, rectype.__name__)
+        typestats = _stats.get(key)
+        if typestats is None:
+            typestats = _stats[key] = _TypeStats()
+        originals = {}
+        for name in INSTRUMENTED_METHODS:
+            method = rectype.__dict__.get(name)
+            if method is None:
+                continue
+            originals[name] = method
+            if name == '__init__':
+                wrapper = _wrap_init(method, typestats)
+            else:
+                wrapper = _wrap(method, name, typestats)
+            setattr(rectype, name, wrapper)
+        _originals[rectype] = originals
+
+
+def _wrap(method, name, typestats):
+    """
+    Return a wrapper for *method* that records its calls in *typestats*.
+    """
+    timer = time.perf_counter
+    record = typestats.record
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = timer()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            record(name, timer() - start)
+    return wrapper
+
+
+def _wrap_init(method, typestats):
+    """
+    Return a wrapper for ``__init__`` that records its calls in *typestats*
+    and samples the size of the records created.
+    """
+    timer = time.perf_counter
+    record = typestats.record
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = timer()
+        try:
+            method(self, *args, **kwargs)
+        finally:
+            calls = record('__init__', timer() - start)
+        if calls % _sample_every == 1 or _sample_every == 1:
+            typestats.sample(self)
+    return wrapper
+
+
+class _TypeStats(object):
+    """
+    Call counts, call times and size samples for one record type.
+    """
+    def __init__(self):
+        self.calls = dict((name, 0) for name in INSTRUMENTED_METHODS)
+        self.seconds = dict((name, 0.0) for name in INSTRUMENTED_METHODS)
+        self.size_samples = 0
+        self.total_size = 0
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        """
+        Record a call to method *name* that took *seconds* and return the
+        number of calls to the method so far.
+        """
+        with self._lock:
+            calls = self.calls[name] = self.calls[name] + 1
+            self.seconds[name] += seconds
+        return calls
+
+    def sample(self, rec):
+        """
+        Add the size of the record *rec* to the size samples.
+        """
+        getsizeof = sys.getsizeof
+        size = getsizeof(rec)
+        for fieldname in rec._fieldnames:
+            size += getsizeof(getattr(rec, fieldname, None))
+        with self._lock:
+            self.size_samples += 1
+            self.total_size += size
+
+    def report(self):
+        with self._lock:
+            return {
+                'calls': dict(self.calls),
+                'seconds': dict(self.seconds),
+                'size_samples': self.size_samples,
+                'mean_size': (self.total_size / self.size_samples
+                              if self.size_samples else None),
+            }
@@ -0,0 +1,251 @@
+"""
+This module implements parse_parallel(), which parses a large text file of
+records in parallel worker processes.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import collections
+import concurrent.futures
+import csv
+import io
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+
+from .batch import ColumnBatch
+from .extsort import _parse_memory_limit
+from .reck import _rectype_ref, _resolve_rectype_ref
+
+# Formats supported by parse_parallel()
+FORMATS = ('csv', 'jsonl', 'fixed')
+
+
+def parse_parallel(path, rectype, format='csv', workers=None, columns=False,
+                   chunk_size='64MB', header=False, widths=None,
+                   encoding='utf-8', **fmtparams):
+    """
+    Parse the text file at *path* into records of type *rectype* using a
+    pool of worker processes.
+
+    The file is split into byte ranges of about *chunk_size* bytes, each
+    ending at a line boundary, and each range is parsed by a worker that
+    reads it through ``mmap``. Workers return their range as a compact
+    ``ColumnBatch``, with field converters already applied, so little data
+    is pickled between processes. Batches are returned in file order, and
+    only a few more ranges than there are workers are in flight at once, so
+    memory use does not grow with the size of the file.
+
+    Example::
+
+        >>> from reck import parse_parallel
+        >>> Trade = recktype('Trade', 'id sym qty',
+        ...                  converters={'id': int, 'qty': int})
+        >>> for trade in parse_parallel('trades.csv', Trade, header=True):
+        ...     handle(trade)
+
+    Supported formats:
+
+    * ``'csv'``: CSV rows of field values in field order. Quoted values must
+      not contain newlines, since ranges are split at any newline.
+    * ``'jsonl'``: one JSON object (mapping fieldnames to values) or array
+      (of values in field order) per line.
+    * ``'fixed'``: fixed-width text lines, split into one column per field
+      by the layout declared with *rectype*'s ``_fixed_layout()`` or, if
+      given, *widths*. Values are stripped of surrounding whitespace.
+
+    Blank lines are skipped. *rectype* and its field converters must be
+    picklable (e.g. module-level functions rather than lambdas) so that they
+    can be sent to the workers.
+
+    :param path: Path of the file to parse.
+    :param rectype: The record type to build.
+    :param format: One of ``'csv'``, ``'jsonl'`` or ``'fixed'``.
+    :param workers: The number of worker processes. Defaults to the number
+        of CPUs. If 1, the file is parsed in the current process.
+    :param columns: If ``True``, return an iterator of ``ColumnBatch``
+        objects, one per byte range, instead of an iterator of records.
+    :param chunk_size: The approximate size of each byte range, as a number
+        of bytes or a string such as ``'64MB'``.
+    :param header: If ``True``, skip the first line of the file.
+    :param widths: A sequence of contiguous column widths in characters, one
+        per field, for the ``'fixed'`` format. Only needed if *rectype* has
+        no fixed-width layout.
+    :param encoding: The text encoding of the file.
+    :param **fmtparams: Formatting parameters passed to ``csv.reader()``.
+    :returns: An iterator over records, or over ``ColumnBatch`` objects if
+        *columns* is ``True``.
+    :raises ValueError: if *format* is not supported, *widths* does not
+        have one width per field or is needed but not given, or (while
+        iterating) a line does not match *rectype*.
+    """
+    if format not in FORMATS:
+        raise ValueError('unsupported format {0!r}, expected one of {1!r}'
+                         .format(format, FORMATS))
+    slices = None
+    if format == 'fixed':
+        slices = _make_slices(rectype, widths)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers < 1:
+        raise ValueError('workers must be a positive integer: {0!r}'
+                         .format(workers))
+    ranges = _split_ranges(path, _parse_memory_limit(chunk_size), header)
+    ref = _rectype_ref(rectype)
+    tasks = [(path, start, end, ref, format, slices, encoding, fmtparams)
+             for start, end in ranges]
+    batches = _iter_batches(tasks, workers)
+    if columns:
+        return batches
+    return itertools.chain.from_iterable(
+        batch.records() for batch in batches)
+
+
+def _iter_batches(tasks, workers):
+    """
+    Yield the ``ColumnBatch`` parsed from each task, in task order.
+    """
+    if workers == 1 or len(tasks) < 2:
+        for task in tasks:
+            yield _parse_range(*task)
+        return
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        try:
+            for task in tasks:
+                pending.append(executor.submit(_parse_range, *task))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _split_ranges(path, chunk_size, header):
+    """
+    Return a list of ``(start, end)`` byte ranges of the file at *path*, each
+    about *chunk_size* bytes and ending just after a newline or at the end of
+    the file.
+    """
+    size = os.path.getsize(path)
+    if not size:
+        return []
+    ranges = []
+    with open(path, 'rb') as fileobj:
+        buf = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            if header:
+                newline = buf.find(b'\n')
+                start = size if newline < 0 else newline + 1
+            while start < size:
+                newline = buf.find(b'\n', start + chunk_size - 1)
+                end = size if newline < 0 else newline + 1
+                ranges.append((start, end))
+                start = end
+        finally:
+            buf.close()
+    return ranges
+
+
+def _make_slices(rectype, widths):
+    """
+    Return a tuple of one slice per field of *rectype* for the fixed-width
+    column *widths*.
+    """
+    if widths is None:
+        if rectype._fixed_plan is None:
+            raise ValueError(
+                "widths or a fixed-width layout (see _fixed_layout()) are "
+                "required for the 'fixed' format")
+        return rectype._fixed_plan.slices
+    widths = list(widths)
+    if len(widths) != rectype._nfields:
+        raise ValueError('expected {0} widths but {1} were given'
+                         .format(rectype._nfields, len(widths)))
+    slices = []
+    start = 0
+    for width in widths:
+        slices.append(slice(start, start + width))
+        start += width
+    return tuple(slices)
+
+
+def _parse_range(path, start, end, ref, format, slices, encoding, fmtparams):
+    """
+    Parse the byte range *start* to *end* of the file at *path* and return a
+    compacted ``ColumnBatch``. Runs in a worker process.
+    """
+    rectype = _resolve_rectype_ref(ref)
+    with open(path, 'rb') as fileobj:
+        buf = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            text = buf[start:end].decode(encoding)
+        finally:
+            buf.close()
+
+    if format == 'jsonl':
+        columns = _parse_jsonl(rectype, text)
+    else:
+        if format == 'csv':
+            columns = _parse_csv(rectype, text, fmtparams)
+        else:
+            columns = _parse_fixed_width(text, slices)
+        converters = rectype._converters
+        if converters:
+            columns = [
+                column if converters.get(fieldname) is None
+                else list(map(converters[fieldname], column))
+                for fieldname, column in zip(rectype._fieldnames, columns)]
+    return ColumnBatch(rectype, columns).compact()
+
+
+def _parse_csv(rectype, text, fmtparams):
+    nfields = rectype._nfields
+    rows = []
+    for row in csv.reader(io.StringIO(text, newline=''), **fmtparams):
+        if not row:
+            continue
+        if len(row) != nfields:
+            raise ValueError('expected {0} values but row {1!r} has {2}'
+                             .format(nfields, row, len(row)))
+        rows.append(row)
+    return _transpose(rows, nfields)
+
+
+def _parse_jsonl(rectype, text):
+    # Records are built so that defaults and converters are applied, as
+    # when calling the record type.
+    make = rectype._make
+    values_getter = rectype._values_getter
+    loads = json.loads
+    rows = []
+    for line in text.split('\n'):
+        if not line.strip():
+            continue
+        value = loads(line)
+        if isinstance(value, dict):
+            rows.append(values_getter(rectype(**value)))
+        else:
+            rows.append(values_getter(make(value)))
+    return _transpose(rows, rectype._nfields)
+
+
+def _parse_fixed_width(text, slices):
+    lines = [line.rstrip('\r') for line in text.split('\n')]
+    lines = [line for line in lines if line.strip()]
+    return [[line[column].strip() for line in lines] for column in slices]
+
+
+def _transpose(rows, nfields):
+    """
+    Return the list of *rows* as a list of *nfields* columns.
+    """
+    if not rows:
+        return [[] for _ in range(nfields)]
+    return [list(column) for column in zip(*rows)]
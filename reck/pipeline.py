@@ -0,0 +1,332 @@
+"""
+This module implements pipeline(), which chains map, filter and projection
+stages over a stream of records and runs them one batch at a time.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import itertools
+import queue
+import threading
+
+# Marks the end of the batches passed between threads
+_END = object()
+
+
+def pipeline(source, batch_size=1024):
+    """
+    Return a new ``Pipeline`` reading records (or any other items) from the
+    iterable *source*.
+
+    Example::
+
+        >>> from reck import pipeline
+        >>> Reading = recktype('Reading', 'sensor ts value unit')
+        >>> readings = (Reading('s1', ts, ts * 0.5, 'C') for ts in range(10))
+        >>> for rec in (pipeline(readings)
+        ...             .filter(lambda r: r.value > 3)
+        ...             .project('ts', 'value')):
+        ...     print(rec)
+        ReadingProjection(ts=7, value=3.5)
+        ReadingProjection(ts=8, value=4.0)
+        ReadingProjection(ts=9, value=4.5)
+
+    :param source: An iterable of records.
+    :param batch_size: The number of items read from *source* and passed
+        through the stages at a time.
+    """
+    return Pipeline(source, batch_size)
+
+
+class Pipeline(object):
+    """
+    A chain of processing stages over a stream of records.
+
+    Stages are added by the ``map()``, ``filter()`` and ``project()``
+    methods, each of which returns a new pipeline. Nothing is processed until
+    the pipeline is iterated. Items are then read from the source in batches
+    and every stage is applied to a whole batch at once, with consecutive
+    stages fused into a single pass of nested ``map()``/``filter()``
+    iterators. This avoids both the per-item overhead of a chain of
+    generators and building a list per stage.
+
+    Iterating a pipeline yields items, or lists of items if ``batch()`` was
+    called. ``threaded()`` runs the pipeline so far in a background thread,
+    and ``sink()`` passes the output batches to a function, optionally in a
+    background thread. Both threads communicate through a bounded queue.
+
+    Use ``pipeline()`` to create a pipeline.
+    """
+    def __init__(self, source, batch_size=1024, stages=(),
+                 output_batch_size=None, batched_source=False):
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer: {0!r}'
+                             .format(batch_size))
+        self._source = source
+        self._batch_size = batch_size
+        self._stages = tuple(stages)
+        self._output_batch_size = output_batch_size
+        self._batched_source = batched_source
+
+    def map(self, fn):
+        """
+        Return a new pipeline that applies *fn* to each item.
+        """
+        return self._add_stage(map, fn)
+
+    def filter(self, pred):
+        """
+        Return a new pipeline that only keeps items for which *pred* returns
+        a true value.
+        """
+        return self._add_stage(filter, pred)
+
+    def project(self, *fieldnames):
+        """
+        Return a new pipeline that converts each record into a record of a
+        derived type with only the given fields.
+
+        The derived type and its converter are obtained from the
+        ``_project()`` method of each source record type, once per type.
+
+        :raises ValueError: if no fieldnames are given.
+        """
+        if not fieldnames:
+            raise ValueError('at least one fieldname is required')
+        return self._add_stage(map, _Projector(fieldnames))
+
+    def batch(self, size):
+        """
+        Return a new pipeline that yields lists of *size* items (the last
+        list may be shorter) instead of individual items. Items are also read
+        from the source in batches of *size*.
+        """
+        if size < 1:
+            raise ValueError('batch size must be a positive integer: {0!r}'
+                             .format(size))
+        return Pipeline(self._source, size, self._stages, size,
+                        self._batched_source)
+
+    def threaded(self, maxsize=8):
+        """
+        Return a new pipeline that runs this pipeline in a background thread.
+
+        Processed batches are passed to the consuming thread through a queue
+        holding at most *maxsize* batches, so a slow consumer blocks the
+        background thread rather than letting batches pile up. This lets an
+        I/O-bound source, such as a socket or file reader, run concurrently
+        with the stages that follow.
+        """
+        return Pipeline(
+            _ThreadedBatches(self._batches, maxsize), self._batch_size,
+            output_batch_size=self._output_batch_size, batched_source=True)
+
+    def sink(self, fn, maxsize=0):
+        """
+        Run the pipeline, passing each output batch (a list of items) to
+        *fn*, and return the total number of items.
+
+        :param fn: A function called with each batch, e.g. a function that
+            writes records to a database.
+        :param maxsize: If greater than zero, *fn* is called in a background
+            thread that is fed through a queue of at most *maxsize* batches,
+            so that an I/O-bound *fn* runs concurrently with the pipeline.
+            Otherwise *fn* is called in the current thread.
+        """
+        if maxsize <= 0:
+            count = 0
+            for batch in self._output_batches():
+                fn(batch)
+                count += len(batch)
+            return count
+        worker = _ThreadedSink(fn, maxsize)
+        count = 0
+        try:
+            for batch in self._output_batches():
+                worker.put(batch)
+                count += len(batch)
+        finally:
+            worker.close()
+        return count
+
+    def __iter__(self):
+        if self._output_batch_size is not None:
+            return self._output_batches()
+        return itertools.chain.from_iterable(self._batches())
+
+    def __repr__(self):
+        return '<Pipeline with {0} stages>'.format(len(self._stages))
+
+    def _add_stage(self, kind, fn):
+        return Pipeline(
+            self._source, self._batch_size, self._stages + ((kind, fn),),
+            self._output_batch_size, self._batched_source)
+
+    def _batches(self):
+        """
+        Yield non-empty lists of processed items.
+        """
+        if self._batched_source:
+            chunks = iter(self._source)
+        else:
+            source = iter(self._source)
+            size = self._batch_size
+            chunks = iter(
+                lambda: list(itertools.islice(source, size)), [])
+        stages = self._stages
+        for chunk in chunks:
+            items = chunk
+            for kind, fn in stages:
+                items = kind(fn, items)
+            if stages:
+                items = list(items)
+            if items:
+                yield items
+
+    def _output_batches(self):
+        """
+        Yield processed items in lists of the output batch size (or as they
+        come if no output batch size was set).
+        """
+        size = self._output_batch_size
+        if size is None:
+            for batch in self._batches():
+                yield batch
+            return
+        pending = []
+        for batch in self._batches():
+            if not pending and len(batch) == size:
+                yield batch
+                continue
+            pending.extend(batch)
+            while len(pending) >= size:
+                yield pending[:size]
+                del pending[:size]
+        if pending:
+            yield pending
+
+
+class _Projector(object):
+    """
+    Callable converting records into records of a derived type with a subset
+    of their fields. The derived type and converter are cached per source
+    record type.
+    """
+    def __init__(self, fieldnames):
+        self._fieldnames = tuple(fieldnames)
+        self._converters = {}
+
+    def __call__(self, rec):
+        try:
+            convert = self._converters[type(rec)]
+        except KeyError:
+            convert = self._converters[type(rec)] = self._make_converter(
+                type(rec))
+        return convert(rec)
+
+    def _make_converter(self, rectype):
+        return rectype._project(*self._fieldnames)[1]
+
+
+class _ThreadedBatches(object):
+    """
+    Iterable that runs a batch generator function in a background thread and
+    yields its batches through a bounded queue.
+    """
+    def __init__(self, batches, maxsize):
+        self._batches = batches
+        self._maxsize = maxsize
+
+    def __iter__(self):
+        batch_queue = queue.Queue(self._maxsize)
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                for batch in self._batches():
+                    if not _put(batch_queue, batch, stopped):
+                        return
+            except BaseException as exc:
+                _put(batch_queue, _Failure(exc), stopped)
+            else:
+                _put(batch_queue, _END, stopped)
+
+        thread = threading.Thread(target=produce, name='reck-pipeline')
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                batch = batch_queue.get()
+                if batch is _END:
+                    return
+                if isinstance(batch, _Failure):
+                    raise batch.exc
+                yield batch
+        finally:
+            stopped.set()
+            thread.join()
+
+
+class _ThreadedSink(object):
+    """
+    Calls a function with each batch put to it, in a background thread fed
+    through a bounded queue.
+    """
+    def __init__(self, fn, maxsize):
+        self._queue = queue.Queue(maxsize)
+        self._fn = fn
+        self._failure = None
+        self._thread = threading.Thread(target=self._consume,
+                                        name='reck-pipeline-sink')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, batch):
+        if self._failure is not None:
+            raise self._failure.exc
+        self._queue.put(batch)
+
+    def close(self):
+        """
+        Wait for the queued batches to be consumed and re-raise any exception
+        raised by the sink function.
+        """
+        self._queue.put(_END)
+        self._thread.join()
+        if self._failure is not None:
+            raise self._failure.exc
+
+    def _consume(self):
+        while True:
+            batch = self._queue.get()
+            if batch is _END:
+                return
+            if self._failure is None:
+                try:
+                    self._fn(batch)
+                except BaseException as exc:
+                    # Keep draining the queue so that put() never blocks
+                    self._failure = _Failure(exc)
+
+
+class _Failure(object):
+    """
+    Wraps an exception raised in a background thread.
+    """
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _put(batch_queue, item, stopped):
+    """
+    Put *item* on *batch_queue*, giving up if *stopped* is set while the
+    queue is full. Return ``True`` if the item was put.
+    """
+    while not stopped.is_set():
+        try:
+            batch_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
@@ -8,17 +8,44 @@ per-field defaults.
 """
 
 import collections
+import copy
+import copyreg
+import hashlib
 import keyword
 import operator
 import sys
+import uuid
+import weakref
 
 __license__ = 'BSD 3-clause'
 __version__ = '0.0.0'
 __author__ = 'Mark Richards'
 __email__ = 'mark.l.a.richardsREMOVETHIS@gmail.com'
 
+# Process-local registry mapping schema IDs to record types. Used to find (or
+# recreate) the record type when unpickling records whose type could not be
+# pickled by reference.
+_registry = weakref.WeakValueDictionary()
 
-def recktype(typename, fieldnames, rename=False):
+# Process-local registry mapping the unique token of each record type to the
+# type. Unlike schema IDs, tokens tell apart record types with the same
+# schema, so records unpickled in the process that pickled them keep their
+# type.
+_tokens = weakref.WeakValueDictionary()
+
+# Every record type created, plus functions called with each new record type
+# (used to instrument types created while instrumentation is enabled).
+_rectypes = weakref.WeakSet()
+_rectype_hooks = []
+
+# Valid keys of the per-field options mapping
+_FIELD_OPTIONS = frozenset(['intern', 'converter'])
+
+# Maximum number of distinct non-string values held by a type's intern table
+_INTERN_TABLE_MAXSIZE = 1 << 16
+
+
+def recktype(typename, fieldnames, rename=False, intern=(), converters=None):
     """
     Create a new record class with fields accessible by named attributes.
 
@@ -54,15 +81,45 @@ def recktype(typename, fieldnames, rename=False):
 
         A fieldname may be any valid Python identifier except for names
         starting with an underscore.
+
+        Per-field options can be given with a 3-tuple of the form
+        ``(fieldname, default_value, options)``, where *options* is a
+        mapping with any of the following keys:
+
+        * ``'intern'``: if true, the field's values are interned (see
+          *intern*), e.g. ``('country', None, {'intern': True})``.
+        * ``'converter'``: a function that every value assigned to the field
+          is passed through, by instantiation, ``_update()``, attribute or
+          index assignment. It can convert the value (e.g. ``int``) or
+          validate it by raising an exception. As a shorthand, the options
+          can be replaced by the converter itself, e.g. ``('port', 0, int)``.
+          Default values are trusted and are not passed through the
+          converter. Converters can be bypassed when loading trusted data with
+          ``_make(values, convert=False)``.
     :param rename: If set to ``True``, invalid fieldnames are automatically
         replaced with positional names. For example,
         ('abc', 'def', 'ghi', 'abc') is converted to
         ('abc', '_1', 'ghi', '_3'), eliminating the keyword 'def' and the
         duplicate fieldname 'abc'.
+    :param intern: A sequence of fieldnames whose values are interned.
+        Every value assigned to an interned field is replaced by an
+        identical value held in a per-type intern table, so that records
+        share one object per distinct value rather than each holding its own
+        copy. Strings are interned with ``sys.intern()``. Other hashable
+        values are kept in a table of bounded size. Unhashable values are
+        stored unchanged. Interning saves memory for fields with few
+        distinct values, such as a country or status, at the cost of slower
+        assignment to those fields.
+    :param converters: A mapping of fieldnames to converter functions (see
+        the ``'converter'`` field option). Unlike a field option, this can
+        give a converter to a field without a default value, e.g.
+        ``recktype('Host', 'name port', converters={'port': int})``.
     :returns: A subclass of of collections.Sequence named *typename*.
     :raises ValueError: if *typename* is invalid; *fieldnames* contains
         an invalid fieldname and rename is ``False``; *fieldnames*
-        contains a sequence that is not length 2.
+        contains a sequence that is not length 2 or 3, or invalid field
+        options; *intern* or *converters* contains a name that is not a
+        fieldname, or a converter that is not callable.
     :raises TypeError: if a fieldname is neither a string or a sequence.
     """
     _validate_typename(typename)
@@ -72,8 +129,31 @@ def recktype(typename, fieldnames, rename=False):
     elif isinstance(fieldnames, str):
         fieldnames = fieldnames.replace(',', ' ').split()
 
-    fieldnames, defaults = _parse_fieldnames(fieldnames, rename)
+    fieldnames, defaults, field_options = _parse_fieldnames(
+        fieldnames, rename)
     default_factory_fields = _get_default_factory_fields(defaults)
+    for fieldname in intern:
+        if fieldname not in fieldnames:
+            raise ValueError(
+                'intern field {0!r} does not match a field'.format(fieldname))
+        field_options.setdefault(fieldname, {})['intern'] = True
+    for fieldname, converter in (converters or {}).items():
+        if fieldname not in fieldnames:
+            raise ValueError(
+                'converter field {0!r} does not match a field'
+                .format(fieldname))
+        if not callable(converter):
+            raise ValueError(
+                'converter for field {0!r} is not callable: {1!r}'
+                .format(fieldname, converter))
+        field_options.setdefault(fieldname, {})['converter'] = converter
+    intern_fields = frozenset(
+        [fieldname for fieldname, options in field_options.items()
+         if options.get('intern')])
+    converters = dict(
+        [(fieldname, options['converter'])
+         for fieldname, options in field_options.items()
+         if options.get('converter') is not None])
 
     # Create the __dict__ of the new record type:
     # The new type is composed from module-level functions rather than
@@ -90,6 +170,23 @@ def recktype(typename, fieldnames, rename=False):
         _replace_defaults=_replace_defaults,
         _asdict=_asdict,
         _asitems=_asitems,
+        _copy=_copy,
+        _copy_many=_copy_many,
+        _replace=_replace,
+        _view=_view,
+        _make=_make,
+        _lazytype=_lazytype,
+        _project=_project,
+        _project_many=_project_many,
+        _projections={},  # Cache of derived types created by _project()
+        _to_numpy=_to_numpy,
+        _from_numpy=_from_numpy,
+        _fixed_layout=_fixed_layout,
+        _fixed_plan=None,  # Set by _fixed_layout()
+        _parse_fixed=_parse_fixed,
+        _read_fixed=_read_fixed,
+        _format_fixed=_format_fixed,
+        _write_fixed=_write_fixed,
         # Need to set _count and _index to the baseclass implementation in case
         # a fieldname attribute overwrites count or index
         _count=collections.Sequence.count,
@@ -107,7 +204,15 @@ def recktype(typename, fieldnames, rename=False):
         # across platforms and python verions
         _attr_getters=tuple(
             [operator.attrgetter(field) for field in fieldnames]),
+        # Returns a tuple of all field values in a single C-level call
+        _values_getter=_make_values_getter(fieldnames),
+        # Cache of values getters for slices, keyed by slice.indices()
+        _slice_getters={},
         _defaults=defaults,
+        _field_options=field_options,
+        _intern_fields=intern_fields,
+        _intern_table=_InternTable() if intern_fields else None,
+        _converters=converters,
         _check_args=_check_args,
 
         # Special methods
@@ -116,6 +221,9 @@ def recktype(typename, fieldnames, rename=False):
         __ne__=__ne__,
         __getstate__=__getstate__,
         __setstate__=__setstate__,
+        __reduce__=__reduce__,
+        __copy__=_copy,
+        __deepcopy__=__deepcopy__,
         __repr__=__repr__,
         __str__=__str__,
 
@@ -127,6 +235,40 @@ def recktype(typename, fieldnames, rename=False):
 
     rectype = type(typename, (collections.Sequence,), type_dct)
 
+    # Keep the slot (member) descriptors that store the field values. Fields
+    # that convert or intern assigned values are then given a property which
+    # wraps the slot descriptor. _trusted_setters set each field without
+    # conversion (but still interned) for _make(values, convert=False).
+    rectype._slot_descriptors = tuple(
+        [rectype.__dict__[fieldname] for fieldname in fieldnames])
+    # Inherited by lazy types, so that their records compare equal to
+    # records of this type
+    rectype._base_rectype = rectype
+    trusted_setters = []
+    for fieldname, slot in zip(fieldnames, rectype._slot_descriptors):
+        intern_table = (rectype._intern_table if fieldname in intern_fields
+                        else None)
+        transform = _compose(converters.get(fieldname), intern_table)
+        if transform is not None:
+            setattr(rectype, fieldname, _make_field_property(slot, transform))
+        if intern_table is None:
+            trusted_setters.append(slot.__set__)
+        else:
+            trusted_setters.append(
+                _make_field_property(slot, intern_table).__set__)
+    rectype._trusted_setters = tuple(trusted_setters)
+    # Copies are filled straight from the slots of the original record,
+    # whose values have already been converted and interned.
+    rectype._slot_setters = tuple(
+        [slot.__set__ for slot in rectype._slot_descriptors])
+    # Integer indexing reads the slots directly, skipping attribute lookup
+    # and the properties of converted or interned fields. Assignment goes
+    # through the field's property, if it has one.
+    rectype._index_getters = tuple(
+        [slot.__get__ for slot in rectype._slot_descriptors])
+    rectype._index_setters = tuple(
+        [rectype.__dict__[fieldname].__set__ for fieldname in fieldnames])
+
     # Explanation from collections.namedtuple:
     # For pickling to work, the __module__ variable needs to be set to the
     # frame where the record type is created.  Bypass this step in
@@ -139,9 +281,42 @@ def recktype(typename, fieldnames, rename=False):
     except (AttributeError, ValueError):
         pass
 
+    rectype._schema_id = _make_schema_id(
+        typename, fieldnames, defaults, field_options)
+    _registry[rectype._schema_id] = rectype
+    rectype._token = uuid.uuid4().hex
+    _tokens[rectype._token] = rectype
+    _rectypes.add(rectype)
+    for hook in _rectype_hooks:
+        hook(rectype)
     return rectype
 
 
+def get_rectype(schema_id):
+    """
+    Return the record type registered in this process under *schema_id*.
+
+    Every record type is registered under its schema ID when it is created.
+    The schema ID, available as the ``_schema_id`` attribute of a record
+    type, is a fingerprint of the typename, fieldnames and default values
+    the type was created with. It is the same in every process provided the
+    ``repr()`` of each default value is stable, so it can be used to refer
+    to a record type across processes::
+
+        >>> from reck import get_rectype
+        >>> Point = recktype('Point', ['x', ('y', 0)])
+        >>> get_rectype(Point._schema_id) is Point
+        True
+
+    If several record types have the same schema, the most recently created
+    one is returned.
+
+    :param schema_id: A schema ID string.
+    :raises KeyError: if no record type with the schema ID exists.
+    """
+    return _registry[schema_id]
+
+
 def __init__(self, *values_by_field_order, **values_by_fieldname):
     """
     Return a new record object.
@@ -168,7 +343,8 @@ def __init__(self, *values_by_field_order, **values_by_fieldname):
         True
 
     If a field has not been supplied a value by an argument, its default value
-    will be used (if one has been defined).
+    will be used (if one has been defined). Default values are trusted, so
+    they are not passed through the field's converter.
 
     :param *values_by_field_order: Field values passed by field order.
     :param **kwargs: Field values passed by fieldname.
@@ -186,14 +362,14 @@ def __init__(self, *values_by_field_order, **values_by_fieldname):
     for fieldname in values_by_fieldname:
         setattr(self, fieldname, values_by_fieldname[fieldname])
 
-    for fieldname in self._fieldnames:
+    for fieldname, setter in zip(self._fieldnames, self._trusted_setters):
         if not hasattr(self, fieldname):
             if fieldname in self._defaults:
                 if fieldname in self._default_factory_fields:
                     # Call the default factory function (value)
-                    setattr(self, fieldname, self._defaults[fieldname]())
+                    setter(self, self._defaults[fieldname]())
                 else:
-                    setattr(self, fieldname, self._defaults[fieldname])
+                    setter(self, self._defaults[fieldname])
             else:
                 raise ValueError('field {0!r} is not defined'.format(fieldname))
 
@@ -230,6 +406,448 @@ def _update(self, *values_by_field_order, **values_by_fieldname):
         setattr(self, fieldname, values_by_fieldname[fieldname])
 
 
+@classmethod
+def _make(cls, iterable, convert=True):
+    """
+    Make a new record from a sequence or iterable of field values in field
+    order.
+
+    Unlike calling the record type, no argument checking is performed and
+    default values are not applied, so every field must be given a value.
+    This makes ``_make()`` a fast way to build records from trusted data,
+    such as rows read back from a file or database::
+
+        >>> Rec = recktype('Rec', 'a b c')
+        >>> Rec._make([1, 2, 3])
+        Rec(a=1, b=2, c=3)
+
+    :param iterable: Field values in field order.
+    :param convert: If ``False``, field converters are not applied. Use this
+        for bulk loads of values that are known to be valid already, e.g.
+        values read back from records of the same type.
+    :raises TypeError: if *iterable* does not contain exactly one value per
+        field.
+    """
+    values = tuple(iterable)
+    if len(values) != cls._nfields:
+        raise TypeError(
+            'expected {0} field values but {1} were given'
+            .format(cls._nfields, len(values)))
+    rec = cls.__new__(cls)
+    if convert:
+        for fieldname, value in zip(cls._fieldnames, values):
+            setattr(rec, fieldname, value)
+    else:
+        for setter, value in zip(cls._trusted_setters, values):
+            setter(rec, value)
+    return rec
+
+
+@classmethod
+def _lazytype(cls, converters=None, split=None):
+    """
+    Return a new subclass of the record type whose instances are built from
+    a raw, undecoded row and decode each field on first access.
+
+    Instances of the lazy type are created by passing a single raw row,
+    such as a list of strings from ``csv.reader``, a line of text or a
+    ``bytes`` object. Nothing is converted when the record is created.
+    When a field is first read, its raw value is looked up by field index,
+    passed through the field's converter (if it has one) and the result is
+    stored in the field's slot, so later reads are ordinary attribute
+    lookups. Fields missing from a short row are given their default value
+    when first read. Fields that are never read are never converted::
+
+        >>> Trade = recktype('Trade', ['id', 'price', 'qty', ('venue', None)])
+        >>> LazyTrade = Trade._lazytype(
+        ...     converters={'id': int, 'price': float, 'qty': int}, split=',')
+        >>> trade = LazyTrade('17,101.5,300')   # nothing is decoded yet
+        >>> trade.price                         # only 'price' is decoded
+        101.5
+        >>> trade
+        Trade(id=17, price=101.5, qty=300, venue=None)
+
+    Assigning to a field before it has been read simply replaces the raw
+    value. The lazy type is a subclass of the record type, so its instances
+    support every record operation.
+
+    :param converters: Per-field conversion functions. Either a mapping of
+        fieldnames to callables or a sequence with one callable (or
+        ``None``) per field in field order. Fields without a converter keep
+        their raw value.
+    :param split: How to split a raw row into per-field values, which
+        happens once, on first field access. Either ``None`` if rows are
+        already sequences of field values, a separator passed to the raw
+        row's ``split()`` method, or a function that takes the raw row and
+        returns a sequence of field values.
+    :returns: A subclass of the record type.
+    :raises TypeError: if a converter does not match a field, or
+        *converters* is a sequence of the wrong length.
+    """
+    if converters is None:
+        converters = (None,) * cls._nfields
+    elif isinstance(converters, collections.Mapping):
+        for fieldname in converters:
+            if fieldname not in cls._fieldnames_set:
+                raise TypeError(
+                    'converter {0!r} does not match a field'
+                    .format(fieldname))
+        converters = tuple(
+            [converters.get(fieldname) for fieldname in cls._fieldnames])
+    else:
+        converters = tuple(converters)
+        if len(converters) != cls._nfields:
+            raise TypeError(
+                'expected {0} converters but {1} were given'
+                .format(cls._nfields, len(converters)))
+
+    if split is not None and not callable(split):
+        split = operator.methodcaller('split', split)
+
+    type_dct = dict(
+        __slots__=('_raw', '_rawfields'),
+        __init__=_lazy_init,
+        __getattr__=_lazy_getattr,
+        # Unread fields have empty slots, so field reads must go through
+        # attribute lookup to reach __getattr__.
+        _index_getters=cls._attr_getters,
+        _converters=converters,
+        _split=None if split is None else staticmethod(split),
+        _field_indices=dict(
+            (fieldname, idx) for idx, fieldname in enumerate(cls._fieldnames)),
+    )
+    lazytype = type(cls.__name__, (cls,), type_dct)
+    lazytype.__module__ = cls.__module__
+    return lazytype
+
+
+def _lazy_init(self, raw):
+    """
+    Return a new lazy record wrapping the raw row *raw*.
+    """
+    if self._split is None:
+        self._rawfields = raw
+    else:
+        self._raw = raw
+
+
+def _lazy_getattr(self, name):
+    """
+    Decode, cache and return the value of field *name* from the raw row.
+
+    Only called when normal attribute lookup fails, i.e. when the field's
+    slot has not been assigned yet.
+    """
+    try:
+        idx = self._field_indices[name]
+    except KeyError:
+        raise AttributeError(
+            '{0!r} object has no attribute {1!r}'
+            .format(self.__class__.__name__, name))
+    try:
+        rawfields = self._rawfields
+    except AttributeError:
+        # First field access, so split the raw row (only done once)
+        rawfields = self._rawfields = self._split(self._raw)
+        del self._raw
+
+    try:
+        value = rawfields[idx]
+    except IndexError:
+        if name not in self._defaults:
+            raise ValueError('field {0!r} is not defined'.format(name))
+        value = self._defaults[name]
+        if name in self._default_factory_fields:
+            value = value()
+        # Defaults are trusted, so they skip the base type's converter
+        self._trusted_setters[idx](self, value)
+    else:
+        converter = self._converters[idx]
+        if converter is not None:
+            value = converter(value)
+        setattr(self, name, value)
+    # Return the stored value, which the base type may have converted or
+    # interned on assignment.
+    return self._slot_descriptors[idx].__get__(self)
+
+
+@classmethod
+def _project(cls, *fieldnames, **kwargs):
+    """
+    Return a ``(rectype, converter)`` tuple, where *rectype* is a derived
+    record type with only the given fields and *converter* is a function
+    that converts a record of this type into a record of *rectype*.
+
+    The derived type keeps the defaults and field options of the projected
+    fields. The derived type and converter are cached, so calling
+    ``_project()`` again with the same arguments returns the same objects.
+    The converter reads the projected values in one call and builds the new
+    record without argument checking::
+
+        >>> Event = recktype('Event', 'id ts host payload')
+        >>> EventKey, to_key = Event._project('id', 'ts')
+        >>> to_key(Event(1, 1234, 'web1', '...'))
+        EventProjection(id=1, ts=1234)
+
+    :param *fieldnames: The fields to keep, in the order they should appear
+        in the derived type.
+    :param typename: Keyword-only. The name of the derived type. Defaults to
+        the name of this type with a ``'Projection'`` suffix.
+    :raises ValueError: if no fieldnames are given or a fieldname does not
+        match a field.
+    """
+    typename = kwargs.pop('typename', None) or cls.__name__ + 'Projection'
+    if kwargs:
+        raise TypeError('unexpected keyword argument {0!r}'
+                        .format(next(iter(kwargs))))
+    key = (fieldnames, typename)
+    try:
+        return cls._projections[key]
+    except KeyError:
+        pass
+    if not fieldnames:
+        raise ValueError('at least one fieldname is required')
+    fields = []
+    for fieldname in fieldnames:
+        if fieldname not in cls._fieldnames_set:
+            raise ValueError(
+                'projection field {0!r} does not match a field'
+                .format(fieldname))
+        if fieldname in cls._defaults:
+            fields.append((fieldname, cls._defaults[fieldname]))
+        else:
+            fields.append(fieldname)
+    # Field options are passed separately, since fields without a default
+    # cannot be given options in a field specification.
+    projtype = recktype(
+        typename, fields,
+        intern=[fieldname for fieldname in fieldnames
+                if fieldname in cls._intern_fields],
+        converters=dict(
+            [(fieldname, cls._converters[fieldname])
+             for fieldname in fieldnames if fieldname in cls._converters]))
+    projtype.__module__ = cls.__module__
+
+    # Values read from records of this type have been converted already
+    make = projtype._make
+    getter = operator.attrgetter(*fieldnames)
+    if len(fieldnames) > 1:
+        def converter(rec):
+            return make(getter(rec), False)
+    else:
+        def converter(rec):
+            return make((getter(rec),), False)
+    cls._projections[key] = projtype, converter
+    return projtype, converter
+
+
+@classmethod
+def _project_many(cls, records, *fieldnames, **kwargs):
+    """
+    Return a list of records of a derived type with only the given fields,
+    converted from the records in the iterable *records*.
+
+    Equivalent to ``list(map(converter, records))`` where *converter* is
+    returned by ``_project(*fieldnames, **kwargs)``.
+    """
+    converter = cls._project(*fieldnames, **kwargs)[1]
+    return list(map(converter, records))
+
+
+@classmethod
+def _fixed_layout(cls, layout):
+    """
+    Declare the fixed-width text layout of the record type, used by
+    ``_parse_fixed()``, ``_read_fixed()``, ``_format_fixed()`` and
+    ``_write_fixed()``.
+
+    Example::
+
+        >>> Payment = recktype('Payment', 'id amount',
+        ...                    converters={'amount': int})
+        >>> Payment._fixed_layout([('id', 0, 8), ('amount', 8, 20, '>')])
+        >>> Payment._parse_fixed('A0000001        1250')
+        Payment(id='A0000001', amount=1250)
+        >>> Payment(id='B2', amount=75)._format_fixed()
+        'B2                75'
+
+    The layout is compiled once into a slicing plan, so each line is split
+    into field values by a single ``operator.itemgetter()`` call and each
+    record is formatted by a single ``str.format()`` call.
+
+    :param layout: A sequence with one ``(fieldname, start, end)`` or
+        ``(fieldname, start, end, align)`` tuple per field, where *start*
+        and *end* are the character offsets of the field's column (as in a
+        slice) and *align* is ``'<'`` (the default), ``'>'`` or ``'^'``, the
+        alignment of values in the column when formatting. Columns may be in
+        any order and the gaps between them are ignored when parsing and
+        filled with spaces when formatting.
+    :raises ValueError: if the layout does not give exactly one valid column
+        per field, or columns overlap.
+    """
+    cls._fixed_plan = _FixedPlan(cls, layout)
+
+
+@classmethod
+def _parse_fixed(cls, line):
+    """
+    Return a new record parsed from the fixed-width text *line*, using the
+    layout declared by ``_fixed_layout()``.
+
+    Values are stripped of surrounding whitespace and passed through any
+    field converters. Columns beyond the end of a short line are empty.
+
+    :raises ValueError: if no layout has been declared.
+    """
+    plan = _get_fixed_plan(cls)
+    return cls._make(map(str.strip, plan.getter(line)))
+
+
+@classmethod
+def _read_fixed(cls, fileobj):
+    """
+    Return an iterator over the records parsed from the lines of the text
+    file object (or other iterable of lines) *fileobj*, using the layout
+    declared by ``_fixed_layout()``. Empty lines are skipped.
+
+    :raises ValueError: if no layout has been declared.
+    """
+    getter = _get_fixed_plan(cls).getter
+    make = cls._make
+    strip = str.strip
+    for line in fileobj:
+        line = line.rstrip('\r\n')
+        if line:
+            yield make(map(strip, getter(line)))
+
+
+def _format_fixed(self):
+    """
+    Return the record formatted as a fixed-width text line (without a line
+    ending), using the layout declared by ``_fixed_layout()``. Field values
+    are converted with ``str()``.
+
+    :raises ValueError: if no layout has been declared or a value is too
+        wide for its column.
+    """
+    plan = _get_fixed_plan(type(self))
+    values = list(map(str, self._values_getter(self)))
+    line = plan.format(*values)
+    if len(line) != plan.length:
+        # At least one value overflowed its column
+        for fieldname, column, value in zip(
+                self._fieldnames, plan.slices, values):
+            if len(value) > column.stop - column.start:
+                raise ValueError(
+                    'value {0!r} of field {1!r} is wider than its column'
+                    .format(value, fieldname))
+    return line
+
+
+@classmethod
+def _write_fixed(cls, fileobj, records):
+    """
+    Write the records in the iterable *records* to the text file object
+    *fileobj* as fixed-width lines, using the layout declared by
+    ``_fixed_layout()``.
+
+    :raises ValueError: if no layout has been declared or a value is too
+        wide for its column.
+    """
+    _get_fixed_plan(cls)
+    fileobj.writelines(rec._format_fixed() + '\n' for rec in records)
+
+
+@classmethod
+def _to_numpy(cls, records, dtypes=None):
+    """
+    Return a new NumPy structured array holding the field values of
+    *records*.
+
+    The array has one named field per record field. Values are gathered
+    and assigned one column at a time rather than one record at a time::
+
+        >>> Point = recktype('Point', 'x y')
+        >>> arr = Point._to_numpy([Point(1, 2.5), Point(3, 4.5)])
+        >>> arr['y'].sum()
+        7.0
+
+    Requires NumPy.
+
+    :param records: A sequence or iterable of records of this type.
+    :param dtypes: A mapping of fieldnames to NumPy dtypes (or anything
+        accepted by ``numpy.dtype()``). The dtype of a field that is not in
+        the mapping is inferred from the field's values.
+    :raises TypeError: if *dtypes* contains a name that is not a fieldname.
+    """
+    numpy = _import_numpy()
+    if not isinstance(records, collections.Sequence):
+        records = list(records)
+    dtypes = dtypes or {}
+    for fieldname in dtypes:
+        if fieldname not in cls._fieldnames_set:
+            raise TypeError(
+                'dtype {0!r} does not match a field'.format(fieldname))
+    columns = []
+    descr = []
+    for fieldname, getter in zip(cls._fieldnames, cls._attr_getters):
+        column = list(map(getter, records))
+        if fieldname in dtypes:
+            dtype = numpy.dtype(dtypes[fieldname])
+        else:
+            dtype = numpy.asarray(column).dtype
+        columns.append(column)
+        descr.append((fieldname, dtype))
+    arr = numpy.empty(len(records), dtype=descr)
+    for fieldname, column in zip(cls._fieldnames, columns):
+        arr[fieldname] = column
+    return arr
+
+
+@classmethod
+def _from_numpy(cls, arr, view=False):
+    """
+    Return a list of records built from the rows of the NumPy structured
+    array *arr*.
+
+    The array must have a named field for every record field. By default,
+    each column is converted to Python values in one step and the records
+    are built from the converted columns::
+
+        >>> points = Point._from_numpy(arr)
+        >>> points[1]
+        Point(x=3, y=4.5)
+
+    If *view* is ``True``, row views are returned instead. A row view has
+    the same fieldnames as the record type and supports attribute access,
+    indexing and iteration, but reads and writes its fields directly from and
+    to its row of *arr*, so no values are copied::
+
+        >>> rows = Point._from_numpy(arr, view=True)
+        >>> rows[0].x = 10
+        >>> arr['x']
+        array([10,  3])
+
+    Requires NumPy.
+
+    :param arr: A one-dimensional NumPy structured array.
+    :param view: If ``True``, return row views of *arr* rather than records.
+    :raises ValueError: if *arr* is missing a field of the record type.
+    """
+    names = arr.dtype.names or ()
+    for fieldname in cls._fieldnames:
+        if fieldname not in names:
+            raise ValueError(
+                'array has no field {0!r}'.format(fieldname))
+    if view:
+        view_type = cls.__dict__.get('_numpy_view_type')
+        if view_type is None:
+            view_type = cls._numpy_view_type = _make_numpy_view_type(cls)
+        return [view_type(arr[idx]) for idx in range(len(arr))]
+    columns = [arr[fieldname].tolist() for fieldname in cls._fieldnames]
+    return list(map(cls._make, zip(*columns)))
+
+
 def _asdict(self):
     """
     Return a new ``collections.OrderedDict`` which maps fieldnames to their
@@ -245,6 +863,108 @@ def _asitems(self):
     return list(zip(self._fieldnames, self))
 
 
+def _copy(self):
+    """
+    Return a shallow copy of the record.
+
+    The copy is filled directly from the field values of the record, without
+    argument checking or field converters, so this is faster than
+    ``copy.copy()`` would be through the pickle protocol. ``copy.copy(rec)``
+    calls this method.
+    """
+    cls = type(self)
+    rec = cls.__new__(cls)
+    for setter, value in zip(cls._slot_setters, cls._values_getter(self)):
+        setter(rec, value)
+    return rec
+
+
+@classmethod
+def _copy_many(cls, records):
+    """
+    Return a list of shallow copies of the records in the iterable *records*,
+    which must all be instances of this record type.
+    """
+    new = cls.__new__
+    values_getter = cls._values_getter
+    slot_setters = cls._slot_setters
+    copies = []
+    append = copies.append
+    for rec in records:
+        clone = new(cls)
+        for setter, value in zip(slot_setters, values_getter(rec)):
+            setter(clone, value)
+        append(clone)
+    return copies
+
+
+def _replace(self, **changes):
+    """
+    Return a shallow copy of the record with the fields given as keyword
+    arguments set to new values.
+
+    Example::
+
+        >>> Point = recktype('Point', 'x y')
+        >>> p = Point(1, 2)
+        >>> p._replace(y=5)
+        Point(x=1, y=5)
+        >>> p
+        Point(x=1, y=2)
+
+    Only the new values are passed through field converters.
+
+    :param **changes: New field values passed by fieldname.
+    :raises TypeError: if a keyword argument does not match a fieldname.
+    """
+    self._check_args((), changes)
+    rec = self._copy()
+    for fieldname, value in changes.items():
+        setattr(rec, fieldname, value)
+    return rec
+
+
+def _view(self, index):
+    """
+    Return a live ``RecordView`` of the fields in the slice *index*.
+
+    Unlike ``rec[index]``, which copies the field values into a new list,
+    a view holds only the record and the range of field indices. Reading
+    an item of the view reads the record's field, and assigning to an item
+    assigns to the record's field::
+
+        >>> Sample = recktype('Sample', 'id f0 f1 f2 f3')
+        >>> sample = Sample('s1', 0.5, 1.5, 2.5, 3.5)
+        >>> features = sample._view(slice(1, None))
+        >>> len(features), sum(features)
+        (4, 8.0)
+        >>> features[-1] = 0.0
+        >>> sample.f3
+        0.0
+
+    :param index: A slice object.
+    :raises TypeError: if *index* is not a slice.
+    """
+    if index.__class__ is not slice:
+        raise TypeError('expected a slice, not {0!r}'.format(index))
+    return RecordView(self, range(self._nfields)[index])
+
+
+def __deepcopy__(self, memo):
+    """
+    Return a deep copy of the record. Called by ``copy.deepcopy()``.
+    """
+    cls = type(self)
+    rec = cls.__new__(cls)
+    # Register the copy before copying the values in case they refer back
+    # to the record.
+    memo[id(self)] = rec
+    values = copy.deepcopy(cls._values_getter(self), memo)
+    for setter, value in zip(cls._trusted_setters, values):
+        setter(rec, value)
+    return rec
+
+
 @classmethod
 def _get_defaults(cls):
     """
@@ -285,6 +1005,15 @@ def _replace_defaults(cls, *values_by_field_order, **values_by_fieldname):
     cls._default_factory_fields = frozenset(
         _get_default_factory_fields(defaults))
 
+    # The schema ID covers the defaults, so re-register the type under a
+    # new ID. Otherwise its pickles would resolve, in a process without the
+    # type, to a type with the old defaults.
+    if _registry.get(cls._schema_id) is cls:
+        del _registry[cls._schema_id]
+    cls._schema_id = _make_schema_id(
+        cls.__name__, cls._fieldnames, defaults, cls._field_options)
+    _registry[cls._schema_id] = cls
+
 
 @classmethod
 def _check_args(cls, values_by_field_order, values_by_fieldname):
@@ -311,12 +1040,19 @@ def _check_args(cls, values_by_field_order, values_by_fieldname):
 
 
 def __eq__(self, other):
-    return (isinstance(other, self.__class__)
-        and self.__dict__ == other.__dict__)
+    # Compare tuples of field values rather than building an OrderedDict
+    # for each record. Records of a type and of its lazy types share a base
+    # record type, so they compare equal when their values are equal.
+    if getattr(other, '_base_rectype', None) is not self._base_rectype:
+        return NotImplemented
+    return self._values_getter(self) == other._values_getter(other)
 
 
 def __ne__(self, other):
-    return not self.__eq__(other)
+    result = self.__eq__(other)
+    if result is NotImplemented:
+        return result
+    return not result
 
 
 def __getitem__(self, index):
@@ -325,17 +1061,16 @@ def __getitem__(self, index):
 
     Args:
         index: int or slice object
-            Index can be an integer or slice object for normal sequence
-            item access.
+            Index can be an integer (or any object with an ``__index__``
+            method) or slice object for normal sequence item access.
     Returns:
         If index is an integer the value of the field corresponding to
         the index is returned. If index is a slice a list of field values
         corresponding to the slice indices is returned.
     """
-    if isinstance(index, int):
-        return self._attr_getters[index](self)
-    # Slice object
-    return [getter(self) for getter in self._attr_getters[index]]
+    if index.__class__ is slice:
+        return list(_get_slice_getter(self.__class__, index)(self))
+    return self._index_getters[index](self)
 
 
 def __setitem__(self, index, value):
@@ -352,27 +1087,48 @@ def __setitem__(self, index, value):
         value: any
             Value to set.
     """
-    if isinstance(index, int):
-        setattr(self, self._fieldnames[index], value)
-    else:  # Slice object
-        fields = self._fieldnames[index]
-        for field, v in zip(fields, value):
-            setattr(self, field, v)
+    if index.__class__ is slice:
+        for setter, v in zip(self._index_setters[index], value):
+            setter(self, v)
+    else:
+        self._index_setters[index](self, value)
 
 
 def __getstate__(self):
     """
     Return self as a tuple to allow the record to be pickled.
     """
-    return tuple(self)
+    return self._values_getter(self)
 
 
 def __setstate__(self, state):
     """
     Re-initialise the record from the unpickled tuple representation.
+
+    Field converters are not applied, since the values were taken from a
+    record of the same type when it was pickled.
+    """
+    for setter, value in zip(self._trusted_setters, state):
+        setter(self, value)
+
+
+def __reduce__(self):
+    """
+    Return the recipe used to pickle the record.
+
+    Records of a type that can be found by name in its module are pickled
+    with a reference to the type, like instances of any other class. Other
+    record types, such as those created by calling ``recktype()`` inside a
+    function, are pickled by a token unique to the type, their schema ID
+    and their schema. When unpickled, the type with the token is used if
+    it exists in the unpickling process. Otherwise the record type
+    registered under the schema ID is used or, if the process has no such
+    type, the type is recreated from the schema.
     """
-    for attr, value in zip(self._fieldnames, state):
-        setattr(self, attr, value)
+    ref = _rectype_ref(self.__class__)
+    if isinstance(ref, type):
+        return copyreg.__newobj__, (ref,), self.__getstate__()
+    return _restore_record, ref, self.__getstate__()
 
 
 def __len__(self):
@@ -407,29 +1163,303 @@ def _get_default_factory_fields(defaults):
     return default_factory_fields
 
 
+def _import_numpy():
+    """
+    Import and return the numpy module. NumPy is an optional dependency that
+    is only needed by the NumPy conversion methods.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('NumPy is required for NumPy array conversion')
+    return numpy
+
+
+def _make_numpy_view_type(rectype):
+    """
+    Return a new class whose instances are views of a row of a NumPy
+    structured array with the fields of *rectype*.
+    """
+    type_dct = dict(
+        __slots__=('_row',),
+        __init__=_numpy_view_init,
+        _fieldnames=rectype._fieldnames,
+        _nfields=rectype._nfields,
+        _asdict=_asdict,
+        _asitems=_asitems,
+        __getitem__=_numpy_view_getitem,
+        __setitem__=_numpy_view_setitem,
+        __len__=__len__,
+        __repr__=__repr__,
+        __str__=__str__,
+    )
+    for fieldname in rectype._fieldnames:
+        type_dct[fieldname] = _make_numpy_view_property(fieldname)
+    return type(rectype.__name__ + 'View', (collections.Sequence,), type_dct)
+
+
+def _make_numpy_view_property(fieldname):
+    """
+    Return a property that gets and sets field *fieldname* of a row view.
+    """
+    def get_field(view):
+        return view._row[fieldname]
+
+    def set_field(view, value):
+        view._row[fieldname] = value
+    return property(get_field, set_field)
+
+
+def _numpy_view_init(self, row):
+    self._row = row
+
+
+def _numpy_view_getitem(self, index):
+    if isinstance(index, int):
+        return self._row[self._fieldnames[index]]
+    return [self._row[fieldname] for fieldname in self._fieldnames[index]]
+
+
+def _numpy_view_setitem(self, index, value):
+    if isinstance(index, int):
+        self._row[self._fieldnames[index]] = value
+    else:
+        for fieldname, v in zip(self._fieldnames[index], value):
+            self._row[fieldname] = v
+
+
+def _make_schema_id(typename, fieldnames, defaults, field_options):
+    """
+    Return a fingerprint of a record type's typename, fieldnames, defaults
+    and field options.
+
+    Converters are fingerprinted by their qualified name rather than their
+    repr, which may include an address that differs between processes.
+    """
+    schema = repr((
+        typename,
+        tuple(fieldnames),
+        [(fieldname, defaults[fieldname]) for fieldname in fieldnames
+         if fieldname in defaults],
+        [(fieldname, sorted(
+            (key, _callable_name(value) if key == 'converter' else value)
+            for key, value in field_options[fieldname].items()))
+         for fieldname in fieldnames if field_options.get(fieldname)]))
+    return hashlib.sha1(schema.encode('utf-8')).hexdigest()[:16]
+
+
+def _callable_name(fn):
+    """
+    Return the qualified name of the callable *fn*.
+    """
+    return '{0}.{1}'.format(
+        getattr(fn, '__module__', None),
+        getattr(fn, '__qualname__', getattr(fn, '__name__', type(fn).__name__)))
+
+
+def _rectype_ref(rectype):
+    """
+    Return a picklable reference to *rectype*: the type itself if it can be
+    found by name in its module, else a ``(schema_id, schema, token)``
+    tuple.
+    """
+    module = sys.modules.get(rectype.__module__)
+    if getattr(module, rectype.__name__, None) is rectype:
+        return rectype
+    schema = (rectype.__name__, rectype._fieldnames, rectype._defaults,
+              rectype._field_options)
+    return rectype._schema_id, schema, rectype._token
+
+
+def _resolve_rectype_ref(ref):
+    """
+    Return the record type referred to by a reference returned by
+    ``_rectype_ref()``.
+    """
+    if isinstance(ref, type):
+        return ref
+    return _rectype_from_schema(*ref)
+
+
+def _restore_record(schema_id, schema, token=None):
+    """
+    Return a new, empty record of the type with the unique *token*, or else
+    of the type registered under *schema_id*, recreating the type from
+    *schema* if it is not registered. Used to unpickle records.
+    """
+    rectype = _rectype_from_schema(schema_id, schema, token)
+    return rectype.__new__(rectype)
+
+
+def _rectype_from_schema(schema_id, schema, token=None):
+    """
+    Return the record type with the unique *token* or, if there is no such
+    type in this process, the record type registered under *schema_id*,
+    recreating it from *schema* if it is not registered.
+    """
+    try:
+        return _tokens[token]
+    except KeyError:
+        pass
+    try:
+        rectype = _registry[schema_id]
+    except KeyError:
+        typename, fieldnames, defaults, field_options = schema
+        # Fieldnames were validated when the type was first created so
+        # renaming just reproduces any positional names it was given.
+        rectype = recktype(
+            typename,
+            [fieldname if fieldname not in defaults
+             else (fieldname, defaults[fieldname])
+             for fieldname in fieldnames],
+            rename=True,
+            intern=[fieldname for fieldname in fieldnames
+                    if field_options.get(fieldname, {}).get('intern')],
+            converters=dict(
+                (fieldname, options['converter'])
+                for fieldname, options in field_options.items()
+                if options.get('converter') is not None))
+        rectype._schema_id = schema_id
+        _registry[schema_id] = rectype
+    if token is not None:
+        # Later references to the same foreign type resolve to this type
+        # even if another type is registered under the schema ID meanwhile
+        _tokens[token] = rectype
+    return rectype
+
+
+def _get_slice_getter(cls, index):
+    """
+    Return a callable that takes a record of type *cls* and returns a tuple
+    of the values of the fields in the slice *index*. Getters are cached
+    per record type.
+    """
+    # Normalise the key, so that equivalent slices share one getter and
+    # the cache is bounded by the number of fields.
+    key = index.indices(cls._nfields)
+    try:
+        return cls._slice_getters[key]
+    except KeyError:
+        getter = cls._slice_getters[key] = _make_values_getter(
+            cls._fieldnames[index])
+        return getter
+
+
+def _make_values_getter(fieldnames):
+    """
+    Return a callable that takes a record and returns a tuple of its field
+    values in field order.
+
+    ``operator.attrgetter`` only returns a tuple when given more than one
+    attribute name, so records with fewer than two fields are handled by
+    ``_ValuesGetter``.
+    """
+    if len(fieldnames) > 1:
+        return operator.attrgetter(*fieldnames)
+    return _ValuesGetter(fieldnames)
+
+
+class _ValuesGetter(object):
+    """
+    Callable returning a tuple of a record's field values in field order.
+    """
+    __slots__ = ('_fieldnames',)
+
+    def __init__(self, fieldnames):
+        self._fieldnames = tuple(fieldnames)
+
+    def __call__(self, rec):
+        return tuple([getattr(rec, field) for field in self._fieldnames])
+
+
+class RecordView(collections.Sequence):
+    """
+    A live view of a range of the fields of a record, returned by the
+    ``_view()`` record method.
+
+    A view supports ``len()``, iteration, access and assignment by integer
+    index and slice, and the other ``collections.Sequence`` methods. Slicing
+    a view returns a new view of the same record. The view reads and writes
+    the record's fields each time, so it always reflects the current field
+    values.
+
+    :param rec: The record viewed.
+    :param indices: A ``range`` of field indices.
+    """
+    __slots__ = ('_rec', '_indices')
+
+    def __init__(self, rec, indices):
+        self._rec = rec
+        self._indices = indices
+
+    @property
+    def fieldnames(self):
+        """
+        A tuple of the names of the fields in the view.
+        """
+        fieldnames = self._rec._fieldnames
+        return tuple([fieldnames[idx] for idx in self._indices])
+
+    def __getitem__(self, index):
+        if index.__class__ is slice:
+            return RecordView(self._rec, self._indices[index])
+        return self._rec._index_getters[self._indices[index]](self._rec)
+
+    def __setitem__(self, index, value):
+        rec = self._rec
+        setters = rec._index_setters
+        if index.__class__ is slice:
+            for idx, v in zip(self._indices[index], value):
+                setters[idx](rec, v)
+        else:
+            setters[self._indices[index]](rec, value)
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __iter__(self):
+        rec = self._rec
+        getters = rec._index_getters
+        for idx in self._indices:
+            yield getters[idx](rec)
+
+    def __repr__(self):
+        return '{0}View({1})'.format(
+            self._rec.__class__.__name__,
+            ', '.join(['{0}={1!r}'.format(fieldname, value)
+                       for fieldname, value in zip(self.fieldnames, self)]))
+
+
 def _parse_fieldnames(fieldnames, rename):
     """
-    Process a sequence of fieldname strings and/or (fieldname, default) tuples,
-    creating a list of corrected fieldnames and a map of fieldname to
-    default-values.
+    Process a sequence of fieldname strings, (fieldname, default) tuples and/or
+    (fieldname, default, options) tuples, creating a list of corrected
+    fieldnames, a map of fieldname to default-values and a map of fieldname
+    to field options.
     """
     defaults = {}
+    field_options = {}
     validated_fieldnames = []
     used_names = set()
     for idx, fieldname in enumerate(fieldnames):
+        options = None
         if isinstance(fieldname, str):
             has_default = False
         else:
             try:
-                if len(fieldname) != 2:
+                if len(fieldname) not in (2, 3):
                     raise ValueError(
                         'fieldname should be a (fieldname, default_value) '
-                        '2-tuple'.format(fieldname))
+                        '2-tuple or a (fieldname, default_value, options) '
+                        '3-tuple')
             except TypeError:
                 raise TypeError(
-                    'fieldname should be a string, or a '
-                    '(fieldname, default_value) 2-tuple'.format(fieldname))
+                    'fieldname should be a string, a '
+                    '(fieldname, default_value) 2-tuple or a '
+                    '(fieldname, default_value, options) 3-tuple')
             has_default = True
+            if len(fieldname) == 3:
+                options = _validate_field_options(fieldname[2])
             default = fieldname[1]
             fieldname = fieldname[0]
 
@@ -438,7 +1468,61 @@ def _parse_fieldnames(fieldnames, rename):
         used_names.add(fieldname)
         if has_default:
             defaults[fieldname] = default
-    return validated_fieldnames, defaults
+        if options:
+            field_options[fieldname] = options
+    return validated_fieldnames, defaults, field_options
+
+
+def _validate_field_options(options):
+    """
+    Return a copy of the per-field *options* mapping if it is valid, else
+    raise a ValueError. A callable is accepted as shorthand for
+    ``{'converter': options}``.
+    """
+    if callable(options) and not isinstance(options, collections.Mapping):
+        options = {'converter': options}
+    if not isinstance(options, collections.Mapping):
+        raise ValueError(
+            'field options should be a mapping or a converter function: '
+            '{0!r}'.format(options))
+    for option in options:
+        if option not in _FIELD_OPTIONS:
+            raise ValueError('invalid field option: {0!r}'.format(option))
+    converter = options.get('converter')
+    if converter is not None and not callable(converter):
+        raise ValueError(
+            'field converter is not callable: {0!r}'.format(converter))
+    return dict(options)
+
+
+def _compose(converter, intern_table):
+    """
+    Return a function that applies *converter* and then *intern_table* to a
+    value, skipping either if it is ``None``, or ``None`` if both are.
+    """
+    if converter is None:
+        return intern_table
+    if intern_table is None:
+        return converter
+
+    def convert_and_intern(value):
+        return intern_table(converter(value))
+    return convert_and_intern
+
+
+def _make_field_property(slot, transform):
+    """
+    Return a property that stores values in the slot descriptor *slot* after
+    passing them through the function *transform*.
+
+    Getting and deleting use the slot descriptor's own methods, so only
+    assignment is slower than for a plain slot.
+    """
+    set_slot = slot.__set__
+
+    def set_field(rec, value):
+        set_slot(rec, transform(value))
+    return property(slot.__get__, set_field, slot.__delete__)
 
 
 def _validate_fieldname(fieldname, used_names, rename, idx):
@@ -493,6 +1577,112 @@ def _validate_name(name, nametype):
             '{0}name cannot be a keyword: {1!r}'.format(nametype, name))
 
 
+def _get_fixed_plan(rectype):
+    """
+    Return the fixed-width layout plan of *rectype*.
+    """
+    if rectype._fixed_plan is None:
+        raise ValueError(
+            'no fixed-width layout has been declared for {0}'
+            .format(rectype.__name__))
+    return rectype._fixed_plan
+
+
+class _FixedPlan(object):
+    """
+    A record type's fixed-width layout compiled into one slice per field, an
+    ``itemgetter`` that applies them all to a line, and a format string.
+    """
+    def __init__(self, rectype, layout):
+        columns = {}
+        for entry in layout:
+            entry = tuple(entry)
+            if len(entry) == 3:
+                fieldname, start, end = entry
+                align = '<'
+            elif len(entry) == 4:
+                fieldname, start, end, align = entry
+            else:
+                raise ValueError(
+                    'fixed layout entries must have 3 or 4 items: {0!r}'
+                    .format(entry))
+            if fieldname not in rectype._fieldnames_set:
+                raise ValueError('fixed layout field {0!r} does not match a '
+                                 'field'.format(fieldname))
+            if fieldname in columns:
+                raise ValueError('fixed layout field {0!r} is given more '
+                                 'than once'.format(fieldname))
+            if not (isinstance(start, int) and isinstance(end, int)
+                    and 0 <= start < end):
+                raise ValueError('invalid column for field {0!r}: {1!r}'
+                                 .format(fieldname, (start, end)))
+            if align not in ('<', '>', '^'):
+                raise ValueError('invalid alignment for field {0!r}: {1!r}'
+                                 .format(fieldname, align))
+            columns[fieldname] = (start, end, align)
+        missing = [fieldname for fieldname in rectype._fieldnames
+                   if fieldname not in columns]
+        if missing:
+            raise ValueError('fixed layout has no column for fields {0!r}'
+                             .format(missing))
+
+        self.slices = tuple(
+            [slice(*columns[fieldname][:2])
+             for fieldname in rectype._fieldnames])
+        if len(self.slices) == 1:
+            column = self.slices[0]
+            self.getter = lambda line: (line[column],)
+        else:
+            self.getter = operator.itemgetter(*self.slices)
+
+        pieces = []
+        position = 0
+        for start, end, align, index in sorted(
+                columns[fieldname] + (index,)
+                for index, fieldname in enumerate(rectype._fieldnames)):
+            if start < position:
+                raise ValueError('fixed layout columns overlap at {0}'
+                                 .format(start))
+            pieces.append(' ' * (start - position))
+            pieces.append('{{{0}:{1}{2}}}'.format(index, align, end - start))
+            position = end
+        self.format = ''.join(pieces).format
+        self.length = position
+
+
+class _InternTable(object):
+    """
+    Callable that returns a canonical instance of the value passed to it.
+
+    Strings are interned with ``sys.intern()``. Other hashable values are
+    stored in a dict of at most ``_INTERN_TABLE_MAXSIZE`` values, keyed by
+    type as well as value so that e.g. ``1``, ``1.0`` and ``True`` are kept
+    apart. Once the dict is full, values not already in it are returned unchanged, so a
+    field with many distinct values cannot grow the table without bound.
+    Unhashable values are returned unchanged.
+    """
+    __slots__ = ('_values',)
+
+    def __init__(self):
+        self._values = {}
+
+    def __call__(self, value):
+        if type(value) is str:
+            return sys.intern(value)
+        key = (type(value), value)
+        try:
+            return self._values[key]
+        except KeyError:
+            if len(self._values) < _INTERN_TABLE_MAXSIZE:
+                self._values[key] = value
+            return value
+        except TypeError:
+            return value
+
+    def __len__(self):
+        return len(self._values)
+
+
 class DefaultFactory(object):
     """
     Wrap a default factory function.
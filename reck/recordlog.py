@@ -0,0 +1,292 @@
+"""
+This module implements RecordLog, an append-only file of records with an
+offset index for fast random access.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import array
+import json
+import mmap
+import os
+import struct
+
+from .codec import RecordCodec, _FRAME_HEADER
+from .reck import recktype
+
+_MAGIC = b'RECKLOG\x01'
+_HEADER_SIZE = struct.Struct('<I')
+# Offsets in the index file are unsigned 64-bit integers
+_OFFSET_TYPECODE = 'Q'
+
+
+class RecordLog(object):
+    """
+    An append-only log file of records that supports random access by index.
+
+    The log file starts with a header recording the schema (typename and
+    fieldnames) of its records, followed by one compact length-prefixed
+    frame per record (see ``reck.codec.RecordCodec``). The file offset of
+    every frame is kept in a sidecar index file named ``path + '.idx'``.
+    Reads memory-map the log and decode only the records requested, so
+    ``log[i]`` and ``log[start:stop]`` do not depend on the size of the log.
+
+    Example::
+
+        >>> from reck import RecordLog
+        >>> Event = recktype('Event', 'ts kind value')
+        >>> with RecordLog('events.log', Event) as log:
+        ...     log.extend(Event(ts, 'tick', ts * 2) for ts in range(1000))
+        ...     log[500]
+        Event(ts=500, kind='tick', value=1000)
+        >>> log = RecordLog('events.log')      # record type read from the header
+        >>> [event.ts for event in log[10:13]]
+        [10, 11, 12]
+
+    If the index file is missing or out of date (e.g. after a crash) it is
+    rebuilt by scanning the log when the log is opened. A record frame that
+    was only partly written is discarded.
+
+    :param path: Path of the log file. It is created if it does not exist.
+    :param rectype: The record type stored in the log. It can be omitted
+        when opening an existing log, in which case a record type is created
+        from the schema in the log header.
+    :param readonly: If ``True``, open an existing log for reading only.
+    :raises ValueError: if *rectype* does not match the schema of an
+        existing log, or the file is not a record log.
+    :raises TypeError: if *rectype* is omitted when creating a new log.
+    """
+    def __init__(self, path, rectype=None, readonly=False):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.readonly = readonly
+        self._mmap = None
+        self._dirty = False
+
+        if readonly or (os.path.exists(path) and os.path.getsize(path) > 0):
+            self._file = open(path, 'rb' if readonly else 'r+b')
+            create = False
+        else:
+            if rectype is None:
+                raise TypeError('rectype is required to create a new log')
+            self._file = open(path, 'w+b')
+            create = True
+        try:
+            if create:
+                self.rectype = rectype
+                self._write_header()
+            else:
+                self.rectype = self._read_header(rectype)
+            self._codec = RecordCodec(self.rectype)
+            self._offsets = self._load_index()
+        except Exception:
+            self._file.close()
+            raise
+
+        if readonly:
+            self._index_file = None
+        else:
+            self._file.seek(self._end)
+            self._index_file = open(self.index_path, 'ab')
+
+    # --------------------------------------------------------------------------
+    # Writing
+
+    def append(self, rec):
+        """
+        Append the record *rec* to the log and return its index.
+        """
+        self._check_writable()
+        self._offsets.append(self._end)
+        self._end += self._codec.write(self._file, rec)
+        self._index_file.write(self._offsets[-1:].tobytes())
+        self._dirty = True
+        return len(self._offsets) - 1
+
+    def extend(self, records):
+        """
+        Append every record in the iterable *records* to the log.
+        """
+        self._check_writable()
+        write = self._codec.write
+        start = len(self._offsets)
+        end = self._end
+        for rec in records:
+            self._offsets.append(end)
+            end += write(self._file, rec)
+        self._end = end
+        self._index_file.write(self._offsets[start:].tobytes())
+        self._dirty = True
+
+    def flush(self):
+        """
+        Flush appended records and their index entries to disk.
+        """
+        if self._index_file is not None:
+            # Flush the log before the index so that the index never refers
+            # to records that have not been written.
+            self._file.flush()
+            self._index_file.flush()
+        self._dirty = False
+
+    def close(self):
+        """
+        Flush and close the log. Closing a closed log has no effect.
+        """
+        if self._file.closed:
+            return
+        self.flush()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._index_file is not None:
+            self._index_file.close()
+        self._file.close()
+
+    # --------------------------------------------------------------------------
+    # Reading
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        """
+        Return the record at integer *index*, or a list of the records in the
+        slice *index*. Negative indices count from the end of the log.
+        """
+        if isinstance(index, slice):
+            return [self._read(offset) for offset in self._offsets[index]]
+        try:
+            offset = self._offsets[index]
+        except IndexError:
+            raise IndexError('record log index out of range')
+        return self._read(offset)
+
+    def __iter__(self):
+        for offset in self._offsets:
+            yield self._read(offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return 'RecordLog({0!r}, {1})'.format(self.path, self.rectype.__name__)
+
+    def _read(self, offset):
+        """
+        Decode and return the record whose frame starts at *offset*.
+        """
+        buf = self._mapped()
+        size, = _FRAME_HEADER.unpack_from(buf, offset)
+        start = offset + _FRAME_HEADER.size
+        return self._codec.decode(buf[start:start + size])
+
+    def _mapped(self):
+        """
+        Return a memory map of the log covering every appended record.
+        """
+        if self._dirty:
+            self.flush()
+        if self._mmap is None or len(self._mmap) < self._end:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    # --------------------------------------------------------------------------
+    # Header and index management
+
+    def _write_header(self):
+        schema = json.dumps({
+            'typename': self.rectype.__name__,
+            'fieldnames': list(self.rectype._fieldnames),
+        }).encode('utf-8')
+        self._file.write(_MAGIC + _HEADER_SIZE.pack(len(schema)) + schema)
+        self._file.flush()
+        self._data_start = self._file.tell()
+        # Any index left over from a previous log at this path is stale
+        open(self.index_path, 'wb').close()
+
+    def _read_header(self, rectype):
+        """
+        Read and validate the log header and return the record type.
+        """
+        prefix = self._file.read(len(_MAGIC) + _HEADER_SIZE.size)
+        if prefix[:len(_MAGIC)] != _MAGIC or len(prefix) != 12:
+            raise ValueError('{0!r} is not a record log'.format(self.path))
+        size, = _HEADER_SIZE.unpack(prefix[len(_MAGIC):])
+        schema = json.loads(self._file.read(size).decode('utf-8'))
+        self._data_start = self._file.tell()
+        fieldnames = tuple(schema['fieldnames'])
+        if rectype is None:
+            return recktype(schema['typename'], fieldnames, rename=True)
+        if rectype._fieldnames != fieldnames:
+            raise ValueError(
+                'record type fieldnames {0!r} do not match the log fieldnames '
+                '{1!r}'.format(rectype._fieldnames, fieldnames))
+        return rectype
+
+    def _load_index(self):
+        """
+        Load the offset index, rebuilding any part of it that is missing, and
+        set the end of the valid record data.
+        """
+        file_size = os.fstat(self._file.fileno()).st_size
+        offsets = array.array(_OFFSET_TYPECODE)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as index_file:
+                data = index_file.read()
+            usable = len(data) - len(data) % offsets.itemsize
+            offsets.frombytes(data[:usable])
+
+        # The index is trusted up to its last entry that refers to a record
+        # wholly in the log. The log is then scanned from the end of that
+        # record for any records missing from the index.
+        rebuilt = False
+        end = None
+        while offsets:
+            end = self._frame_end(offsets[-1], file_size)
+            if end is not None:
+                break
+            offsets.pop()
+            rebuilt = True
+        if end is None:
+            end = self._data_start
+        while True:
+            frame_end = self._frame_end(end, file_size)
+            if frame_end is None:
+                break
+            offsets.append(end)
+            end = frame_end
+            rebuilt = True
+        self._end = end
+
+        if not self.readonly:
+            if end != file_size:
+                # Discard a partly written record
+                self._file.truncate(end)
+            if rebuilt:
+                with open(self.index_path, 'wb') as index_file:
+                    index_file.write(offsets.tobytes())
+        return offsets
+
+    def _frame_end(self, offset, file_size):
+        """
+        Return the offset just past the frame starting at *offset*, or
+        ``None`` if there is no complete frame there.
+        """
+        if offset + _FRAME_HEADER.size > file_size:
+            return None
+        self._file.seek(offset)
+        size, = _FRAME_HEADER.unpack(self._file.read(_FRAME_HEADER.size))
+        frame_end = offset + _FRAME_HEADER.size + size
+        return frame_end if frame_end <= file_size else None
+
+    def _check_writable(self):
+        if self.readonly:
+            raise IOError('record log is open read-only')
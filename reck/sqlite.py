@@ -0,0 +1,180 @@
+"""
+This module implements helpers for moving records in and out of ``sqlite3``
+databases: a row factory that builds records directly from query results and
+a bulk insert function that feeds record values to ``executemany()``.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import itertools
+import operator
+
+from .reck import DefaultFactory
+
+
+def row_factory(rectype):
+    """
+    Return a ``sqlite3`` row factory that returns rows as records of type
+    *rectype*.
+
+    The column names in ``cursor.description`` are mapped onto the
+    fieldnames of *rectype* once per executed query rather than once per row,
+    and records are then built from each row without the per-row argument
+    checking done when calling *rectype*. Columns may be in any order. Fields
+    that have no matching column are given their default value.
+
+    Example::
+
+        >>> import sqlite3
+        >>> import reck.sqlite
+        >>> Device = recktype('Device', ['id', 'name', ('online', False)])
+        >>> conn = sqlite3.connect(':memory:')
+        >>> conn.row_factory = reck.sqlite.row_factory(Device)
+        >>> conn.execute("SELECT 'dev1' AS name, 1 AS id").fetchone()
+        Device(id=1, name='dev1', online=False)
+
+    The factory can also be set on an individual cursor.
+
+    :param rectype: The record type to build from each row.
+    :returns: A callable suitable for ``Connection.row_factory`` or
+        ``Cursor.row_factory``.
+    :raises TypeError: (when a row is fetched) if a column name does not
+        match a field.
+    :raises ValueError: (when a row is fetched) if a field has no matching
+        column and no default value.
+    """
+    return _RowFactory(rectype)
+
+
+def insert_many(conn, table, records, batch=None):
+    """
+    Insert records into *table* using a single prepared ``INSERT`` statement.
+
+    Record values are streamed straight into ``conn.executemany()``, so the
+    records are never copied into an intermediate list or dict. The columns
+    of *table* are named after the fieldnames of the records. All records
+    must be of the same record type.
+
+    Example::
+
+        >>> conn.execute('CREATE TABLE device (id, name, online)')
+        >>> reck.sqlite.insert_many(conn, 'device', [
+        ...     Device(1, 'dev1'), Device(2, 'dev2', True)])
+        2
+
+    :param conn: A ``sqlite3.Connection`` (or ``sqlite3.Cursor``).
+    :param table: Name of the table to insert into. It is quoted as a single
+        SQL identifier.
+    :param records: An iterable of records.
+    :param batch: If given, records are passed to ``executemany()`` in
+        batches of at most this many records rather than in a single call.
+        This bounds the work done per call, for example to interleave other
+        statements on the same connection.
+    :returns: The number of records inserted.
+    :raises ValueError: if *batch* is not a positive integer.
+    """
+    if batch is not None and batch < 1:
+        raise ValueError('batch must be a positive integer: {0!r}'
+                         .format(batch))
+    records = iter(records)
+    try:
+        first = next(records)
+    except StopIteration:
+        return 0
+    rectype = type(first)
+    records = itertools.chain([first], records)
+    sql = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+        _quote(table),
+        ', '.join(_quote(fieldname) for fieldname in rectype._fieldnames),
+        ', '.join('?' * rectype._nfields))
+    rows = map(rectype._values_getter, records)
+
+    if batch is None:
+        # For executemany(), rowcount is the total over all the rows
+        return conn.executemany(sql, rows).rowcount
+
+    count = 0
+    while True:
+        chunk = list(itertools.islice(rows, batch))
+        if not chunk:
+            return count
+        conn.executemany(sql, chunk)
+        count += len(chunk)
+
+
+class _RowFactory(object):
+    """
+    Callable ``sqlite3`` row factory that caches the mapping from the columns
+    of the current query to the fields of a record type.
+
+    The mapping is rebuilt whenever the cursor's ``description`` changes,
+    i.e. when a new query has been executed.
+    """
+    def __init__(self, rectype):
+        self._rectype = rectype
+        self._description = None
+        self._convert = None
+
+    def __call__(self, cursor, row):
+        if cursor.description is not self._description:
+            self._convert = _make_row_converter(
+                self._rectype, cursor.description)
+            self._description = cursor.description
+        return self._convert(row)
+
+    def __repr__(self):
+        return 'row_factory({0})'.format(self._rectype.__name__)
+
+
+def _make_row_converter(rectype, description):
+    """
+    Return a function that converts a row with columns described by
+    *description* into a record of type *rectype*.
+    """
+    columns = [column[0] for column in description]
+    for column in columns:
+        if column not in rectype._fieldnames_set:
+            raise TypeError(
+                'column {0!r} does not match a field'.format(column))
+    make = rectype._make
+    if tuple(columns) == rectype._fieldnames:
+        return make
+
+    positions = dict((column, idx) for idx, column in enumerate(columns))
+    getters = []
+    for fieldname in rectype._fieldnames:
+        if fieldname in positions:
+            getters.append(operator.itemgetter(positions[fieldname]))
+        elif fieldname in rectype._defaults:
+            getters.append(_default_getter(rectype._defaults[fieldname]))
+        else:
+            raise ValueError(
+                'field {0!r} is not defined'.format(fieldname))
+
+    if all(fieldname in positions for fieldname in rectype._fieldnames):
+        # Columns are just reordered so a single itemgetter does the work
+        reorder = operator.itemgetter(
+            *[positions[fieldname] for fieldname in rectype._fieldnames])
+        if rectype._nfields > 1:
+            return lambda row: make(reorder(row))
+        return lambda row: make((reorder(row),))
+    return lambda row: make([getter(row) for getter in getters])
+
+
+def _default_getter(default):
+    """
+    Return a function that ignores its row argument and returns *default*
+    (or the result of calling it, for a ``DefaultFactory``).
+    """
+    if isinstance(default, DefaultFactory):
+        return lambda row: default()
+    return lambda row: default
+
+
+def _quote(identifier):
+    """
+    Return *identifier* quoted for use as an SQL identifier.
+    """
+    return '"{0}"'.format(identifier.replace('"', '""'))
+
@@ -0,0 +1,213 @@
+"""
+This module implements RecordStore, a persistent key-record store on a
+``dbm`` database with an in-memory LRU cache of records.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import collections
+import dbm
+import json
+
+from .codec import RecordCodec
+
+# Key under which the schema of the store's records is kept. Record keys are
+# UTF-8 encoded strings, so this cannot clash with a valid record key.
+_SCHEMA_KEY = b'\xffreck-schema'
+
+
+class RecordStore(collections.MutableMapping):
+    """
+    A persistent mapping of string keys to records of a single record type.
+
+    Records are stored in a ``dbm`` database, encoded with a per-type
+    ``reck.codec.RecordCodec`` so only their field values are serialised.
+    The most recently used records are kept in an in-memory LRU cache of
+    *cache_size* records. Records assigned to the store are only written to
+    the database when they are evicted from the cache, or when ``flush()``
+    or ``close()`` is called, so repeatedly updating a hot record costs no
+    database writes.
+
+    Example::
+
+        >>> from reck import RecordStore
+        >>> Device = recktype('Device', ['id', ('online', False), ('seen', 0)])
+        >>> with RecordStore('devices.db', Device) as store:
+        ...     store['dev1'] = Device('dev1', True, 1450000000)
+        ...     store['dev1'].online
+        True
+
+    By default a record read from the store and then changed in place is
+    not written back unless it is assigned to the store again. With
+    *writeback* set to ``True``, every record read is treated as changed,
+    so changes made in place are persisted (as with ``shelve``).
+
+    :param path: Path of the database, passed to ``dbm.open()``.
+    :param rectype: The record type stored.
+    :param cache_size: The maximum number of records kept in memory.
+    :param flag: The ``dbm.open()`` flag: ``'c'`` (the default) to open or
+        create the store, ``'n'`` to always create a new, empty store,
+        ``'w'`` to open an existing store or ``'r'`` to open an existing
+        store for reading only.
+    :param writeback: If ``True``, write back every cached record, not just
+        those assigned to the store.
+    :raises ValueError: if *rectype* does not match the schema of an
+        existing store or *cache_size* is less than 1.
+    """
+    def __init__(self, path, rectype, cache_size=10000, flag='c',
+                 writeback=False):
+        if cache_size < 1:
+            raise ValueError('cache_size must be a positive integer: {0!r}'
+                             .format(cache_size))
+        self.path = path
+        self.rectype = rectype
+        self.cache_size = cache_size
+        self.readonly = flag == 'r'
+        self.writeback = writeback
+        self._codec = RecordCodec(rectype)
+        self._cache = collections.OrderedDict()
+        self._dirty = set()
+        self._db = dbm.open(path, flag)
+        try:
+            self._check_schema()
+        except Exception:
+            self._db.close()
+            self._db = None
+            raise
+
+    # --------------------------------------------------------------------------
+    # Mapping interface
+
+    def __getitem__(self, key):
+        cache = self._cache
+        try:
+            rec = cache[key]
+        except KeyError:
+            rec = self._codec.decode(self._db[_encode_key(key)])
+            self._cache_record(key, rec)
+            if self.writeback and not self.readonly:
+                self._dirty.add(key)
+        else:
+            cache.move_to_end(key)
+        return rec
+
+    def __setitem__(self, key, rec):
+        self._check_writable()
+        if not isinstance(rec, self.rectype):
+            raise TypeError('expected a {0} record, not {1!r}'
+                            .format(self.rectype.__name__, rec))
+        _encode_key(key)
+        if key in self._cache:
+            self._cache[key] = rec
+            self._cache.move_to_end(key)
+        else:
+            self._cache_record(key, rec)
+        self._dirty.add(key)
+
+    def __delitem__(self, key):
+        self._check_writable()
+        cached = self._cache.pop(key, None) is not None
+        self._dirty.discard(key)
+        try:
+            del self._db[_encode_key(key)]
+        except KeyError:
+            if not cached:
+                raise KeyError(key)
+
+    def __contains__(self, key):
+        if not isinstance(key, str):
+            return False
+        return key in self._cache or _encode_key(key) in self._db
+
+    def __iter__(self):
+        self.flush()
+        for key in self._db.keys():
+            if key != _SCHEMA_KEY:
+                yield key.decode('utf-8')
+
+    def __len__(self):
+        self.flush()
+        return len(self._db) - 1
+
+    # --------------------------------------------------------------------------
+    # Persistence
+
+    def flush(self):
+        """
+        Write every changed record in the cache to the database in one batch.
+        """
+        if self._dirty:
+            db = self._db
+            encode = self._codec.encode
+            cache = self._cache
+            for key in self._dirty:
+                db[_encode_key(key)] = encode(cache[key])
+            self._dirty.clear()
+        sync = getattr(self._db, 'sync', None)
+        if sync is not None and not self.readonly:
+            sync()
+
+    def close(self):
+        """
+        Flush and close the store. Closing a closed store has no effect.
+        """
+        if self._db is None:
+            return
+        self.flush()
+        self._db.close()
+        self._db = None
+        self._cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return 'RecordStore({0!r}, {1})'.format(
+            self.path, self.rectype.__name__)
+
+    def _cache_record(self, key, rec):
+        """
+        Add *rec* to the cache, evicting (and writing back if changed) the
+        least recently used record if the cache is full.
+        """
+        cache = self._cache
+        cache[key] = rec
+        if len(cache) > self.cache_size:
+            old_key, old_rec = cache.popitem(last=False)
+            if old_key in self._dirty:
+                self._dirty.remove(old_key)
+                self._db[_encode_key(old_key)] = self._codec.encode(old_rec)
+
+    def _check_schema(self):
+        schema = {
+            'typename': self.rectype.__name__,
+            'fieldnames': list(self.rectype._fieldnames),
+        }
+        try:
+            stored = json.loads(self._db[_SCHEMA_KEY].decode('utf-8'))
+        except KeyError:
+            if self.readonly:
+                raise ValueError('{0!r} is not a record store'
+                                 .format(self.path))
+            self._db[_SCHEMA_KEY] = json.dumps(schema).encode('utf-8')
+            return
+        if stored['fieldnames'] != schema['fieldnames']:
+            raise ValueError(
+                'record type fieldnames {0!r} do not match the store '
+                'fieldnames {1!r}'.format(self.rectype._fieldnames,
+                                          tuple(stored['fieldnames'])))
+
+    def _check_writable(self):
+        if self.readonly:
+            raise IOError('record store is open read-only')
+
+
+def _encode_key(key):
+    if not isinstance(key, str):
+        raise TypeError('record store keys must be strings: {0!r}'
+                        .format(key))
+    return key.encode('utf-8')
@@ -0,0 +1,228 @@
+"""
+This module implements RecordTable, a chunked table of records that supports
+constant-time, copy-on-write snapshots for concurrent readers.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import threading
+import weakref
+
+
+class RecordTable(object):
+    """
+    A list-like table of records of one record type, which can be read
+    through consistent snapshots while it is being changed.
+
+    The table stores each record as a tuple of its field values, in chunks
+    of *chunk_size* rows. ``snapshot()`` returns a read-only view of the
+    table as it is at that moment, in constant time, by sharing the table's
+    chunks. When a row in a chunk shared with a live snapshot is replaced,
+    only that chunk is copied first (copy-on-write), so a snapshot stays
+    consistent however the table changes and no lock is needed to read it.
+    Appending rows never copies a chunk, since snapshots do not see rows
+    beyond their own length.
+
+    Example::
+
+        >>> from reck import RecordTable
+        >>> Account = recktype('Account', 'id balance')
+        >>> table = RecordTable(Account, [Account(i, 0) for i in range(3)])
+        >>> snapshot = table.snapshot()
+        >>> table.update(1, balance=50)
+        >>> table[1], snapshot[1]
+        (Account(id=1, balance=50), Account(id=1, balance=0))
+
+    Reading a row returns a new record built from the stored values, so
+    changing that record does not change the table. Write a changed record
+    back with ``table[index] = rec`` or change fields with ``update()``.
+    Methods that change the table hold a lock, so several threads can write
+    to the table.
+
+    :param rectype: The record type of the rows.
+    :param records: An optional iterable of records to append.
+    :param chunk_size: The number of rows in each chunk. Smaller chunks make
+        copy-on-write cheaper for scattered updates; larger chunks use less
+        memory.
+    :raises ValueError: if *chunk_size* is less than 1.
+    """
+    def __init__(self, rectype, records=(), chunk_size=1024):
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be a positive integer: {0!r}'
+                             .format(chunk_size))
+        self.rectype = rectype
+        self.chunk_size = chunk_size
+        self._chunks = []
+        # Generation of each chunk: the number of snapshots taken before the
+        # chunk was created or last copied. A chunk from an earlier
+        # generation than the table may be shared with a snapshot.
+        self._chunk_generations = []
+        self._generation = 0
+        self._directory_shared = False
+        self._len = 0
+        self._snapshots = weakref.WeakSet()
+        self._lock = threading.RLock()
+        self.extend(records)
+
+    # --------------------------------------------------------------------------
+    # Reading
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        return _getitem(self.rectype, self._chunks, self.chunk_size,
+                        self._len, index)
+
+    def __iter__(self):
+        return _iter_rows(self.rectype, self._chunks, self._len)
+
+    def __repr__(self):
+        return '<RecordTable of {0} {1} records>'.format(
+            self._len, self.rectype.__name__)
+
+    # --------------------------------------------------------------------------
+    # Writing
+
+    def append(self, rec):
+        """
+        Append the record *rec* to the table.
+        """
+        self._append_row(self.rectype._values_getter(rec))
+
+    def extend(self, records):
+        """
+        Append every record in the iterable *records* to the table.
+        """
+        values_getter = self.rectype._values_getter
+        for rec in records:
+            self._append_row(values_getter(rec))
+
+    def __setitem__(self, index, rec):
+        """
+        Replace the row at integer *index* with the values of the record
+        *rec*.
+        """
+        self._set_row(index, self.rectype._values_getter(rec))
+
+    def update(self, index, **changes):
+        """
+        Change the fields given as keyword arguments of the row at integer
+        *index*. Field converters are applied to the new values.
+
+        :raises TypeError: if a keyword argument does not match a fieldname.
+        """
+        with self._lock:
+            rec = self[index]
+            rec._update(**changes)
+            self._set_row(index, rec._values_getter(rec))
+
+    def snapshot(self):
+        """
+        Return a read-only ``TableSnapshot`` of the table as it is now.
+        """
+        with self._lock:
+            snapshot = TableSnapshot(self.rectype, self._chunks,
+                                     self.chunk_size, self._len)
+            self._snapshots.add(snapshot)
+            self._generation += 1
+            self._directory_shared = True
+            return snapshot
+
+    def _append_row(self, row):
+        with self._lock:
+            chunk_index, offset = divmod(self._len, self.chunk_size)
+            if offset == 0:
+                self._chunks.append([row])
+                self._chunk_generations.append(self._generation)
+            else:
+                self._chunks[chunk_index].append(row)
+            self._len += 1
+
+    def _set_row(self, index, row):
+        with self._lock:
+            index = _check_index(index, self._len)
+            chunk_index, offset = divmod(index, self.chunk_size)
+            shared = len(self._snapshots) > 0
+            if self._directory_shared:
+                if shared:
+                    self._chunks = list(self._chunks)
+                self._directory_shared = False
+            if self._chunk_generations[chunk_index] < self._generation:
+                if shared:
+                    self._chunks[chunk_index] = list(
+                        self._chunks[chunk_index])
+                self._chunk_generations[chunk_index] = self._generation
+            self._chunks[chunk_index][offset] = row
+
+
+class TableSnapshot(object):
+    """
+    A read-only view of a ``RecordTable`` at the moment the snapshot was
+    taken. Use ``RecordTable.snapshot()`` to create a snapshot.
+
+    A snapshot supports ``len()``, iteration and access to a row by integer
+    index or slice. Rows are returned as new records.
+    """
+    def __init__(self, rectype, chunks, chunk_size, length):
+        self.rectype = rectype
+        self.chunk_size = chunk_size
+        self._chunks = chunks
+        self._len = length
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        return _getitem(self.rectype, self._chunks, self.chunk_size,
+                        self._len, index)
+
+    def __iter__(self):
+        # A generator method, so that the snapshot stays alive (and the
+        # table keeps copying shared chunks) until iteration ends.
+        for rec in _iter_rows(self.rectype, self._chunks, self._len):
+            yield rec
+
+    def __repr__(self):
+        return '<TableSnapshot of {0} {1} records>'.format(
+            self._len, self.rectype.__name__)
+
+
+def _check_index(index, length):
+    if not isinstance(index, int):
+        raise TypeError('table indices must be integers, not {0}'
+                        .format(type(index).__name__))
+    if index < 0:
+        index += length
+    if not 0 <= index < length:
+        raise IndexError('table index out of range')
+    return index
+
+
+def _getitem(rectype, chunks, chunk_size, length, index):
+    """
+    Return the record at integer *index*, or a list of the records in the
+    slice *index*, of the rows in *chunks*.
+    """
+    make = rectype._make
+    if isinstance(index, slice):
+        return [make(chunks[i // chunk_size][i % chunk_size], False)
+                for i in range(*index.indices(length))]
+    index = _check_index(index, length)
+    return make(chunks[index // chunk_size][index % chunk_size], False)
+
+
+def _iter_rows(rectype, chunks, length):
+    """
+    Yield a record for each of the first *length* rows in *chunks*.
+    """
+    make = rectype._make
+    # Take a copy of the directory so that a table's chunks can be replaced
+    # while it is being iterated.
+    for chunk in list(chunks):
+        for row in chunk[:length]:
+            yield make(row, False)
+        length -= len(chunk)
+        if length <= 0:
+            return
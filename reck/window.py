@@ -0,0 +1,250 @@
+"""
+This module implements window(), which aggregates a stream of timestamped
+records over tumbling or sliding time windows.
+
+:copyright: (c) 2015 by Mark Richards.
+:license: BSD 3-Clause, see LICENSE.txt for more details.
+"""
+
+import collections
+import heapq
+import math
+import operator
+
+from .reck import recktype
+
+# Marks an aggregate that has not seen a value
+_MISSING = object()
+
+
+def window(records, time_field='ts', size=60, slide=None, aggs=None, by=None,
+           allowed_lateness=0, late=None, typename='Window'):
+    """
+    Aggregate the records in the iterable *records* over time windows and
+    return an iterator over one summary record per window (and group).
+
+    Windows are *size* time units long and start every *slide* units (at
+    multiples of *slide*), so each record falls in ``size / slide`` windows.
+    If *slide* is omitted, windows are tumbling: they do not overlap and each
+    record falls in exactly one window.
+
+    Records may arrive out of order. The stream keeps a watermark, which is
+    the latest time seen less *allowed_lateness*, and a window is closed
+    and its summary record emitted once the watermark reaches the window's
+    end. Records that only fall in closed windows are late: they are passed
+    to *late*, if given, and otherwise dropped. The remaining windows are
+    emitted when *records* is exhausted. Summary records are emitted in
+    order of window start.
+
+    Each open window holds one accumulator per aggregate rather than the
+    records themselves, so memory use depends on the number of open windows
+    (and groups), not on the number of records.
+
+    Example::
+
+        >>> from reck import window
+        >>> Reading = recktype('Reading', 'sensor ts value')
+        >>> readings = [Reading('s1', ts, ts % 7) for ts in range(0, 120, 5)]
+        >>> for summary in window(readings, size=60, aggs=[
+        ...         ('n', 'count'), ('peak', ('max', 'value')),
+        ...         ('avg', ('mean', 'value'))]):
+        ...     print(summary)
+        Window(start=0, end=60, n=12, peak=6, avg=3.0)
+        Window(start=60, end=120, n=12, peak=6, avg=2.9166666666666665)
+
+    The summary records are of a new record type named *typename* with the
+    fields ``start`` and ``end``, followed by the *by* field if given and
+    then one field per aggregate.
+
+    :param records: An iterable of records (or any objects with the time and
+        aggregated attributes).
+    :param time_field: The name of the attribute holding each record's time,
+        a number such as seconds since the epoch.
+    :param size: The length of each window.
+    :param slide: The interval between window starts. Defaults to *size*.
+    :param aggs: A sequence of ``(name, spec)`` pairs or a mapping of names
+        to specs, giving the aggregates computed for each window. A spec is
+        ``'count'`` (the number of records) or a ``(function, fieldname)``
+        pair, where function is one of ``'count'`` (the number of
+        non-``None`` values), ``'sum'``, ``'mean'``, ``'min'``, ``'max'``,
+        ``'first'`` or ``'last'``. ``None`` values are ignored. Defaults to
+        ``[('count', 'count')]``.
+    :param by: The name of an attribute to group records by within each
+        window. A summary record is emitted per window and group.
+    :param allowed_lateness: How far behind the latest time seen a record's
+        time may be before the windows it falls in are closed.
+    :param late: A function called with each late record.
+    :param typename: The name of the summary record type.
+    :raises ValueError: if *size*, *slide* or an aggregate spec is invalid,
+        or an aggregate name is not a valid fieldname.
+    """
+    if size <= 0:
+        raise ValueError('size must be positive: {0!r}'.format(size))
+    if slide is None:
+        slide = size
+    elif not 0 < slide <= size:
+        raise ValueError('slide must be positive and no greater than size: '
+                         '{0!r}'.format(slide))
+    if allowed_lateness < 0:
+        raise ValueError('allowed_lateness must not be negative: {0!r}'
+                         .format(allowed_lateness))
+    if aggs is None:
+        aggs = [('count', 'count')]
+    elif isinstance(aggs, collections.Mapping):
+        aggs = list(aggs.items())
+    aggregators = [_parse_agg(spec) for _, spec in aggs]
+    fieldnames = ['start', 'end']
+    if by is not None:
+        fieldnames.append(by)
+    fieldnames.extend(name for name, _ in aggs)
+    rectype = recktype(typename, fieldnames)
+    return _iter_windows(
+        records, operator.attrgetter(time_field), size, slide, aggregators,
+        None if by is None else operator.attrgetter(by), allowed_lateness,
+        late, rectype)
+
+
+def _iter_windows(records, get_time, size, slide, aggregators, get_group,
+                  allowed_lateness, late, rectype):
+    make = rectype._make
+    # Open windows: window start -> {group: [accumulator, ...]}
+    windows = {}
+    starts = []
+    watermark = latest = float('-inf')
+    nwindows = int(math.ceil(size / slide))
+
+    def emit(start):
+        end = start + size
+        for group, accumulators in windows.pop(start).items():
+            values = [start, end]
+            if get_group is not None:
+                values.append(group)
+            values.extend(
+                result(accumulator)
+                for (_, _, result, _), accumulator in zip(
+                    aggregators, accumulators))
+            yield make(values)
+
+    for rec in records:
+        ts = get_time(rec)
+        if ts > latest:
+            latest = ts
+            watermark = latest - allowed_lateness
+        group = None if get_group is None else get_group(rec)
+        # The latest window containing ts starts at or before ts
+        last_start = (ts // slide) * slide
+        accepted = False
+        for i in range(nwindows):
+            start = last_start - i * slide
+            if start + size <= ts:
+                break
+            if start + size <= watermark:
+                continue
+            accepted = True
+            groups = windows.get(start)
+            if groups is None:
+                groups = windows[start] = {}
+                heapq.heappush(starts, start)
+            accumulators = groups.get(group)
+            if accumulators is None:
+                accumulators = groups[group] = [
+                    init() for init, _, _, _ in aggregators]
+            for idx, (_, update, _, get_value) in enumerate(aggregators):
+                accumulators[idx] = update(
+                    accumulators[idx], get_value(rec))
+        if not accepted and late is not None:
+            late(rec)
+        while starts and starts[0] + size <= watermark:
+            for summary in emit(heapq.heappop(starts)):
+                yield summary
+
+    while starts:
+        for summary in emit(heapq.heappop(starts)):
+            yield summary
+
+
+def _parse_agg(spec):
+    """
+    Return an ``(init, update, result, get_value)`` tuple for the aggregate
+    *spec*.
+    """
+    if spec == 'count':
+        return _count_init, _count_update, _identity, _identity
+    try:
+        function, fieldname = spec
+        init, update, result = _AGGREGATES[function]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('invalid aggregate spec: {0!r}'.format(spec))
+    return init, update, result, operator.attrgetter(fieldname)
+
+
+def _identity(value):
+    return value
+
+
+def _count_init():
+    return 0
+
+
+def _count_update(acc, rec):
+    return acc + 1
+
+
+def _count_values_update(acc, value):
+    return acc if value is None else acc + 1
+
+
+def _sum_update(acc, value):
+    return acc if value is None else acc + value
+
+
+def _mean_init():
+    return (0, 0)
+
+
+def _mean_update(acc, value):
+    return acc if value is None else (acc[0] + value, acc[1] + 1)
+
+
+def _mean_result(acc):
+    return acc[0] / acc[1] if acc[1] else None
+
+
+def _missing():
+    return _MISSING
+
+
+def _none_if_missing(acc):
+    return None if acc is _MISSING else acc
+
+
+def _min_update(acc, value):
+    if value is None or (acc is not _MISSING and not value < acc):
+        return acc
+    return value
+
+
+def _max_update(acc, value):
+    if value is None or (acc is not _MISSING and not acc < value):
+        return acc
+    return value
+
+
+def _first_update(acc, value):
+    return value if acc is _MISSING and value is not None else acc
+
+
+def _last_update(acc, value):
+    return acc if value is None else value
+
+
+# function name -> (init, update, result)
+_AGGREGATES = {
+    'count': (_count_init, _count_values_update, _identity),
+    'sum': (_count_init, _sum_update, _identity),
+    'mean': (_mean_init, _mean_update, _mean_result),
+    'min': (_missing, _min_update, _none_if_missing),
+    'max': (_missing, _max_update, _none_if_missing),
+    'first': (_missing, _first_update, _none_if_missing),
+    'last': (_missing, _last_update, _none_if_missing),
+}
@@ -12,6 +12,7 @@ setup(
     author_email='mark.l.a.richardsREMOVETHIS@gmail.com',
     license='BSD 3-Clause',
     packages=['reck'],
+    extras_require={'numpy': ['numpy']},
     test_suite='tests',
     package_data={'': ['*.rst', '*.txt']},
     classifiers=[
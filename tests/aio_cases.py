@@ -0,0 +1,126 @@
+import asyncio
+import unittest
+
+from reck import recktype
+from reck.aio import read_records, read_batches, RecordWriter
+
+Reading = recktype('Reading', ['sensor', ('ts', 0, int), ('value', 0.0)])
+
+
+class _Writer(object):
+    def __init__(self):
+        self.data = b''
+        self.drains = 0
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        self.drains += 1
+
+    def close(self):
+        self.closed = True
+
+
+def _run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def _read(chunks, rectype, **kwargs):
+    reader = asyncio.StreamReader()
+    for chunk in chunks:
+        reader.feed_data(chunk)
+    reader.feed_eof()
+    return [rec async for rec in read_records(reader, rectype, **kwargs)]
+
+
+def _split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestReadRecords(unittest.TestCase):
+    def test_jsonl(self):
+        data = (b'{"sensor": "s1", "ts": 1, "value": 0.5}\n'
+                b'\n'
+                b'["s2", "2", 1.5]\n'
+                b'{"sensor": "s3"}')
+        for size in (1, 7, len(data)):
+            records = _run(_read(_split(data, size), Reading, chunk_size=5))
+            self.assertEqual([tuple(r) for r in records],
+                             [('s1', 1, 0.5), ('s2', 2, 1.5), ('s3', 0, 0.0)])
+
+    def test_struct(self):
+        R = recktype('R', 'a b')
+        data = b''.join(bytes([i, 0, 0, 0, i, 0]) for i in range(5))
+        records = _run(_read(_split(data, 4), R, format='struct',
+                             struct_format='<ih', chunk_size=3))
+        self.assertEqual([tuple(r) for r in records],
+                         [(i, i) for i in range(5)])
+        with self.assertRaises(EOFError):
+            _run(_read([data[:-1]], R, format='struct', struct_format='<ih'))
+        with self.assertRaises(ValueError):
+            _run(_read([data], R, format='struct', struct_format='<i'))
+        with self.assertRaises(ValueError):
+            _run(_read([data], R, format='struct'))
+
+    def test_csv(self):
+        data = b's1,1,"a\nb"\ns2,2,"x ""y"""\n\ns3,3,z'
+        for size in (1, 5, len(data)):
+            records = _run(_read(_split(data, size), Reading, format='csv',
+                                 chunk_size=4))
+            self.assertEqual([tuple(r) for r in records],
+                             [('s1', 1, 'a\nb'), ('s2', 2, 'x "y"'),
+                              ('s3', 3, 'z')])
+
+    def test_batches(self):
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b'["a", 1, 1]\n["b", 2, 2]\n["c", 3, 3]\n')
+            reader.feed_eof()
+            return [batch async for batch in read_batches(reader, Reading)]
+        batches = _run(read())
+        self.assertEqual([len(batch) for batch in batches], [3])
+
+    def test_bad_format(self):
+        with self.assertRaises(ValueError):
+            _run(_read([b''], Reading, format='xml'))
+
+
+class TestRecordWriter(unittest.TestCase):
+    def test_round_trip(self):
+        records = [Reading('s{0}'.format(i), i, i / 2) for i in range(10)]
+        for format, kwargs in [('jsonl', {}), ('csv', {}),
+                               ('struct', {'struct_format': '<2sid'})]:
+            if format == 'struct':
+                records = [Reading(r.sensor.encode(), r.ts, r.value)
+                           for r in records]
+            writer = _Writer()
+
+            async def write():
+                async with RecordWriter(writer, Reading, format,
+                                        batch_size=4, **kwargs) as out:
+                    await out.write(records[0])
+                    await out.write_many(records[1:])
+            _run(write())
+            self.assertTrue(writer.closed)
+            self.assertEqual(writer.drains, 3)
+            read = _run(_read([writer.data], Reading, format=format, **kwargs))
+            if format == 'csv':
+                read = [(r.sensor, r.ts, float(r.value)) for r in read]
+            self.assertEqual([tuple(r) for r in read],
+                             [tuple(r) for r in records])
+
+    def test_bad_args(self):
+        with self.assertRaises(ValueError):
+            RecordWriter(_Writer(), Reading, batch_size=0)
+        with self.assertRaises(ValueError):
+            RecordWriter(_Writer(), Reading, format='xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
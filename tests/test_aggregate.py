@@ -0,0 +1,142 @@
+import gc
+import random
+import unittest
+import weakref
+
+from reck import recktype, RecordCollection
+
+
+def _optional_int(value):
+    return None if value is None else int(value)
+
+
+Order = recktype('Order', ['id', 'region', ('amount', None, _optional_int)])
+
+
+class TestRecordCollection(unittest.TestCase):
+
+    def check(self, orders, aggs):
+        records = list(orders)
+        amounts = [r.amount for r in records if r.amount is not None]
+        self.assertEqual(aggs['count'].value, len(records))
+        self.assertEqual(aggs['sum'].value, sum(amounts))
+        self.assertEqual(aggs['mean'].value,
+                         sum(amounts) / len(amounts) if amounts else None)
+        self.assertEqual(aggs['min'].value, min(amounts) if amounts else None)
+        self.assertEqual(aggs['max'].value, max(amounts) if amounts else None)
+        sums = {}
+        counts = {}
+        for r in records:
+            counts[r.region] = counts.get(r.region, 0) + 1
+            sums[r.region] = sums.get(r.region, 0) + (r.amount or 0)
+        self.assertEqual(aggs['group_sum'].value, sums)
+        self.assertEqual(aggs['group_count'].value, counts)
+
+    def test_live_aggregates(self):
+        rng = random.Random(1)
+        orders = RecordCollection(
+            Order, [Order(i, 'r{0}'.format(i % 3), i) for i in range(20)])
+        aggs = {
+            'count': orders.count(),
+            'sum': orders.sum('amount'),
+            'mean': orders.mean('amount'),
+            'min': orders.min('amount'),
+            'max': orders.max('amount'),
+            'group_sum': orders.group_sum('region', 'amount'),
+            'group_count': orders.group_count('region'),
+        }
+        self.check(orders, aggs)
+        outside = Order(99, 'r0', 1000)
+        for step in range(2000):
+            records = list(orders)
+            rec = rng.choice(records)
+            action = rng.randrange(6)
+            if action == 0:
+                rec.amount = rng.randrange(-50, 50)
+            elif action == 1:
+                rec[1] = 'r{0}'.format(rng.randrange(5))
+            elif action == 2:
+                rec._update(region='r{0}'.format(rng.randrange(5)),
+                            amount=rng.choice([None, rng.randrange(100)]))
+            elif action == 3 and len(records) > 1:
+                orders.remove(rec)
+            elif action == 4:
+                orders.add(Order(step, 'r1', str(rng.randrange(10))))
+            else:
+                rec[1:] = ['r9', '7']
+            outside.amount = step     # not in the collection
+            self.check(orders, aggs)
+        self.assertEqual(aggs['group_sum']['missing'], 0)
+
+        orders.clear()
+        self.check(orders, aggs)
+        self.assertEqual(aggs['max'].value, None)
+
+    def test_records(self):
+        orders = RecordCollection(Order)
+        order = Order(1, 'eu', 5)
+        orders.add(order)
+        self.assertIn(order, orders)
+        self.assertNotIn(Order(1, 'eu', 5), orders)
+        self.assertEqual(len(orders), 1)
+        with self.assertRaises(ValueError):
+            orders.add(order)
+        with self.assertRaises(TypeError):
+            orders.add((1, 'eu', 5))
+        with self.assertRaises(ValueError):
+            orders.remove(Order(1, 'eu', 5))
+        orders.discard(Order(1, 'eu', 5))
+        orders.discard(order)
+        self.assertEqual(len(orders), 0)
+        with self.assertRaises(ValueError):
+            orders.sum('qty')
+
+        # A record can be in several collections
+        first = RecordCollection(Order, [order])
+        second = RecordCollection(Order, [order])
+        totals = [first.sum('amount'), second.sum('amount')]
+        order.amount = '8'
+        self.assertEqual([total.value for total in totals], [8, 8])
+        second.remove(order)
+        order.amount = 2
+        self.assertEqual([total.value for total in totals], [2, 0])
+
+    def test_lazy_records(self):
+        LazyOrder = Order._lazytype(converters={'id': int}, split=',')
+        orders = RecordCollection(Order)
+        total = orders.sum('amount')
+        order = LazyOrder('1,eu,5')
+        orders.add(order)
+        orders.add(LazyOrder('2,us,3'))
+        self.assertEqual(total.value, 8)
+        order.amount = 10
+        self.assertEqual(total.value, 13)
+
+        # A collection of the lazy type
+        lazy_orders = RecordCollection(LazyOrder, [LazyOrder('3,eu,4')])
+        lazy_total = lazy_orders.sum('amount')
+        lazy_orders.add(order)
+        self.assertEqual(lazy_total.value, 14)
+        order.amount = 1
+        self.assertEqual((total.value, lazy_total.value), (4, 5))
+        order[2] = 2
+        self.assertEqual((total.value, lazy_total.value), (5, 6))
+
+    def test_dropped_collection(self):
+        order = Order(1, 'eu', 5)
+        orders = RecordCollection(Order, [order])
+        total = orders.sum('amount')
+        ref = weakref.ref(orders)
+        del orders, total
+        gc.collect()
+        self.assertIsNone(ref())
+        order.amount = 7
+        self.assertEqual(order.amount, 7)
+        # The record's entry is removed by the next add()
+        RecordCollection(Order, [Order(2, 'us', 1)])
+        observers = RecordCollection(Order)._observers
+        self.assertNotIn(id(order), observers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,10 @@
+import sys
+import unittest
+
+# reck.aio and its tests use async/await syntax, which is a SyntaxError
+# before Python 3.6, so the tests are only imported on 3.6+.
+if sys.version_info < (3, 6):
+    raise unittest.SkipTest('reck.aio requires Python 3.6+')
+
+from .aio_cases import *  # noqa: F401,F403
+
@@ -0,0 +1,67 @@
+import threading
+import unittest
+
+from reck import recktype, AppendBuffer
+
+Message = recktype('Message', 'source seq')
+
+
+class TestAppendBuffer(unittest.TestCase):
+    def test_append(self):
+        buffer = AppendBuffer(Message, chunk_rows=2)
+        buffer.append(Message('a', 1))
+        self.assertEqual(buffer.drain(), [])
+        buffer.append(('a', 2))
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(buffer.drain(), [[Message('a', 1),
+                                           Message('a', 2)]])
+        buffer.extend([('a', 3), Message('a', 4), ('a', 5)])
+        buffer.flush()
+        self.assertEqual(buffer.drain(max_batches=1),
+                         [[Message('a', 3), Message('a', 4)]])
+        self.assertEqual(buffer.drain(), [[Message('a', 5)]])
+        self.assertRaises(TypeError, buffer.append, ('a',))
+        self.assertRaises(ValueError, AppendBuffer, Message, chunk_rows=0)
+
+    def test_close(self):
+        with AppendBuffer(Message) as buffer:
+            buffer.append(('a', 1))
+        self.assertTrue(buffer.closed)
+        self.assertRaises(ValueError, buffer.append, ('a', 2))
+        self.assertEqual(list(buffer.batches()), [[Message('a', 1)]])
+        self.assertEqual(buffer.drain(timeout=None), [])
+
+    def test_producers(self):
+        buffer = AppendBuffer(Message, chunk_rows=7)
+        nproducers = 6
+        nmessages = 1000
+
+        def produce(source):
+            for seq in range(nmessages):
+                buffer.append((source, seq))
+
+        producers = [threading.Thread(target=produce, args=(source,))
+                     for source in range(nproducers)]
+        received = []
+        consumer = threading.Thread(
+            target=lambda: received.extend(buffer.batches()))
+        consumer.start()
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        buffer.close()
+        consumer.join()
+        by_source = {}
+        for batch in received:
+            self.assertLessEqual(len(batch), 7)
+            for msg in batch:
+                by_source.setdefault(msg.source, []).append(msg.seq)
+        # Each producer's records arrive complete and in order
+        self.assertEqual(by_source,
+                         dict.fromkeys(range(nproducers),
+                                       list(range(nmessages))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from reck import recktype
+from reck import columnar
+
+Trade = recktype('Trade', ['ts', 'sym', 'qty', ('price', None)])
+
+
+def make_trades(n):
+    return [Trade(ts, 'S{0}'.format(ts % 3), ts * 10,
+                  None if ts % 5 == 0 else ts / 4)
+            for ts in range(n)]
+
+
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'trades.col')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_roundtrip(self):
+        trades = make_trades(1000)
+        for codec in columnar.CODECS:
+            for workers in (1, 3):
+                n = columnar.write(self.path, trades, Trade, chunk_rows=64,
+                                   codec=codec, workers=workers)
+                self.assertEqual(n, 1000)
+                self.assertEqual(
+                    list(columnar.read(self.path, rectype=Trade,
+                                       workers=workers)),
+                    trades)
+        # The record type can be created from the file schema
+        rec = next(columnar.read(self.path))
+        self.assertEqual(type(rec).__name__, 'Trade')
+        self.assertEqual(tuple(rec), tuple(trades[0]))
+
+    def test_empty(self):
+        self.assertEqual(columnar.write(self.path, [], Trade), 0)
+        self.assertEqual(list(columnar.read(self.path, rectype=Trade)), [])
+
+    def test_columns(self):
+        trades = make_trades(300)
+        columnar.write(self.path, trades, Trade, chunk_rows=100)
+        batches = list(columnar.read(self.path, ['price', 'ts'],
+                                     rectype=Trade, columns=True))
+        self.assertEqual([len(batch) for batch in batches], [100] * 3)
+        self.assertEqual(batches[0].rectype._fieldnames, ('price', 'ts'))
+        # Integer columns are read back as arrays
+        self.assertEqual(batches[1].column('ts').typecode, 'q')
+        self.assertEqual(list(batches[2].column('ts')), list(range(200, 300)))
+        recs = list(columnar.read(self.path, 'sym', rectype=Trade))
+        self.assertEqual([rec.sym for rec in recs],
+                         [trade.sym for trade in trades])
+
+    def test_where(self):
+        trades = make_trades(1000)
+        columnar.write(self.path, trades, Trade, chunk_rows=100)
+        with open(self.path, 'rb') as fileobj:
+            footer = columnar._read_footer(fileobj, self.path)
+        self.assertEqual(footer['chunks'][1]['columns'][0][3], [100, 199])
+        self.assertEqual(footer['chunks'][1]['columns'][1][3],
+                         ['S0', 'S2'])
+
+        decoded = []
+        original = columnar._decode_column
+
+        def decode_column(*args):
+            decoded.append(args)
+            return original(*args)
+
+        columnar._decode_column = decode_column
+        try:
+            recs = list(columnar.read(
+                self.path, ['qty'], rectype=Trade,
+                where={'ts': (250, 420), 'price': (None, 100)}))
+        finally:
+            columnar._decode_column = original
+        self.assertEqual(
+            [rec.qty for rec in recs],
+            [trade.qty for trade in trades
+             if 250 <= trade.ts <= 420 and trade.price is not None and
+             trade.price <= 100])
+        # Only the qty, ts and price columns of chunks 2 and 3. Chunk 4 has
+        # no price <= 100.
+        self.assertEqual(len(decoded), 2 * 3)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, columnar.write, self.path, [], Trade,
+                          codec='gzip')
+        self.assertRaises(ValueError, columnar.write, self.path, [], Trade,
+                          chunk_rows=0)
+        columnar.write(self.path, make_trades(10), Trade)
+        Other = recktype('Other', 'a b c d')
+        self.assertRaises(ValueError, columnar.read, self.path,
+                          rectype=Other)
+        self.assertRaises(ValueError, columnar.read, self.path, ['bogus'])
+        with open(self.path, 'wb') as fileobj:
+            fileobj.write(b'not a columnar file')
+        self.assertRaises(ValueError, columnar.read, self.path)
+
+    def test_stats(self):
+        self.assertEqual(columnar._column_stats([None, 'b', 'a']),
+                         ['a', 'b'])
+        self.assertEqual(columnar._column_stats([None, None]), 'empty')
+        self.assertIsNone(columnar._column_stats([1, 'a']))
+        self.assertIsNone(columnar._column_stats([True, False]))
+        self.assertIsNone(columnar._column_stats([1.0, float('nan')]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import random
+import unittest
+
+from reck import recktype, dedup
+from reck.dedup import _FingerprintSet, _MAX_RUNS
+
+Event = recktype('Event', 'id kind payload')
+
+
+class TestDedup(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(5)
+        self.events = [Event(rng.randrange(500), rng.choice('abc'), None)
+                       for _ in range(3000)]
+
+    def expected(self, key):
+        seen = set()
+        result = []
+        for event in self.events:
+            values = key(event)
+            if values not in seen:
+                seen.add(values)
+                result.append(event)
+        return result
+
+    def test_exact(self):
+        self.assertEqual(list(dedup(self.events)),
+                         self.expected(tuple))
+        self.assertEqual(list(dedup(self.events, key='kind')),
+                         self.expected(lambda e: e.kind))
+        self.assertEqual(list(dedup(self.events, key=('id', 'kind'))),
+                         self.expected(lambda e: (e.id, e.kind)))
+
+    def test_spill(self):
+        spills = []
+        spill = _FingerprintSet._spill
+
+        def counting_spill(self):
+            spills.append(len(self._runs))
+            spill(self)
+        _FingerprintSet._spill = counting_spill
+        try:
+            # Room for about 20 fingerprints in memory
+            result = list(dedup(self.events, max_memory=2000))
+        finally:
+            _FingerprintSet._spill = spill
+        self.assertEqual(result, self.expected(tuple))
+        # Runs were spilled and merged
+        self.assertGreater(len(spills), _MAX_RUNS)
+        self.assertLess(max(spills), _MAX_RUNS + 1)
+
+    def test_bloom_filter(self):
+        events = [Event(i, 'a', None) for i in range(2000)]
+        result = list(dedup(events + events, error_rate=0.01,
+                            max_memory='4KB'))
+        # No duplicates get through and few unique records are dropped
+        self.assertEqual(len(set(e.id for e in result)), len(result))
+        self.assertGreater(len(result), 1960)
+
+    def test_bad_args(self):
+        for kwargs in ({'error_rate': 0}, {'error_rate': 1},
+                       {'max_memory': 0}, {'max_memory': 'lots'}):
+            with self.assertRaises(ValueError):
+                dedup([], **kwargs)
+
+
+if __name__ == '__main__':
+    unittest.main()
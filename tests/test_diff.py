@@ -0,0 +1,99 @@
+import random
+import unittest
+
+from reck import recktype, diff
+from reck.diff import fingerprint, fingerprints
+
+Row = recktype('Row', 'id region name qty')
+
+
+class TestDiff(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.old = [Row(i, i % 3, 'n{0}'.format(i), i) for i in range(300)]
+        self.new = []
+        self.expected = {}
+        for row in self.old:
+            action = rng.randrange(4)
+            if action == 0:
+                self.expected[row.id] = ('delete', None)
+                continue
+            row = row._copy()
+            if action == 1:
+                row.qty += 1
+                row.name = 'x'
+                self.expected[row.id] = ('change', ('name', 'qty'))
+            self.new.append(row)
+        for i in range(300, 320):
+            self.new.append(Row(i, 0, 'new', i))
+            self.expected[i] = ('insert', None)
+
+    def check(self, changes, fields=True):
+        result = {}
+        for change in changes:
+            self.assertNotIn(change.key, result)
+            result[change.key] = (change.kind,
+                                  change.fields if fields else None)
+            if change.kind != 'insert':
+                self.assertIsNotNone(change.old)
+            if change.kind != 'delete':
+                self.assertIsNotNone(change.new)
+        if not fields:
+            expected = dict((k, (kind, None))
+                            for k, (kind, _) in self.expected.items())
+        else:
+            expected = self.expected
+        self.assertEqual(result, expected)
+
+    def test_unsorted(self):
+        rng = random.Random(1)
+        rng.shuffle(self.old)
+        rng.shuffle(self.new)
+        self.check(diff(self.old, self.new))
+
+    def test_presorted(self):
+        self.check(diff(iter(self.old), iter(self.new), presorted=True))
+        with self.assertRaises(ValueError):
+            list(diff(self.old[::-1], self.new, presorted=True))
+        with self.assertRaises(ValueError):
+            list(diff(self.old, self.new + self.new[-1:], presorted=True))
+
+    def test_fingerprints(self):
+        self.assertEqual(fingerprint(Row(1, 2, 'a', 3)),
+                         fingerprint(Row(1, 2, 'a', 3)))
+        self.assertNotEqual(fingerprint(Row(1, 2, 'a', 3)),
+                            fingerprint(Row(1, 2, 'a', 4)))
+        self.assertEqual(len(fingerprint(Row(1, 2, 'a', 3))), 16)
+        old_prints = list(fingerprints(self.old))
+        for presorted in (False, True):
+            self.check(diff(old_prints, self.new, presorted=presorted,
+                            fingerprint=True), fields=False)
+            self.check(diff(self.old, self.new, presorted=presorted,
+                            fingerprint=True), fields=False)
+
+    def test_composite_key(self):
+        old = [Row(1, 'eu', 'a', 1), Row(1, 'us', 'b', 1)]
+        new = [Row(1, 'eu', 'a', 2), Row(2, 'us', 'b', 1)]
+        changes = list(diff(old, new, key=('id', 'region')))
+        self.assertEqual(
+            [(c.kind, c.key, c.fields) for c in changes],
+            [('change', (1, 'eu'), ('qty',)), ('insert', (2, 'us'), None),
+             ('delete', (1, 'us'), None)])
+        with self.assertRaises(ValueError):
+            list(diff(old + old, new))
+
+    def test_lazy_records(self):
+        # Equal records of a type and its lazy type are not changes
+        LazyRow = Row._lazytype(converters={'id': int, 'qty': int},
+                                   split=',')
+        old = [Row(1, 'eu', 'a', 1), Row(2, 'us', 'b', 1)]
+        new = [LazyRow('1,eu,a,1'), LazyRow('2,us,b,3')]
+        for presorted in False, True:
+            changes = list(diff(old, new, presorted=presorted))
+            self.assertEqual([(c.kind, c.key, c.fields) for c in changes],
+                             [('change', 2, ('qty',))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import random
+import unittest
+
+from reck import recktype, sort
+from reck import extsort
+from reck.codec import RecordCodec
+
+Event = recktype('Event', ['ts', 'id', ('payload', None)])
+
+
+class TestRecordCodec(unittest.TestCase):
+
+    def test_encode_decode(self):
+        codec = RecordCodec(Event)
+        event = Event(1, 2, {'x': [1, 2]})
+        self.assertEqual(codec.decode(codec.encode(event)), event)
+
+    def test_read_write(self):
+        import io
+        codec = RecordCodec(Event)
+        events = [Event(i, -i) for i in range(10)]
+        buf = io.BytesIO()
+        for event in events:
+            codec.write(buf, event)
+        buf.seek(0)
+        self.assertEqual(list(codec.iter_read(buf)), events)
+
+        # A frame that has been cut short
+        buf = io.BytesIO(buf.getvalue()[:-1])
+        with self.assertRaises(EOFError):
+            list(codec.iter_read(buf))
+
+
+class TestSort(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(42)
+        self.events = [
+            Event(rand.randint(0, 50), i) for i in range(2000)]
+
+    def test_sort_in_memory(self):
+        result = list(sort(self.events, key='ts'))
+        self.assertEqual(result, sorted(self.events, key=lambda e: e.ts))
+
+    def test_sort_with_spill(self):
+        # A tiny memory limit forces many runs to be spilled to disk
+        result = list(sort(iter(self.events), key=('ts', 'id'),
+                           memory_limit=4096))
+        self.assertEqual(
+            result, sorted(self.events, key=lambda e: (e.ts, e.id)))
+
+    def test_sort_is_stable(self):
+        result = list(sort(self.events, key='ts', memory_limit='4KB'))
+        self.assertEqual(result, sorted(self.events, key=lambda e: e.ts))
+        result = list(sort(self.events, key='ts', reverse=True,
+                           memory_limit='4KB'))
+        self.assertEqual(
+            result, sorted(self.events, key=lambda e: e.ts, reverse=True))
+
+    def test_sort_merge_passes(self):
+        # With a small merge width, runs are merged in several passes and
+        # no merge reads more runs than the width at once
+        merge_runs = extsort._merge_runs
+        widths = []
+
+        def recording_merge_runs(runfiles, *args):
+            widths.append(len(runfiles))
+            return merge_runs(runfiles, *args)
+
+        extsort._MAX_MERGE_RUNS = 3
+        extsort._merge_runs = recording_merge_runs
+        try:
+            for reverse in False, True:
+                del widths[:]
+                result = list(sort(self.events, key='ts', reverse=reverse,
+                                   memory_limit='2KB'))
+                self.assertEqual(result, sorted(
+                    self.events, key=lambda e: e.ts, reverse=reverse))
+                self.assertGreater(len(widths), 3)
+                self.assertLessEqual(max(widths), 3)
+        finally:
+            extsort._MAX_MERGE_RUNS = 64
+            extsort._merge_runs = merge_runs
+
+    def test_sort_by_all_fields_and_callable(self):
+        result = list(sort(self.events, memory_limit='8KB'))
+        self.assertEqual(result, sorted(self.events, key=tuple))
+        result = list(sort(self.events, key=lambda e: -e.id,
+                           memory_limit='8KB'))
+        self.assertEqual([e.id for e in result], list(range(1999, -1, -1)))
+
+    def test_sort_empty(self):
+        self.assertEqual(list(sort([])), [])
+
+    def test_bad_args(self):
+        # Arguments are checked when sort() is called
+        with self.assertRaises(ValueError):
+            sort(self.events, key='nope')
+        with self.assertRaises(ValueError):
+            sort(self.events, memory_limit='lots')
+        with self.assertRaises(ValueError):
+            sort([], memory_limit='bogus')
+        with self.assertRaises(ValueError):
+            sort(self.events, memory_limit=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
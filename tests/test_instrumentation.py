@@ -0,0 +1,65 @@
+import pickle
+import unittest
+
+import reck
+from reck import recktype
+
+Rec = recktype('Rec', ['a', 'b'])
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def tearDown(self):
+        reck.instrument(False)
+        reck.stats(reset=True)
+
+    def test_instrument(self):
+        original_init = Rec.__dict__['__init__']
+        reck.stats(reset=True)
+        reck.instrument(sample_every=2)
+        self.assertIsNot(Rec.__dict__['__init__'], original_init)
+
+        # Types created while instrumentation is enabled are instrumented too
+        Other = recktype('Other', 'x')
+        for i in range(5):
+            rec = Rec(i, i)
+        rec._update(b=5)
+        rec[0] = rec[1]
+        rec._asdict()
+        pickle.loads(pickle.dumps(rec))
+        Other(1)
+
+        report = reck.stats()
+        entry = report[__name__ + '.Rec']
+        self.assertEqual(entry['calls']['__init__'], 5)
+        self.assertEqual(entry['calls']['_update'], 1)
+        self.assertEqual(entry['calls']['__setitem__'], 1)
+        self.assertGreaterEqual(entry['calls']['__getitem__'], 1)
+        self.assertEqual(entry['calls']['_asdict'], 1)
+        self.assertEqual(entry['calls']['__getstate__'], 1)
+        self.assertEqual(entry['calls']['__setstate__'], 1)
+        self.assertGreater(entry['seconds']['__init__'], 0)
+        self.assertEqual(entry['size_samples'], 3)  # 1st, 3rd and 5th
+        self.assertGreater(entry['mean_size'], 0)
+        self.assertEqual(report[__name__ + '.Other']['calls']['__init__'], 1)
+
+        # Disabling restores the original methods
+        reck.instrument(False)
+        self.assertIs(Rec.__dict__['__init__'], original_init)
+        Rec(1, 2)
+        self.assertEqual(
+            reck.stats(reset=True)[__name__ + '.Rec']['calls']['__init__'], 5)
+        self.assertEqual(reck.stats(), {})
+
+    def test_instrument_is_idempotent(self):
+        reck.instrument()
+        reck.instrument()
+        Rec(1, 2)
+        self.assertEqual(
+            reck.stats()[__name__ + '.Rec']['calls']['__init__'], 1)
+        with self.assertRaises(ValueError):
+            reck.instrument(sample_every=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
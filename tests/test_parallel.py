@@ -0,0 +1,133 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from reck import recktype, ColumnBatch, parse_parallel
+
+Trade = recktype('Trade', [('id', None, int), 'sym', ('price', None, float)])
+
+
+class TestColumnBatch(unittest.TestCase):
+    def test_batch(self):
+        trades = [Trade(i, 'S{0}'.format(i), i / 4) for i in range(5)]
+        batch = ColumnBatch.from_records(Trade, trades)
+        self.assertEqual(len(batch), 5)
+        self.assertEqual(batch.column('id'), [0, 1, 2, 3, 4])
+        self.assertEqual(batch.records(), trades)
+        self.assertEqual(list(batch), trades)
+        with self.assertRaises(ValueError):
+            batch.column('qty')
+
+        batch.compact()
+        self.assertEqual(batch.column('id').typecode, 'q')
+        self.assertEqual(batch.column('price').typecode, 'd')
+        self.assertIsInstance(batch.column('sym'), list)
+        self.assertEqual(batch.records(), trades)
+
+        self.assertEqual(len(ColumnBatch.from_records(Trade, [])), 0)
+        with self.assertRaises(ValueError):
+            ColumnBatch(Trade, [[1], [2]])
+        with self.assertRaises(ValueError):
+            ColumnBatch(Trade, [[1], [2], []])
+
+    def test_pickle_dynamic_type(self):
+        R = recktype('R', 'a b')
+        batch = pickle.loads(pickle.dumps(ColumnBatch(R, [[1], [2]])))
+        self.assertIs(batch.rectype, R)
+        self.assertEqual(batch.records(), [R(1, 2)])
+
+    @unittest.skipIf(not hasattr(pickle, 'PickleBuffer'),
+                     'requires pickle protocol 5')
+    def test_pickle_out_of_band(self):
+        trades = [Trade(i, 'S', i / 4) for i in range(1000)]
+        batch = ColumnBatch.from_records(Trade, trades).compact()
+        buffers = []
+        data = pickle.dumps(batch, protocol=5,
+                            buffer_callback=buffers.append)
+        self.assertEqual(len(buffers), 2)
+        self.assertLess(len(data), 8000)
+        restored = pickle.loads(data, buffers=buffers)
+        self.assertEqual(restored.column('id').typecode, 'q')
+        self.assertEqual(restored.records(), trades)
+
+        # In-band protocol 5 and older protocols
+        for protocol in (2, 5):
+            restored = pickle.loads(pickle.dumps(batch, protocol=protocol))
+            self.assertEqual(restored.column('price'), batch.column('price'))
+            self.assertEqual(restored.records(), trades)
+
+
+class TestParseParallel(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.trades = [Trade(i, 'S{0}'.format(i % 7), i / 2)
+                       for i in range(200)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, text):
+        path = os.path.join(self.tempdir, 'data')
+        with open(path, 'w') as fileobj:
+            fileobj.write(text)
+        return path
+
+    def test_csv(self):
+        path = self.write('id,sym,price\n' + ''.join(
+            '{0},{1},{2}\n'.format(*trade) for trade in self.trades))
+        for workers in (1, 2):
+            records = list(parse_parallel(path, Trade, workers=workers,
+                                          chunk_size=100, header=True))
+            self.assertEqual(records, self.trades)
+
+        batches = list(parse_parallel(path, Trade, workers=2, columns=True,
+                                      chunk_size=1000, header=True))
+        self.assertGreater(len(batches), 1)
+        self.assertEqual(sum(map(len, batches)), len(self.trades))
+        self.assertEqual(batches[0].column('id').typecode, 'q')
+
+    def test_jsonl(self):
+        R = recktype('R', ['a', ('b', 'x')])
+        path = self.write('{"a": 1}\n\n[2, "y"]\n{"a": 3, "b": "z"}')
+        records = list(parse_parallel(path, R, format='jsonl', workers=2,
+                                      chunk_size=5))
+        self.assertEqual([tuple(r) for r in records],
+                         [(1, 'x'), (2, 'y'), (3, 'z')])
+
+    def test_fixed(self):
+        path = self.write(''.join(
+            '{0:<5}{1:>4}{2:>8}\r\n'.format(*trade) for trade in self.trades))
+        records = list(parse_parallel(path, Trade, format='fixed',
+                                      widths=[5, 4, 8], workers=2,
+                                      chunk_size=500))
+        self.assertEqual(records, self.trades)
+
+        R = recktype('R', ['sym', ('id', None, int)])
+        R._fixed_layout([('id', 0, 5), ('sym', 5, 9, '>')])
+        records = list(parse_parallel(path, R, format='fixed', workers=2,
+                                      chunk_size=500))
+        self.assertEqual([tuple(r) for r in records],
+                         [(t.sym, t.id) for t in self.trades])
+
+    def test_empty_file(self):
+        path = self.write('')
+        self.assertEqual(list(parse_parallel(path, Trade, workers=2)), [])
+
+    def test_errors(self):
+        path = self.write('1,a\n')
+        with self.assertRaises(ValueError):
+            list(parse_parallel(path, Trade, workers=1))
+        with self.assertRaises(ValueError):
+            parse_parallel(path, Trade, format='xml')
+        with self.assertRaises(ValueError):
+            parse_parallel(path, Trade, format='fixed')
+        with self.assertRaises(ValueError):
+            parse_parallel(path, Trade, format='fixed', widths=[1])
+        with self.assertRaises(ValueError):
+            parse_parallel(path, Trade, workers=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
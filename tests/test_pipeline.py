@@ -0,0 +1,93 @@
+import threading
+import unittest
+
+from reck import recktype, pipeline
+
+Reading = recktype('Reading', ['sensor', 'ts', 'value'])
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.readings = [Reading('s{0}'.format(i % 3), i, i * 0.5)
+                         for i in range(1000)]
+
+    def test_map_filter(self):
+        result = list(pipeline(self.readings, batch_size=64)
+                      .filter(lambda r: r.ts % 2 == 0)
+                      .map(lambda r: r.value))
+        self.assertEqual(result, [r.value for r in self.readings
+                                  if r.ts % 2 == 0])
+        # Pipelines are immutable so they can be reused
+        p = pipeline(self.readings)
+        p.map(lambda r: r.ts)
+        self.assertEqual(list(p), self.readings)
+
+    def test_project(self):
+        result = list(pipeline(iter(self.readings)).project('ts', 'sensor'))
+        self.assertEqual(len(result), 1000)
+        self.assertEqual(type(result[0])._fieldnames, ('ts', 'sensor'))
+        self.assertEqual(tuple(result[5]), (5, 's2'))
+        # The derived type is reused for every record
+        self.assertIs(type(result[0]), type(result[-1]))
+
+        result = list(pipeline(self.readings).project('value'))
+        self.assertEqual(tuple(result[2]), (1.0,))
+
+        with self.assertRaises(ValueError):
+            list(pipeline(self.readings).project('nope'))
+        with self.assertRaises(ValueError):
+            pipeline(self.readings).project()
+
+    def test_batch(self):
+        batches = list(pipeline(self.readings)
+                       .filter(lambda r: r.ts % 3)
+                       .batch(100))
+        self.assertEqual([len(b) for b in batches], [100] * 6 + [66])
+        self.assertEqual(sum(batches, []),
+                         [r for r in self.readings if r.ts % 3])
+        with self.assertRaises(ValueError):
+            pipeline(self.readings).batch(0)
+
+    def test_threaded(self):
+        threads = set()
+
+        def record_thread(rec):
+            threads.add(threading.current_thread().name)
+            return rec
+
+        result = list(pipeline(self.readings, batch_size=10)
+                      .map(record_thread)
+                      .threaded(maxsize=2)
+                      .map(lambda r: r.ts))
+        self.assertEqual(result, list(range(1000)))
+        self.assertEqual(threads, set(['reck-pipeline']))
+
+        # Exceptions in the background thread are raised in the consumer
+        def fail(rec):
+            raise KeyError(rec.ts)
+        with self.assertRaises(KeyError):
+            list(pipeline(self.readings).map(fail).threaded())
+
+        # Stopping early stops the background thread
+        it = iter(pipeline(self.readings, batch_size=1)
+                  .threaded(maxsize=1).batch(1))
+        next(it)
+        it.close()
+
+    def test_sink(self):
+        for maxsize in 0, 2:
+            received = []
+            count = pipeline(self.readings).batch(300).sink(
+                received.append, maxsize=maxsize)
+            self.assertEqual(count, 1000)
+            self.assertEqual([len(b) for b in received], [300, 300, 300, 100])
+
+        def fail(batch):
+            raise KeyError()
+        with self.assertRaises(KeyError):
+            pipeline(self.readings).batch(10).sink(fail, maxsize=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,17 @@
 
 from collections import OrderedDict
+import copy
 import pickle
 from sys import version_info
 import unittest
 
-from reck import recktype, DefaultFactory
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from reck import recktype, get_rectype, DefaultFactory
+import reck.reck
 
 Rec = recktype('Rec', ['a', 'b'])
 
@@ -229,6 +236,89 @@ class TestReck(unittest.TestCase):
         self.assertNotEqual(rec1.b, rec2.b)
         self.assertEqual(rec2.b, dict(val1=1, val2=2))
 
+    def test_recktype_with_intern(self):
+        R = recktype('R', ['id', ('country', None, {'intern': True}),
+                           'status', 'coords'],
+                     intern=['status', 'coords'])
+        self.assertEqual(R._intern_fields,
+                         frozenset(['country', 'status', 'coords']))
+        country = ''.join(['Scot', 'land'])
+        rec1 = R(1, country, 'active', (1.0, 2.0))
+        rec2 = R(id=2, country=''.join(['Scot', 'land']),
+                 status=''.join(['act', 'ive']), coords=(1.0, 2.0))
+        self.assertIs(rec1.country, rec2.country)
+        self.assertIs(rec1.status, rec2.status)
+        self.assertIs(rec1.coords, rec2.coords)
+
+        # All forms of assignment are interned
+        rec1.status = ''.join(['clo', 'sed'])
+        rec2[2] = ''.join(['clo', 'sed'])
+        self.assertIs(rec1.status, rec2.status)
+        rec1._update(coords=(3, 4))
+        rec2[3:] = [(3, 4)]
+        self.assertIs(rec1.coords, rec2.coords)
+
+        # Equal values of different types are kept apart and unhashable
+        # values are stored unchanged
+        rec1.coords = 1
+        rec2.coords = True
+        self.assertIs(rec2.coords, True)
+        rec1.coords = [1, 2]
+        self.assertEqual(rec1.coords, [1, 2])
+
+        # Non-interned fields are plain slots
+        self.assertIs(R.__dict__['id'], R._slot_descriptors[0])
+
+        with self.assertRaises(ValueError):
+            recktype('R', ['a'], intern=['b'])
+        with self.assertRaises(ValueError):
+            recktype('R', [('a', None, {'bogus': True})])
+        with self.assertRaises(ValueError):
+            recktype('R', [('a', None, 'intern')])
+
+    def test_recktype_with_converters(self):
+        R = recktype('R', ['host', ('port', 0, int),
+                           ('tag', None, {'converter': str, 'intern': True})],
+                     converters={'host': str.lower})
+        self.assertEqual(set(R._converters), set(['host', 'port', 'tag']))
+        rec = R('LocalHost', '8080', 1)
+        self.assertEqual(tuple(rec), ('localhost', 8080, '1'))
+
+        # All forms of assignment are converted
+        rec.port = '1'
+        self.assertEqual(rec.port, 1)
+        rec[1] = '2'
+        self.assertEqual(rec.port, 2)
+        rec[1:] = ['3', 4]
+        self.assertEqual(tuple(rec), ('localhost', 3, '4'))
+        rec._update(host='EXAMPLE.com')
+        self.assertEqual(rec.host, 'example.com')
+        with self.assertRaises(ValueError):
+            rec.port = 'x'
+
+        # Converters can be bypassed for trusted values
+        rec = R._make(['Raw', '80', 5], convert=False)
+        self.assertEqual(tuple(rec), ('Raw', '80', 5))
+        self.assertEqual(tuple(R._make(['Raw', '80', 5])), ('raw', 80, '5'))
+        self.assertEqual(tuple(pickle.loads(pickle.dumps(rec))),
+                         ('Raw', '80', 5))
+
+        # Defaults are not converted, so omitted converted fields keep them
+        Payment = recktype('Payment', ['id', ('amount', None, int)])
+        self.assertIsNone(Payment('x').amount)
+        self.assertEqual(Payment('x', '5').amount, 5)
+        self.assertEqual(tuple(R('h')), ('h', 0, None))
+        LazyPayment = Payment._lazytype(split=',')
+        self.assertIsNone(LazyPayment('x').amount)
+        self.assertEqual(LazyPayment('x,5').amount, 5)
+
+        with self.assertRaises(ValueError):
+            recktype('R', ['a'], converters={'b': int})
+        with self.assertRaises(ValueError):
+            recktype('R', ['a'], converters={'a': 1})
+        with self.assertRaises(ValueError):
+            recktype('R', [('a', None, {'converter': 1})])
+
     def test_bad_typename(self):
         with self.assertRaises(ValueError):
             # Typename is a keyword
@@ -582,6 +672,63 @@ class TestReck(unittest.TestCase):
         self.assertEqual(rec.b, 1001)
         self.assertEqual(rec.c, 101)  # Should remain unchanged
 
+    def test_index_access(self):
+        R = recktype('R', ['a', 'b', 'c', 'd'], converters={'b': int},
+                     intern=['c'])
+        rec = R(1, '2', 'x', 4)
+        # Negative indices and slices with negative bounds
+        self.assertEqual(rec[-1], 4)
+        self.assertEqual(rec[-3], 2)
+        self.assertEqual(rec[-3:-1], [2, 'x'])
+        self.assertEqual(rec[::-1], [4, 'x', 2, 1])
+        self.assertEqual(rec[4:], [])
+        # Equivalent slices share one cached getter
+        for stop in range(4, 100):
+            self.assertEqual(rec[:stop], [1, 2, 'x', 4])
+        self.assertEqual(rec[None:None], [1, 2, 'x', 4])
+        self.assertEqual(len([key for key in R._slice_getters
+                              if key[:2] == (0, 4)]), 1)
+        with self.assertRaises(IndexError):
+            rec[-5]
+        # Index assignment applies field converters
+        rec[1] = '5'
+        self.assertEqual(rec.b, 5)
+        rec[-3:-1] = ['6', 'y']
+        self.assertEqual(rec[1:3], [6, 'y'])
+        # Lazy records decode fields read by index
+        LazyR = R._lazytype(converters={'a': int}, split=',')
+        lazy = LazyR('7,8,z,9')
+        self.assertEqual(lazy[0], 7)
+        self.assertEqual(lazy[-2:], ['z', '9'])
+
+    def test_view(self):
+        R = recktype('R', ['id', 'f0', 'f1', 'f2', ('f3', None, float)])
+        rec = R('r1', 1, 2, 3, 4)
+        view = rec._view(slice(1, None))
+        self.assertEqual(len(view), 4)
+        self.assertEqual(list(view), [1, 2, 3, 4.0])
+        self.assertEqual(view.fieldnames, ('f0', 'f1', 'f2', 'f3'))
+        self.assertEqual(view[-1], 4.0)
+        self.assertEqual(repr(view), 'RView(f0=1, f1=2, f2=3, f3=4.0)')
+        # Views are live in both directions
+        rec.f0 = 10
+        self.assertEqual(view[0], 10)
+        view[-1] = '5'
+        self.assertEqual(rec.f3, 5.0)
+        view[:2] = [20, 21]
+        self.assertEqual(rec[:3], ['r1', 20, 21])
+        # Slicing a view returns a view of the same record
+        inner = view[1:3]
+        self.assertEqual(inner.fieldnames, ('f1', 'f2'))
+        rec.f2 = 30
+        self.assertEqual(list(inner), [21, 30])
+        self.assertEqual(view.index(30), 2)
+        self.assertIn(21, view)
+        with self.assertRaises(IndexError):
+            view[4]
+        with self.assertRaises(TypeError):
+            rec._view(1)
+
     def test_update(self):
         rec = Rec(1, 2)
 
@@ -655,6 +802,210 @@ class TestReck(unittest.TestCase):
         od = OrderedDict(zip(fieldnames, values))
         self.assertEqual(rec._asdict(), od)
 
+    def test_make(self):
+        rec = Rec._make([1, 2])
+        self.assertEqual(rec, Rec(1, 2))
+        rec = Rec._make(iter((3, 4)))
+        self.assertEqual(rec, Rec(3, 4))
+
+        # Defaults are not applied so every field needs a value
+        R = recktype('R', ['a', ('b', 2)])
+        with self.assertRaises(TypeError):
+            R._make([1])
+        with self.assertRaises(TypeError):
+            R._make([1, 2, 3])
+
+    def test_copy(self):
+        R = recktype('R', ['a', ('b', 0, int), ('c', None, {'intern': True})])
+        rec = R([1], '2', 'x')
+        for clone in (rec._copy(), copy.copy(rec)):
+            self.assertEqual(clone, rec)
+            self.assertIsNot(clone, rec)
+            self.assertIs(clone.a, rec.a)
+        clones = R._copy_many([rec, R(3, 4, 'y')])
+        self.assertEqual([tuple(r) for r in clones],
+                         [([1], 2, 'x'), (3, 4, 'y')])
+        self.assertIs(clones[0].a, rec.a)
+        self.assertEqual(R._copy_many([]), [])
+
+        # Only the replaced values are converted
+        clone = rec._replace(b='5')
+        self.assertEqual(tuple(clone), ([1], 5, 'x'))
+        self.assertEqual(rec.b, 2)
+        with self.assertRaises(TypeError):
+            rec._replace(d=1)
+
+        deep = copy.deepcopy(rec)
+        self.assertEqual(deep, rec)
+        self.assertIsNot(deep.a, rec.a)
+        # Values that refer back to the record are copied once
+        rec.a = [rec]
+        deep = copy.deepcopy(rec)
+        self.assertIs(deep.a[0], deep)
+
+    def test_fixed_layout(self):
+        R = recktype('R', ['name', ('amount', None, int), ('code', '')])
+        R._fixed_layout([('amount', 10, 16, '>'), ('name', 0, 8),
+                         ('code', 17, 19, '^')])
+        self.assertEqual(tuple(R._parse_fixed('Alice     000042 XY')),
+                         ('Alice', 42, 'XY'))
+        self.assertEqual(tuple(R._parse_fixed('Bob           7')),
+                         ('Bob', 7, ''))
+        rec = R('Carol', 1250, 'Z')
+        self.assertEqual(rec._format_fixed(), 'Carol       1250 Z ')
+        with self.assertRaises(ValueError):
+            R('Carol', 1234567)._format_fixed()
+
+        import io
+        out = io.StringIO()
+        R._write_fixed(out, [rec, R('Dan', 3, 'AB')])
+        out = io.StringIO(out.getvalue() + '\n')
+        self.assertEqual([tuple(r) for r in R._read_fixed(out)],
+                         [('Carol', 1250, 'Z'), ('Dan', 3, 'AB')])
+
+        S = recktype('S', 'a')
+        with self.assertRaises(ValueError):
+            S._parse_fixed('x')
+        S._fixed_layout([('a', 2, 4)])
+        self.assertEqual(S._parse_fixed('xxab').a, 'ab')
+        for layout in ([], [('a', 0)], [('b', 0, 1)], [('a', 1, 1)],
+                       [('a', 0, 1, '='), ('a', 0, 1)]):
+            with self.assertRaises(ValueError):
+                S._fixed_layout(layout)
+        with self.assertRaises(ValueError):
+            R._fixed_layout([('name', 0, 8), ('amount', 7, 9),
+                             ('code', 9, 10)])
+
+    def test_lazytype(self):
+        calls = []
+
+        def to_int(value):
+            calls.append(value)
+            return int(value)
+
+        R = recktype('R', ['a', 'b', ('c', DefaultFactory(list))])
+        LazyR = R._lazytype(converters={'a': to_int, 'b': float}, split=',')
+        self.assertTrue(issubclass(LazyR, R))
+        rec = LazyR('1,2.5')
+        self.assertEqual(calls, [])
+        self.assertEqual(rec.a, 1)
+        self.assertEqual(rec.a, 1)
+        self.assertEqual(calls, ['1'])  # decoded once then cached
+        self.assertEqual(rec[1], 2.5)
+        self.assertEqual(rec.c, [])  # default for a missing raw value
+        self.assertEqual(tuple(rec), (1, 2.5, []))
+
+        # Assigning before first access replaces the raw value
+        rec = LazyR('1,2')
+        rec.a = 5
+        self.assertEqual(rec._asdict(), OrderedDict([('a', 5), ('b', 2.0),
+                                                     ('c', [])]))
+
+        # Raw rows that are already sequences, with sequence converters
+        LazyR = R._lazytype(converters=[None, int, None])
+        rec = LazyR(['x', '3', 'y'])
+        self.assertEqual(tuple(rec), ('x', 3, 'y'))
+
+        # Lazy records compare equal to base records in both directions
+        rec = LazyR(['x', '3', 'y'])
+        self.assertTrue(rec == R('x', 3, 'y'))
+        self.assertTrue(R('x', 3, 'y') == rec)
+        self.assertFalse(R('x', 3, 'y') != rec)
+        self.assertTrue(rec != R('x', 4, 'y'))
+        self.assertNotEqual(rec, recktype('R', 'a b c')('x', 3, 'y'))
+        self.assertNotEqual(rec, ('x', 3, 'y'))
+
+        # Callable split on bytes
+        LazyR = R._lazytype(converters=[int, int, None],
+                            split=lambda raw: raw.split(b'|'))
+        rec = LazyR(b'4|5')
+        self.assertEqual(rec.b, 5)
+
+        # Base type converters apply to the decoded value on first read
+        H = recktype('H', 'host port', converters={'port': int})
+        rec = H._lazytype(split=',')('a,81')
+        self.assertEqual(rec.port, 81)
+        self.assertEqual(rec.port, 81)
+
+        with self.assertRaises(AttributeError):
+            rec.nope
+        with self.assertRaises(ValueError):
+            recktype('R', 'a b')._lazytype()([1]).b
+        with self.assertRaises(TypeError):
+            R._lazytype(converters={'nope': int})
+        with self.assertRaises(TypeError):
+            R._lazytype(converters=[int])
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy_round_trip(self):
+        R = recktype('R', ['i', 'x', 'name'])
+        recs = [R(i, i / 2, 'n{0}'.format(i)) for i in range(10)]
+        arr = R._to_numpy(iter(recs), dtypes={'i': 'i4'})
+        self.assertEqual(arr.dtype.names, ('i', 'x', 'name'))
+        self.assertEqual(arr.dtype['i'], numpy.dtype('i4'))
+        self.assertEqual(arr['x'].sum(), sum(rec.x for rec in recs))
+        self.assertEqual(R._from_numpy(arr), recs)
+        self.assertIsInstance(R._from_numpy(arr)[0].i, int)
+
+        with self.assertRaises(TypeError):
+            R._to_numpy(recs, dtypes={'nope': 'i4'})
+        with self.assertRaises(ValueError):
+            recktype('S', 'i j')._from_numpy(arr)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy_views(self):
+        R = recktype('R', ['i', 'x'])
+        arr = R._to_numpy([R(i, float(i)) for i in range(3)])
+        views = R._from_numpy(arr, view=True)
+        self.assertEqual(len(views), 3)
+        self.assertEqual(views[1].x, 1.0)
+        self.assertEqual(list(views[2]), [2, 2.0])
+        views[0].x = 9.5
+        views[1][0] = 7
+        views[2][:] = [5, 6.5]
+        self.assertEqual(arr['x'].tolist(), [9.5, 1.0, 6.5])
+        self.assertEqual(arr['i'].tolist(), [0, 7, 5])
+        self.assertEqual(str(views[0]), 'RView(i=0, x=9.5)')
+        self.assertIs(type(views[0]), type(R._from_numpy(arr, view=True)[0]))
+
+    def test_project(self):
+        R = recktype('R', ['id', 'ts', ('host', 'localhost'),
+                           ('region', 'eu', {'intern': True})])
+        P, convert = R._project('region', 'id', 'host')
+        self.assertEqual(P.__name__, 'RProjection')
+        self.assertEqual(P._fieldnames, ('region', 'id', 'host'))
+        self.assertEqual(P._get_defaults(),
+                         {'host': 'localhost', 'region': 'eu'})
+        self.assertEqual(P._intern_fields, frozenset(['region']))
+        self.assertEqual(convert(R(1, 2, 'web1')), P('eu', 1, 'web1'))
+
+        # Options of fields without a default are kept
+        H = recktype('H', ['host', 'port'], converters={'port': int},
+                     intern=['host'])
+        HP = H._project('port', 'host')[0]
+        self.assertEqual(HP._converters, {'port': int})
+        self.assertEqual(HP._intern_fields, frozenset(['host']))
+        self.assertEqual(HP('81', 'a').port, 81)
+
+        # Cached
+        self.assertIs(R._project('region', 'id', 'host')[0], P)
+        self.assertIsNot(R._project('id', 'host')[0], P)
+        self.assertIsNot(R._project('region', 'id', 'host',
+                                    typename='Key')[0], P)
+        self.assertEqual(R._project('id', typename='Key')[0].__name__, 'Key')
+
+        recs = [R(i, i * 10) for i in range(5)]
+        projected = R._project_many(iter(recs), 'ts')
+        self.assertEqual([tuple(p) for p in projected],
+                         [(i * 10,) for i in range(5)])
+
+        with self.assertRaises(ValueError):
+            R._project()
+        with self.assertRaises(ValueError):
+            R._project('nope')
+        with self.assertRaises(TypeError):
+            R._project('id', bogus=1)
+
     def test_asitems(self):
         rec = Rec(1, 2)
         items = rec._asitems()
@@ -669,6 +1020,78 @@ class TestReck(unittest.TestCase):
             self.assertEqual(rec, pickled_rec)
             self.assertEqual(rec._fieldnames, pickled_rec._fieldnames)
 
+    def test_pickle_dynamic_type(self):
+        # A record type created inside a function can't be pickled by
+        # reference so it is pickled by schema ID
+        R = recktype('R', ['a', ('b', 2), '_c'], rename=True)
+        rec = R(1, _2=3)
+        for protocol in 0, 1, 2, 3:
+            unpickled = pickle.loads(pickle.dumps(rec, protocol))
+            self.assertIs(type(unpickled), R)
+            self.assertEqual(unpickled, rec)
+
+        # Simulate unpickling in a process in which the type doesn't exist
+        data = pickle.dumps([rec, R(4, 5, 6)])
+        del reck.reck._registry[R._schema_id]
+        del reck.reck._tokens[R._token]
+        unpickled = pickle.loads(data)
+        R2 = type(unpickled[0])
+        self.assertIsNot(R2, R)
+        self.assertIs(type(unpickled[1]), R2)
+        self.assertEqual(R2._fieldnames, R._fieldnames)
+        self.assertEqual(R2._get_defaults(), {'b': 2})
+        self.assertEqual(tuple(unpickled[1]), (4, 5, 6))
+        self.assertIs(get_rectype(R._schema_id), R2)
+
+    def test_pickle_same_schema_types(self):
+        # Records keep their type in the process that pickled them even if
+        # a later type has the same schema
+        def make():
+            return recktype('R', 'a b')
+        R1 = make()
+        R2 = make()
+        self.assertEqual(R1._schema_id, R2._schema_id)
+        for R in R1, R2:
+            rec = R(1, 2)
+            unpickled = pickle.loads(pickle.dumps(rec))
+            self.assertIs(type(unpickled), R)
+            self.assertEqual(unpickled, rec)
+
+        # Unknown tokens fall back to the schema ID, and later references
+        # to the same foreign type resolve to the same type
+        data = pickle.dumps(R1(1, 2))
+        del reck.reck._tokens[R1._token]
+        self.assertIs(type(pickle.loads(data)), R2)
+        del reck.reck._registry[R2._schema_id]
+        R3 = recktype('R', 'a b')
+        self.assertIs(type(pickle.loads(data)), R2)
+
+    def test_schema_id(self):
+        R1 = recktype('R', ['a', ('b', 2)])
+        R2 = recktype('R', ['a', ('b', 2)])
+        self.assertEqual(R1._schema_id, R2._schema_id)
+        self.assertIs(get_rectype(R2._schema_id), R2)
+        self.assertNotEqual(
+            recktype('R', ['a', ('b', 3)])._schema_id, R1._schema_id)
+        self.assertNotEqual(recktype('R', 'a c')._schema_id, R1._schema_id)
+        self.assertNotEqual(
+            recktype('S', ['a', ('b', 2)])._schema_id, R1._schema_id)
+        with self.assertRaises(KeyError):
+            get_rectype('no such schema')
+
+        # Replacing the defaults changes the schema ID
+        R3 = recktype('R', ['a', ('b', 2)])
+        R3._replace_defaults(b=5)
+        self.assertNotEqual(R3._schema_id, R1._schema_id)
+        self.assertIs(get_rectype(R3._schema_id), R3)
+        # Pickles of the type resolve to a type with the new defaults
+        data = pickle.dumps(R3(1))
+        del reck.reck._registry[R3._schema_id]
+        del reck.reck._tokens[R3._token]
+        R4 = type(pickle.loads(data))
+        self.assertEqual(R4._get_defaults(), {'b': 5})
+        self.assertEqual(R4._schema_id, R3._schema_id)
+
     def test_equality(self):
         rec1 = Rec(1, 2)
         rec2 = Rec(1, 2)
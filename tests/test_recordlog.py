@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from reck import recktype, RecordLog
+
+Event = recktype('Event', ['ts', 'kind', ('value', None)])
+
+
+class TestRecordLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'events.log')
+        self.events = [Event(i, 'tick', {'n': i}) for i in range(500)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_append_and_read(self):
+        with RecordLog(self.path, Event) as log:
+            self.assertEqual(len(log), 0)
+            self.assertEqual(log.append(self.events[0]), 0)
+            log.extend(self.events[1:])
+            self.assertEqual(len(log), 500)
+            self.assertEqual(log[0], self.events[0])
+            self.assertEqual(log[321], self.events[321])
+            self.assertEqual(log[-1], self.events[-1])
+            self.assertEqual(log[10:15], self.events[10:15])
+            self.assertEqual(log[::100], self.events[::100])
+            # Appending after reading remaps the log
+            log.append(Event(500, 'tock'))
+            self.assertEqual(log[500], Event(500, 'tock'))
+            with self.assertRaises(IndexError):
+                log[501]
+
+    def test_reopen(self):
+        with RecordLog(self.path, Event) as log:
+            log.extend(self.events)
+        with RecordLog(self.path, Event) as log:
+            self.assertEqual(len(log), 500)
+            log.append(Event(500, 'tock'))
+        with RecordLog(self.path, readonly=True) as log:
+            # Record type is created from the log header
+            self.assertEqual(log.rectype._fieldnames, Event._fieldnames)
+            self.assertEqual([tuple(e) for e in list(log)[:500]],
+                             [tuple(e) for e in self.events])
+            self.assertEqual(tuple(log[500]), (500, 'tock', None))
+            with self.assertRaises(IOError):
+                log.append(self.events[0])
+
+    def test_rebuild_index(self):
+        with RecordLog(self.path, Event) as log:
+            log.extend(self.events)
+
+        # Lose the end of the index and half of the last record
+        with open(self.path + '.idx', 'r+b') as index_file:
+            index_file.truncate(8 * 100 + 3)
+        with open(self.path, 'r+b') as log_file:
+            log_file.truncate(os.path.getsize(self.path) - 5)
+
+        with RecordLog(self.path, Event) as log:
+            self.assertEqual(len(log), 499)
+            self.assertEqual(log[:], self.events[:499])
+        os.remove(self.path + '.idx')
+        with RecordLog(self.path, Event) as log:
+            self.assertEqual(len(log), 499)
+            self.assertEqual(log[498], self.events[498])
+
+    def test_bad_schema(self):
+        with RecordLog(self.path, Event) as log:
+            log.append(self.events[0])
+        with self.assertRaises(ValueError):
+            RecordLog(self.path, recktype('Other', 'a b'))
+        # The file was closed, so the log can be reopened
+        with RecordLog(self.path, Event) as log:
+            self.assertEqual(len(log), 1)
+        with open(self.path, 'wb') as f:
+            f.write(b'not a log')
+        with self.assertRaises(ValueError):
+            RecordLog(self.path, Event)
+        with self.assertRaises(TypeError):
+            RecordLog(os.path.join(self.tempdir, 'new.log'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import sqlite3
+import unittest
+
+from reck import recktype, DefaultFactory
+import reck.sqlite
+
+Device = recktype('Device', ['id', 'name', ('online', False)])
+
+
+class TestSqlite(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute('CREATE TABLE device (id, name, online)')
+        self.devices = [Device(i, 'dev{0}'.format(i), i % 2 == 0)
+                        for i in range(100)]
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_insert_many(self):
+        count = reck.sqlite.insert_many(self.conn, 'device', self.devices)
+        self.assertEqual(count, 100)
+        rows = self.conn.execute('SELECT * FROM device ORDER BY id').fetchall()
+        self.assertEqual(rows, [tuple(d) for d in self.devices])
+
+        # In batches, from a generator
+        count = reck.sqlite.insert_many(
+            self.conn, 'device', (d for d in self.devices), batch=7)
+        self.assertEqual(count, 100)
+        n, = self.conn.execute('SELECT count(*) FROM device').fetchone()
+        self.assertEqual(n, 200)
+
+        self.assertEqual(reck.sqlite.insert_many(self.conn, 'device', []), 0)
+        with self.assertRaises(ValueError):
+            reck.sqlite.insert_many(self.conn, 'device', self.devices, batch=0)
+
+    def test_row_factory(self):
+        reck.sqlite.insert_many(self.conn, 'device', self.devices)
+        self.conn.row_factory = reck.sqlite.row_factory(Device)
+
+        # Columns in field order
+        rows = self.conn.execute('SELECT * FROM device ORDER BY id').fetchall()
+        self.assertEqual(rows, self.devices)
+
+        # Reordered columns
+        rows = self.conn.execute(
+            'SELECT online, name, id FROM device ORDER BY id').fetchall()
+        self.assertEqual(rows, self.devices)
+
+        # Missing column filled with its default value
+        rows = self.conn.execute(
+            'SELECT name, id FROM device ORDER BY id').fetchall()
+        self.assertEqual(
+            rows, [Device(d.id, d.name) for d in self.devices])
+
+    def test_row_factory_with_default_factory(self):
+        Rec = recktype('Rec', ['id', ('tags', DefaultFactory(list))])
+        cursor = self.conn.cursor()
+        cursor.row_factory = reck.sqlite.row_factory(Rec)
+        rows = cursor.execute('SELECT 1 AS id UNION SELECT 2').fetchall()
+        self.assertEqual(rows, [Rec(1), Rec(2)])
+        self.assertIsNot(rows[0].tags, rows[1].tags)
+
+    def test_row_factory_with_bad_columns(self):
+        self.conn.row_factory = reck.sqlite.row_factory(Device)
+        with self.assertRaises(TypeError):
+            self.conn.execute('SELECT 1 AS id, 2 AS colour').fetchone()
+        with self.assertRaises(ValueError):
+            self.conn.execute("SELECT 'x' AS name").fetchone()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from reck import recktype, RecordStore
+
+Device = recktype('Device', ['id', ('online', False), ('seen', 0)])
+
+
+class TestRecordStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'devices')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_mapping(self):
+        with RecordStore(self.path, Device, cache_size=3) as store:
+            for i in range(10):
+                store['dev{0}'.format(i)] = Device('dev{0}'.format(i), i % 2)
+            self.assertEqual(len(store), 10)
+            self.assertEqual(sorted(store),
+                             sorted('dev{0}'.format(i) for i in range(10)))
+            self.assertEqual(store['dev3'], Device('dev3', 1))
+            self.assertIn('dev9', store)
+            self.assertNotIn('dev10', store)
+            self.assertNotIn(1, store)
+            self.assertIsNone(store.get('dev10'))
+            del store['dev3']
+            self.assertNotIn('dev3', store)
+            with self.assertRaises(KeyError):
+                del store['dev3']
+            with self.assertRaises(KeyError):
+                store['dev3']
+            with self.assertRaises(TypeError):
+                store[1] = Device(1)
+            with self.assertRaises(TypeError):
+                store['x'] = ('x', True, 0)
+
+        with RecordStore(self.path, Device) as store:
+            self.assertEqual(len(store), 9)
+            self.assertEqual(store['dev4'], Device('dev4', 0))
+
+    def test_write_back_cache(self):
+        store = RecordStore(self.path, Device, cache_size=2)
+        store['a'] = Device('a')
+        store['b'] = Device('b')
+        # Cached records are not written until evicted or flushed
+        self.assertEqual(len(store._dirty), 2)
+        store['a'] = Device('a', True)    # 'a' becomes most recently used
+        store['c'] = Device('c')          # evicts 'b'
+        self.assertEqual(list(store._cache), ['a', 'c'])
+        self.assertEqual(store._dirty, set(['a', 'c']))
+        store.close()
+        with RecordStore(self.path, Device, flag='r') as store:
+            self.assertEqual([store[k].online for k in 'abc'],
+                             [True, False, False])
+            with self.assertRaises(IOError):
+                store['d'] = Device('d')
+
+    def test_writeback(self):
+        with RecordStore(self.path, Device) as store:
+            store['a'] = Device('a')
+        with RecordStore(self.path, Device) as store:
+            store['a'].online = True
+        with RecordStore(self.path, Device, writeback=True) as store:
+            self.assertFalse(store['a'].online)
+            store['a'].seen = 5
+        with RecordStore(self.path, Device) as store:
+            self.assertEqual(store['a'], Device('a', False, 5))
+
+    def test_schema(self):
+        RecordStore(self.path, Device).close()
+        Other = recktype('Other', 'id state')
+        with self.assertRaises(ValueError):
+            RecordStore(self.path, Other)
+        # The database was closed, so it can be opened again for writing
+        with RecordStore(self.path, Device, flag='w') as store:
+            store['dev1'] = Device('dev1')
+        with RecordStore(self.path, Other, flag='n') as store:
+            self.assertEqual(len(store), 0)
+        with self.assertRaises(ValueError):
+            RecordStore(self.path, Device, cache_size=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import threading
+import unittest
+
+from reck import recktype, RecordTable
+from reck.table import TableSnapshot
+
+Account = recktype('Account', ['id', ('balance', 0)])
+
+
+class TestRecordTable(unittest.TestCase):
+    def setUp(self):
+        self.table = RecordTable(
+            Account, (Account(i, i * 10) for i in range(10)), chunk_size=4)
+
+    def test_read(self):
+        table = self.table
+        self.assertEqual(len(table), 10)
+        self.assertEqual(table[3], Account(3, 30))
+        self.assertEqual(table[-1], Account(9, 90))
+        self.assertEqual(table[2:9:3], [Account(2, 20), Account(5, 50),
+                                        Account(8, 80)])
+        self.assertEqual([rec.id for rec in table], list(range(10)))
+        self.assertRaises(IndexError, table.__getitem__, 10)
+        self.assertRaises(TypeError, table.__getitem__, '1')
+
+    def test_write(self):
+        table = self.table
+        rec = table[1]
+        rec.balance = 99
+        # Records read from the table are independent of it
+        self.assertEqual(table[1].balance, 10)
+        table[1] = rec
+        self.assertEqual(table[1].balance, 99)
+        table.update(-1, balance=0)
+        self.assertEqual(table[9], Account(9, 0))
+        self.assertRaises(TypeError, table.update, 0, bogus=1)
+        table.append(Account(10))
+        self.assertEqual(table[10], Account(10, 0))
+        self.assertRaises(ValueError, RecordTable, Account, chunk_size=0)
+
+    def test_snapshot(self):
+        table = self.table
+        snapshot = table.snapshot()
+        self.assertIsInstance(snapshot, TableSnapshot)
+        chunks = table._chunks
+        table.update(0, balance=-1)
+        table.append(Account(10))
+        table[9] = Account(9, -9)
+        self.assertEqual(len(snapshot), 10)
+        self.assertEqual(list(snapshot),
+                         [Account(i, i * 10) for i in range(10)])
+        self.assertEqual(table[0].balance, -1)
+        self.assertEqual(table[9].balance, -9)
+        self.assertEqual(len(table), 11)
+        # Only the two changed chunks were copied
+        self.assertIsNot(table._chunks[0], chunks[0])
+        self.assertIs(table._chunks[1], chunks[1])
+        self.assertIsNot(table._chunks[2], chunks[2])
+        # A chunk is copied once per snapshot
+        copied = table._chunks[0]
+        table.update(1, balance=-1)
+        self.assertIs(table._chunks[0], copied)
+        snapshot2 = table.snapshot()
+        table.update(1, balance=-2)
+        self.assertEqual(snapshot2[1].balance, -1)
+        self.assertEqual(snapshot[1].balance, 10)
+
+    def test_iterate_temporary_snapshot(self):
+        table = RecordTable(Account, (Account(i, 0) for i in range(8)),
+                            chunk_size=2)
+        balances = []
+        for rec in table.snapshot():
+            balances.append(rec.balance)
+            for i in range(len(table)):
+                table.update(i, balance=1)
+        self.assertEqual(balances, [0] * 8)
+
+    def test_no_copy_without_live_snapshot(self):
+        table = self.table
+        table.snapshot()
+        chunks = table._chunks
+        chunk = chunks[0]
+        table.update(0, balance=-1)
+        self.assertIs(table._chunks, chunks)
+        self.assertIs(table._chunks[0], chunk)
+
+    def test_concurrent_readers(self):
+        table = RecordTable(Account, (Account(i, 0) for i in range(100)),
+                            chunk_size=8)
+        errors = []
+
+        def read():
+            for _ in range(20):
+                snapshot = table.snapshot()
+                balances = [rec.balance for rec in snapshot]
+                # Each write round sets every balance, so a consistent
+                # snapshot holds at most two distinct values
+                if sorted(balances, reverse=True) != balances:
+                    errors.append(balances)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for n in range(1, 50):
+            for i in range(100):
+                table.update(i, balance=n)
+        for reader in readers:
+            reader.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
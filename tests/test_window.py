@@ -0,0 +1,81 @@
+import random
+import unittest
+
+from reck import recktype, window
+
+Reading = recktype('Reading', 'sensor ts value')
+
+
+class TestWindow(unittest.TestCase):
+
+    def test_tumbling(self):
+        readings = [Reading('s{0}'.format(ts % 2), ts, ts)
+                    for ts in range(0, 30, 2)]
+        summaries = list(window(readings, size=10, aggs=[
+            ('n', 'count'), ('total', ('sum', 'value')),
+            ('lo', ('min', 'value')), ('hi', ('max', 'value')),
+            ('avg', ('mean', 'value')), ('first', ('first', 'value')),
+            ('last', ('last', 'value'))]))
+        self.assertEqual(type(summaries[0])._fieldnames,
+                         ('start', 'end', 'n', 'total', 'lo', 'hi', 'avg',
+                          'first', 'last'))
+        self.assertEqual([tuple(s) for s in summaries], [
+            (0, 10, 5, 20, 0, 8, 4.0, 0, 8),
+            (10, 20, 5, 70, 10, 18, 14.0, 10, 18),
+            (20, 30, 5, 120, 20, 28, 24.0, 20, 28)])
+
+    def test_sliding_matches_brute_force(self):
+        rng = random.Random(3)
+        readings = [Reading(rng.choice('ab'), ts, rng.choice([None, ts % 9]))
+                    for ts in range(200)]
+        summaries = list(window(
+            readings, size=30, slide=10, by='sensor',
+            aggs={'values': ('count', 'value'), 'total': ('sum', 'value')}))
+        expected = []
+        for start in range(-20, 200, 10):
+            for sensor in 'ab':
+                values = [r.value for r in readings
+                          if r.sensor == sensor and
+                          start <= r.ts < start + 30]
+                if values:
+                    present = [v for v in values if v is not None]
+                    expected.append((start, start + 30, sensor, len(present),
+                                     sum(present)))
+        self.assertEqual(sorted(tuple(s) for s in summaries), sorted(expected))
+        starts = [s.start for s in summaries]
+        self.assertEqual(starts, sorted(starts))
+
+    def test_watermark(self):
+        times = [0, 5, 12, 3, 8, 25, 11, 9, 31, 2]
+        late = []
+        summaries = list(window(
+            (Reading('s', ts, 1) for ts in times), size=10,
+            allowed_lateness=5, late=late.append))
+        # 3 and 8 arrive before the watermark passes 10; 25 moves the
+        # watermark to 20, so 11, 9 and 2 are late
+        self.assertEqual([tuple(s) for s in summaries],
+                         [(0, 10, 4), (10, 20, 1), (20, 30, 1), (30, 40, 1)])
+        self.assertEqual([r.ts for r in late], [11, 9, 2])
+
+    def test_emits_windows_while_streaming(self):
+        def readings():
+            for ts in range(100):
+                yield Reading('s', ts, ts)
+                consumed.append(ts)
+        consumed = []
+        summaries = window(readings(), size=10)
+        first = next(summaries)
+        self.assertEqual(tuple(first), (0, 10, 10))
+        self.assertLess(len(consumed), 15)
+
+    def test_bad_args(self):
+        for kwargs in ({'size': 0}, {'slide': 0}, {'slide': 61},
+                       {'allowed_lateness': -1}, {'aggs': [('n', 'bogus')]},
+                       {'aggs': [('n', ('median', 'value'))]},
+                       {'aggs': [('start', 'count')]}):
+            with self.assertRaises(ValueError):
+                window([], **kwargs)
+
+
+if __name__ == '__main__':
+    unittest.main()